@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""Measure the per-operation overhead of `just.heap.Heap` relative to calling `heapq` directly.
+
+usage::
+
+    python benchmarks/bench_heap.py [--size N] [--repeat R]
+"""
+
+
+# standard imports
+import argparse
+import heapq
+import timeit
+
+# local imports
+from just.heap import Heap
+
+
+def main() -> None:
+    """Time `push` then `pop` of `--size` items, raw and through `Heap`, and show the cost per operation."""
+
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--size", type=int, default=100_000, help="number of items pushed then popped")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="number of runs, the best one is shown")
+    args = arg_parser.parse_args()
+
+    items = [(i * 7919) % args.size for i in range(args.size)]  # a fixed permutation
+
+    def raw_heapq() -> None:
+        heap: list = []
+        for item in items:
+            heapq.heappush(heap, item)
+        for _ in items:
+            heapq.heappop(heap)
+
+    def raw_heapq_key() -> None:
+        heap: list = []
+        for item in items:
+            heapq.heappush(heap, (-item, item))
+        for _ in items:
+            heapq.heappop(heap)[1]
+
+    def heap_class() -> None:
+        heap = Heap()
+        for item in items:
+            heap.push(item)
+        for _ in items:
+            heap.pop()
+
+    def heap_class_key() -> None:
+        heap = Heap(key=lambda item: -item)
+        for item in items:
+            heap.push(item)
+        for _ in items:
+            heap.pop()
+
+    cases = {
+        "heapq": raw_heapq,
+        "Heap()": heap_class,
+        "heapq (key tuples)": raw_heapq_key,
+        "Heap(key=...)": heap_class_key,
+    }
+    # each case is compared with the raw heapq code doing the same work
+    baselines = {
+        "heapq": "heapq",
+        "Heap()": "heapq",
+        "heapq (key tuples)": "heapq (key tuples)",
+        "Heap(key=...)": "heapq (key tuples)",
+    }
+
+    per_op = {}
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        per_op[name] = best / (2 * args.size) * 1e9  # one push and one pop per item
+
+    print(f"{'case':<20}{'ns/op':>10}{'overhead':>12}")
+    for name, nanoseconds in per_op.items():
+        overhead = nanoseconds - per_op[baselines[name]]
+        print(f"{name:<20}{nanoseconds:>10.1f}{overhead:>+10.1f}ns")
+
+
+if __name__ == "__main__":
+    main()
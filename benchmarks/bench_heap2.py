@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+"""Compare the heap engines of `just.heap2` on push-heavy, pop-heavy and decrease-key-heavy traces.
+
+Every trace is monotone (nothing pushed is smaller than the last item popped),
+so that `RadixHeap` can run it too. Decrease-key is done the usual way with
+`heapq`-style heaps: push the item again with its smaller priority, and skip
+the stale entry when it is popped.
+
+usage::
+
+    python benchmarks/bench_heap2.py [--size N] [--repeat R]
+"""
+
+
+# standard imports
+import argparse
+import heapq
+import random
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+# local imports
+from just.heap2 import DaryHeap, Heap, PairingHeap, RadixHeap
+
+
+# an operation of a trace: ("push", item), ("pop", 0), or ("settle", 0) to pop past the stale entries
+Trace = List[Tuple[str, int]]
+
+# the low bits of a decrease-key entry hold its node, the high bits its distance
+NODE_BITS = 32
+NODE_MASK = (1 << NODE_BITS) - 1
+
+
+ENGINES: Dict[str, Callable] = {
+    "Heap (heapq)": Heap,
+    "DaryHeap(d=4)": DaryHeap,
+    "DaryHeap(d=8)": lambda data: DaryHeap(data, d=8),
+    "PairingHeap": PairingHeap,
+    "RadixHeap": RadixHeap,
+}
+
+
+def push_heavy(size: int, rng: random.Random) -> Trace:
+    """Mostly pushes of items a little ahead of the last item popped, one pop in four."""
+    trace: Trace = []
+    pending: List[int] = []  # the items pushed so far and not yet popped, to keep the trace monotone
+    last = 0
+    for i in range(size):
+        item = last + rng.randrange(1000)
+        heapq.heappush(pending, item)
+        trace.append(("push", item))
+        if i % 4 == 3:
+            last = heapq.heappop(pending)
+            trace.append(("pop", 0))
+    return trace
+
+
+def pop_heavy(size: int, rng: random.Random) -> Trace:
+    """Fill the heap, then drain it completely."""
+    trace: Trace = [("push", rng.randrange(1 << 32)) for _ in range(size)]
+    trace.extend(("pop", 0) for _ in range(size))
+    return trace
+
+
+def decrease_key_heavy(size: int, rng: random.Random) -> Trace:
+    """Dijkstra on a random graph: a shorter distance found to a node is pushed again (lazy decrease-key).
+
+    Each entry encodes a distance and its node as `distance << NODE_BITS | node`, so they are plain integers
+    that `RadixHeap` can take. The graph has `size // 4` nodes of out-degree 4, with positive weights, so the
+    trace is monotone. A ("settle", 0) pops entries until one of a node not yet settled, skipping stale ones.
+    """
+    nodes = max(size // 4, 1)
+    edges = [[(rng.randrange(nodes), rng.randrange(1, 1000)) for _ in range(4)] for _ in range(nodes)]
+    best = [-1] * nodes
+    best[0] = 0
+    settled = set()
+    trace: Trace = [("push", 0)]
+    pending = [0]
+    while pending:
+        entry = heapq.heappop(pending)
+        node = entry & NODE_MASK
+        if node in settled:
+            continue
+        settled.add(node)
+        trace.append(("settle", 0))
+        distance = entry >> NODE_BITS
+        for neighbour, weight in edges[node]:
+            if neighbour in settled:
+                continue
+            if best[neighbour] < 0 or distance + weight < best[neighbour]:
+                best[neighbour] = distance + weight
+                entry = (distance + weight) << NODE_BITS | neighbour
+                heapq.heappush(pending, entry)
+                trace.append(("push", entry))
+    return trace
+
+
+def replay(make_heap: Callable, trace: Trace) -> None:
+    """Apply every operation of `trace` to an empty heap from `make_heap`."""
+    heap = make_heap([])
+    push = heap.push
+    pop = heap.pop
+    settled = set()
+    for op, item in trace:
+        if op == "push":
+            push(item)
+        elif op == "settle":
+            node = pop() & NODE_MASK
+            while node in settled:
+                node = pop() & NODE_MASK
+            settled.add(node)
+        elif heap:
+            pop()
+
+
+def main() -> None:
+    """Run every trace on every engine, and show the best time of `--repeat` runs."""
+
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--size", type=int, default=100_000, help="number of operations in each trace")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="number of runs, the best one is shown")
+    args = arg_parser.parse_args()
+
+    rng = random.Random(0)
+    traces = {
+        "push-heavy": push_heavy(args.size, rng),
+        "pop-heavy": pop_heavy(args.size // 2, rng),
+        "decrease-key": decrease_key_heavy(args.size, rng),
+    }
+
+    print(f"{'engine':<16}" + "".join(f"{name:>16}" for name in traces))
+    for engine_name, make_heap in ENGINES.items():
+        row = f"{engine_name:<16}"
+        for trace in traces.values():
+            best = min(timeit.repeat(lambda: replay(make_heap, trace), number=1, repeat=args.repeat))
+            row += f"{best * 1000:>14.1f}ms"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
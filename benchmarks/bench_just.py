@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+"""Run a benchmark of every module of `just` with `just.timing.bench`, and compare with a previous run.
+
+Each benchmark measures a small batch of operations, e.g. 1000 pushes then pops, so that
+the results are in microseconds to milliseconds per call.
+
+usage::
+
+    python benchmarks/bench_just.py [--repeat R] [--filter TEXT] [--save FILE] [--compare FILE]
+
+With `--compare`, the exit status is 1 if any benchmark is significantly slower than in FILE.
+"""
+
+
+# standard imports
+import argparse
+import enum
+import functools
+import logging
+import os
+import sys
+import tempfile
+import warnings
+from typing import Callable, Dict, List
+
+# local imports
+from just.args import DateTimeArg, EnumArg
+from just.atomic import atomic_open
+from just.cache import memoize
+from just.deprecate import deprecated
+from just.first import first, last, only
+from just.heap import Heap as SimpleHeap
+from just.heap2 import DaryHeap, Heap, PairingHeap, RadixHeap, TopK, merge
+from just.human import format_bytes, format_duration, parse_bytes, parse_duration
+from just.lock import lock_file, read_lock
+from just.metrics import Exporter, MetricsSink
+from just.open import ezopen
+from just.pqueue import PriorityQueue
+from just.retry import RetryIterator, retry
+from just.timing import TimingStats, bench, compare_bench, read_bench_results, timed, timing, write_bench_results
+
+
+SIZE = 1000  # the number of items in each batch
+ITEMS = [(i * 7919) % SIZE for i in range(SIZE)]  # a fixed permutation
+DATA = os.urandom(1 << 14) * 16  # 256 KiB, compressible only by repetition
+
+
+def push_pop(make_heap: Callable) -> Callable[[], None]:
+    """Push every item into an empty heap, then pop them all."""
+
+    def run() -> None:
+        heap = make_heap([])
+        for item in ITEMS:
+            heap.push(item)
+        while heap:
+            heap.pop()
+
+    return run
+
+
+def ezopen_round_trip(directory: str, suffix: str) -> Callable[[], None]:
+    """Write then read back 256 KiB, compressed according to the suffix."""
+    file_path = os.path.join(directory, "data" + suffix)
+
+    def run() -> None:
+        with ezopen(file_path, "wb") as file:
+            file.write(DATA)
+        with ezopen(file_path, "rb") as file:
+            file.read()
+
+    return run
+
+
+class Color(enum.Enum):
+    RED = 1
+    GREEN = 2
+
+
+class NullExporter(Exporter):
+    def export(self, records) -> None:
+        pass
+
+
+def cases(directory: str) -> Dict[str, Callable[[], None]]:
+    """Return the benchmarks by name, writing their files in `directory`."""
+
+    squared = memoize(lambda x: x * x)
+    squared(1)
+    date_time_arg = DateTimeArg("%Y-%m-%d %H:%M:%S")
+    enum_arg = EnumArg(Color)
+
+    @deprecated
+    def old() -> None:
+        pass
+
+    @retry(ValueError, tries=3)
+    def succeed() -> None:
+        pass
+
+    def retry_iterator() -> None:
+        for attempt in (retry_iterator := RetryIterator(3)):
+            with attempt:
+                retry_iterator.succeed()
+
+    lock_path = os.path.join(directory, "bench.lock")
+    atomic_path = os.path.join(directory, "atomic.txt")
+
+    def atomic_write() -> None:
+        with atomic_open(atomic_path, "w") as file:
+            file.write("data")
+
+    def lock() -> None:
+        with lock_file(lock_path):
+            pass
+
+    rw_lock_path = os.path.join(directory, "bench.rwlock")
+
+    def shared_lock() -> None:
+        with read_lock(rw_lock_path):
+            pass
+
+    stats = TimingStats()
+
+    def untimed() -> None:
+        pass
+
+    timed_stats = timed(stats=stats)(untimed)
+
+    def timing_stats() -> None:
+        with timing("bench", stats=stats):
+            pass
+
+    sink = MetricsSink([NullExporter()], flush_interval=0.1)
+
+    def priority_queue() -> None:
+        q = PriorityQueue(key=int)
+        q.put_many(ITEMS)
+        q.get_many(SIZE)
+
+    runs = [ITEMS[i::4] for i in range(4)]
+    for run in runs:
+        run.sort()
+
+    return {
+        "args.DateTimeArg": lambda: date_time_arg("2020-02-29 12:34:56"),
+        "args.EnumArg": lambda: enum_arg("GREEN"),
+        "atomic.atomic_open": atomic_write,
+        "cache.memoize hit": lambda: squared(1),
+        "cache.memoize miss": lambda: [memoize(lambda x: x)(x) for x in ITEMS],
+        "deprecate.deprecated call": old,
+        "first.first": lambda: first(ITEMS, lambda x: x == ITEMS[-1]),
+        "first.last": lambda: last(ITEMS, lambda x: x == ITEMS[0]),
+        "first.only": lambda: only(ITEMS, lambda x: x == ITEMS[0]),
+        "heap.Heap push/pop": push_pop(SimpleHeap),
+        "heap.Heap(key) push/pop": push_pop(functools.partial(SimpleHeap, key=lambda x: -x)),
+        "heap2.Heap push/pop": push_pop(Heap),
+        "heap2.DaryHeap push/pop": push_pop(DaryHeap),
+        "heap2.PairingHeap push/pop": push_pop(PairingHeap),
+        "heap2.RadixHeap push/pop": push_pop(RadixHeap),
+        "heap2.TopK extend": lambda: TopK(10).extend(ITEMS),
+        "heap2.merge": lambda: list(merge(runs)),
+        "human.format_bytes": lambda: format_bytes(123_456_789),
+        "human.parse_bytes": lambda: parse_bytes("123M"),
+        "human.format_duration": lambda: format_duration(123_456),
+        "human.parse_duration": lambda: parse_duration("1d 2h 3m 4s"),
+        "lock.lock_file": lock,
+        "lock.read_lock": shared_lock,
+        "metrics.MetricsSink.add": lambda: sink.add("bench", 0.001),
+        "open.ezopen plain": ezopen_round_trip(directory, ".bin"),
+        "open.ezopen gzip": ezopen_round_trip(directory, ".gz"),
+        "open.ezopen bz2": ezopen_round_trip(directory, ".bz2"),
+        "pqueue.PriorityQueue put/get": priority_queue,
+        "retry.retry success": succeed,
+        "retry.RetryIterator success": retry_iterator,
+        "timing.timed(stats)": timed_stats,
+        "timing.timed(stats) baseline": untimed,  # the same call without `timed`: the difference is its overhead
+        "timing.timing(stats)": timing_stats,
+        "timing.TimingStats.add": lambda: stats.add(0.001),
+    }
+
+
+def main() -> None:
+    """Run the benchmarks, show them, save them, and compare them with a previous run."""
+
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--repeat", type=int, default=20, help="number of timed loops of each benchmark")
+    arg_parser.add_argument("--filter", default="", help="only run the benchmarks whose name contains this text")
+    arg_parser.add_argument("--save", metavar="FILE", help="save the results as JSON")
+    arg_parser.add_argument("--compare", metavar="FILE", help="compare with the results saved in FILE")
+    args = arg_parser.parse_args()
+
+    # some benchmarks warn or log on every call; `deprecated` forces its warnings to be shown, so drop them instead
+    warnings.showwarning = lambda *args, **kwargs: None
+    logging.disable(logging.CRITICAL)
+
+    results: List = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, case in cases(directory).items():
+            if args.filter in name:
+                results.append(bench(case, name=name, repeat=args.repeat))
+                print(results[-1], flush=True)
+
+    if args.save:
+        write_bench_results(args.save, results)
+    if args.compare:
+        comparisons = compare_bench(read_bench_results(args.compare), {result.name: result for result in results})
+        print()
+        for comparison in comparisons:
+            print(comparison)
+        if any(comparison.regression for comparison in comparisons):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,89 @@
-"""FIXME"""
+"""Write a file atomically: readers see either the old contents or the new ones, never a partial write.
+
+The new contents are written to a temporary file in the same directory, given the permissions
+of the file it replaces (or the default ones of a new file), flushed to disk with `os.fsync`, then
+moved into place with `os.replace`, which is atomic when both paths are on the same filesystem.
+The directory is flushed too, so that the rename itself survives a crash. If the body of the `with` raises, the temporary file is deleted instead and the
+original file is left untouched.
+"""
 
 import os
+import stat
+import tempfile
 from contextlib import contextmanager
 from pathlib import Path
-from tempfile import TemporaryFile
+from typing import IO, Any, Iterator, Union
+
+
+def _file_mode(file_path: Path) -> int:
+    """Return the permission bits of `file_path`, or those `open()` would give a new file there."""
+    try:
+        return stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)  # the only way to read it is to set it
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _fsync_directory(dir_path: Path) -> None:
+    """Flush the entries of `dir_path` to disk, where directories can be opened (not on Windows)."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
 @contextmanager
-def atomic_open(file_path: Path | str, mode: str):
-    if isinstance(file_path, str):
-        file_path = Path(file_path)
+def atomic_open(file_path: Union[os.PathLike, str], mode: str = "w") -> Iterator[IO[Any]]:
+    """Open a file for writing, replacing it atomically when the context exits without error.
 
-    temp_dir_path = file_path.parent
-    with TemporaryFile(dir=temp_dir_path, mode=mode) as temp_file:
-        yield from temp_file
+    Only write modes are accepted: the temporary file starts empty, so appending or reading
+    would not see the current contents. The file keeps its permissions, not the 0600 of a temporary file.
 
-    os.replace(temp_file.name, file_path)
+    ex::
+
+        with atomic_open("settings.json", "w") as settings_file:
+            json.dump(settings, settings_file)
+
+    :param file_path: the path of the file to write.
+    :param mode: the mode-string for opening the file, "w" or "wb".
+    :raise ValueError: when `mode` is not a write mode.
+    :return: a context-manager that gives the opened temporary file.
+    """
+    if not mode.startswith("w") or "+" in mode:
+        raise ValueError(f"mode must be a write mode like 'w' or 'wb', got {mode!r}")
+
+    file_path = Path(file_path)
+    # same directory as the target, so that os.replace() does not cross filesystems
+    temp_file = tempfile.NamedTemporaryFile(
+        mode=mode, dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp", delete=False
+    )
+    try:
+        with temp_file:
+            yield temp_file
+            temp_file.flush()
+            os.chmod(temp_file.name, _file_mode(file_path))
+            os.fsync(temp_file.fileno())
+        os.replace(temp_file.name, file_path)
+        _fsync_directory(file_path.parent)
+    except BaseException:
+        try:
+            os.unlink(temp_file.name)
+        except FileNotFoundError:
+            pass
+        raise
 
 
 def main():
     """Simple test"""
 
     test_file_path = Path(os.getcwd()) / "test_file.txt"
-    with atomic_open(test_file_path, "wt"):
-        atomic_open.write("test!")
+    with atomic_open(test_file_path, "wt") as test_file:
+        test_file.write("test!")
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -12,14 +12,26 @@ import heapq
 # FIXME update the docs
 # FIXME type annotations?
 class Heap:
-    """Priority Heap class using the standard ``heapq`` module."""
+    """Priority Heap class using the standard ``heapq`` module.
 
-    def __init__(self, data=None, key=None):
+    Constructing a ``Heap`` itself actually returns an instance of one of two subclasses, chosen once
+    by whether ``key`` is given: the one without a key calls ``heapq`` directly, the one with a key
+    wraps and unwraps ``(key(item), item)`` tuples. Neither has to test ``key`` on every operation.
+    Subclasses of ``Heap`` are constructed as they are, and use the methods below, which test ``key``.
+    """
+
+    def __new__(cls, data=None, key=None, copy=False):
+        """Pick the specialized subclass for the given ``key``, when constructing a ``Heap`` itself."""
+        if cls is Heap:
+            cls = _UnkeyedHeap if key is None else _KeyedHeap
+        return super().__new__(cls)
+
+    def __init__(self, data=None, key=None, copy=False):
         """Create a new Heap.
-        If ``data`` is given, use it as the item storage for this Heap.
+        If ``data`` is given, use it as the item storage for this Heap, unless ``copy`` is true.
         If ``key`` is given, use it to compute priority for each item.
         """
-        self.heap = data or []
+        self.heap = list(data) if copy and data else data or []
         heapq.heapify(self.heap)
         self.key = key
 
@@ -91,6 +103,48 @@ class Heap:
         return item
 
 
+class _UnkeyedHeap(Heap):
+    """``Heap`` without a key: the items are their own priority."""
+
+    def peek(self):
+        return self.heap[0]
+
+    def push(self, item):
+        heapq.heappush(self.heap, item)
+
+    def pop(self):
+        return heapq.heappop(self.heap)
+
+    def pushpop(self, item):
+        # mostly taken from https://docs.python.org/3/library/heapq.html
+        return heapq.heappushpop(self.heap, item)
+
+    def replace(self, item):
+        # mostly taken from https://docs.python.org/3/library/heapq.html
+        return heapq.heapreplace(self.heap, item)
+
+
+class _KeyedHeap(Heap):
+    """``Heap`` with a key: stores ``(key(item), item)`` tuples."""
+
+    def peek(self):
+        return self.heap[0][1]
+
+    def push(self, item):
+        heapq.heappush(self.heap, (self.key(item), item))
+
+    def pop(self):
+        return heapq.heappop(self.heap)[1]
+
+    def pushpop(self, item):
+        # mostly taken from https://docs.python.org/3/library/heapq.html
+        return heapq.heappushpop(self.heap, (self.key(item), item))[1]
+
+    def replace(self, item):
+        # mostly taken from https://docs.python.org/3/library/heapq.html
+        return heapq.heapreplace(self.heap, (self.key(item), item))[1]
+
+
 def main() -> None:
     """Simple test."""
 
@@ -3,8 +3,41 @@ see: https://docs.python.org/3/library/heapq.html
 Now with type annotations.
 """
 
+import array
+import collections
+import contextlib
 import heapq
-from typing import Any, Callable, Generic, Iterable, Protocol, TypeVar
+import itertools
+import os
+import pickle
+import queue
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Generator,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from just.atomic import _fsync_directory, atomic_open
+from just.open import ezopen
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # type: ignore[assignment]
 
 
 class SupportsLessThan(Protocol):
@@ -18,6 +51,21 @@ T = TypeVar("T", bound=SupportsLessThan)
 K = TypeVar("K", bound=SupportsLessThan)
 
 
+def _write_snapshot(file_path: Union[os.PathLike, str], kind: str, data: Any) -> None:
+    """Pickle `data` to `file_path` atomically, tagged with the `kind` of heap it comes from."""
+    with atomic_open(file_path, "wb") as file:
+        pickle.dump((kind, data), file, protocol=5)
+
+
+def _read_snapshot(file_path: Union[os.PathLike, str], kind: str) -> Any:
+    """Unpickle the data written by `_write_snapshot()`, checking it comes from the same `kind` of heap."""
+    with open(file_path, "rb") as file:
+        snapshot_kind, data = pickle.load(file)
+    if snapshot_kind != kind:
+        raise ValueError(f"{os.fspath(file_path)!r} is a snapshot of {snapshot_kind}, not {kind}")
+    return data
+
+
 # FIXME support maxheap? (version of python: 3.14...)
 # FIXME docstrings!!!
 # FIXME link to youtube video?
@@ -57,6 +105,23 @@ class Heap(Generic[T]):
         """Pop and return the smallest item, then push `item`."""
         return heapq.heapreplace(self._heap, item)
 
+    def snapshot(self, file_path: Union[os.PathLike, str]) -> None:
+        """Save the items to `file_path`, in heap order, replacing the file atomically.
+
+        The items must be picklable. Reload them with `Heap.load()`.
+        """
+        _write_snapshot(file_path, "Heap", self._heap)
+
+    @classmethod
+    def load(cls, file_path: Union[os.PathLike, str]) -> "Heap[T]":
+        """Return a heap of the items saved by `snapshot()`, without heapifying them again.
+
+        Only load snapshots from a trusted source: they are unpickled.
+        """
+        heap = cls.__new__(cls)
+        heap._heap = _read_snapshot(file_path, "Heap")
+        return heap
+
 
 # FIXME __repr__ to show key?
 class KeyHeap(Generic[K, T]):
@@ -73,7 +138,7 @@ class KeyHeap(Generic[K, T]):
     def __init__(self, data: Iterable[T], key: Callable[[T], K]):
         """Build a heap from `data`, prioritised by `key`."""
         self._key = key
-        self._heap: list[tuple[K, T]] = [(key(item), item) for item in data]
+        self._heap: List[Tuple[K, T]] = [(key(item), item) for item in data]
         heapq.heapify(self._heap)
 
     def __len__(self) -> int:
@@ -104,6 +169,1082 @@ class KeyHeap(Generic[K, T]):
         """Pop and return the item with the smallest key, then push `item`."""
         return heapq.heapreplace(self._heap, (self._key(item), item))[1]
 
+    def snapshot(self, file_path: Union[os.PathLike, str]) -> None:
+        """Save the items and their keys to `file_path`, in heap order, replacing the file atomically.
+
+        The items and keys must be picklable, the key-function is not saved.
+        Reload them with `KeyHeap.load()`, which skips computing the keys again.
+
+        ex::
+
+            heap.snapshot("scheduler.heap")
+            ...  # restart
+            heap = KeyHeap.load("scheduler.heap", key=deadline)
+        """
+        _write_snapshot(file_path, "KeyHeap", self._heap)
+
+    @classmethod
+    def load(cls, file_path: Union[os.PathLike, str], key: Callable[[T], K]) -> "KeyHeap[K, T]":
+        """Return a heap of the items saved by `snapshot()`, without heapifying them again.
+
+        `key` must be the key-function of the saved heap: it is used for the items pushed afterwards.
+        Only load snapshots from a trusted source: they are unpickled.
+        """
+        heap = cls.__new__(cls)
+        heap._key = key
+        heap._heap = _read_snapshot(file_path, "KeyHeap")
+        return heap
+
+
+class DaryHeap(Generic[T]):
+    """A min-heap where every node has `d` children instead of 2, with the same API as `Heap`.
+
+    A wider node makes the tree shallower: `push` does fewer comparisons on the way up,
+    and the children compared on the way down sit next to each other in the list.
+    `d=4` is the usual sweet spot for push-heavy workloads. Being pure python,
+    it only beats the C implementation of `heapq` when comparisons are expensive.
+
+    ex::
+
+        >>> heap = DaryHeap([5, 1, 4, 2, 3], d=4)
+        >>> [heap.pop() for _ in range(len(heap))]
+        [1, 2, 3, 4, 5]
+
+    :param data: the initial items.
+    :param d: the number of children of each node, at least 2.
+    """
+
+    def __init__(self, data: Iterable[T], d: int = 4):
+        if d < 2:
+            raise ValueError(f"d must be at least 2, got {d}")
+        self._d = d
+        self._heap = list(data)
+        for pos in reversed(range((len(self._heap) + d - 2) // d)):
+            self._sift_down(pos)
+
+    def __len__(self) -> int:
+        """Number of items in the `DaryHeap`."""
+        return len(self._heap)
+
+    def __str__(self) -> str:
+        """Show the stored items."""
+        return f"DaryHeap({self._heap})"
+
+    def _sift_up(self, pos: int) -> None:
+        """Move the item at `pos` up until its parent is not larger."""
+        heap = self._heap
+        d = self._d
+        item = heap[pos]
+        while pos > 0:
+            parent_pos = (pos - 1) // d
+            parent = heap[parent_pos]
+            if not item < parent:
+                break
+            heap[pos] = parent
+            pos = parent_pos
+        heap[pos] = item
+
+    def _sift_down(self, pos: int) -> None:
+        """Move the item at `pos` down until none of its children is smaller."""
+        heap = self._heap
+        d = self._d
+        size = len(heap)
+        item = heap[pos]
+        while True:
+            first = d * pos + 1
+            if first >= size:
+                break
+            child_pos = first
+            child = heap[first]
+            for other_pos in range(first + 1, min(first + d, size)):
+                other = heap[other_pos]
+                if other < child:
+                    child_pos, child = other_pos, other
+            if not child < item:
+                break
+            heap[pos] = child
+            pos = child_pos
+        heap[pos] = item
+
+    def peek(self) -> T:
+        """Return the smallest item without removing it."""
+        return self._heap[0]
+
+    def pop(self) -> T:
+        """Remove and return the smallest item."""
+        last = self._heap.pop()  # raises IndexError when empty, like heapq.heappop
+        if not self._heap:
+            return last
+        top = self._heap[0]
+        self._heap[0] = last
+        self._sift_down(0)
+        return top
+
+    def push(self, item: T) -> None:
+        """Add `item` to the heap."""
+        self._heap.append(item)
+        self._sift_up(len(self._heap) - 1)
+
+    def pushpop(self, item: T) -> T:
+        """Push `item`, then pop and return the smallest item."""
+        if self._heap and self._heap[0] < item:
+            item, self._heap[0] = self._heap[0], item
+            self._sift_down(0)
+        return item
+
+    def replace(self, item: T) -> T:
+        """Pop and return the smallest item, then push `item`."""
+        top = self._heap[0]
+        self._heap[0] = item
+        self._sift_down(0)
+        return top
+
+
+class PairingHeap(Generic[T]):
+    """A pairing heap, with the same API as `Heap`.
+
+    A tree of nodes rather than a list: `push` is a single comparison that links the new node
+    under the root (or the root under it), and all the work is deferred to `pop`, which
+    re-links the orphaned children pairwise. That makes it cheapest when pushes dominate.
+
+    ex::
+
+        >>> heap = PairingHeap([5, 1, 4, 2, 3])
+        >>> [heap.pop() for _ in range(len(heap))]
+        [1, 2, 3, 4, 5]
+
+    :param data: the initial items.
+    """
+
+    # a node is a list `[item, children]`, lighter than an object with attributes
+
+    def __init__(self, data: Iterable[T] = ()):
+        self._root: Optional[list] = None
+        self._size = 0
+        for item in data:
+            self.push(item)
+
+    def __len__(self) -> int:
+        """Number of items in the `PairingHeap`."""
+        return self._size
+
+    def __str__(self) -> str:
+        """Show the stored items, in tree pre-order."""
+        items = []
+        nodes = [self._root] if self._root is not None else []
+        while nodes:
+            item, children = nodes.pop()
+            items.append(item)
+            nodes.extend(reversed(children))
+        return f"PairingHeap({items})"
+
+    @staticmethod
+    def _link(first: list, second: list) -> list:
+        """Make the root with the larger item a child of the other, and return the new root."""
+        if second[0] < first[0]:
+            second[1].append(first)
+            return second
+        first[1].append(second)
+        return first
+
+    def peek(self) -> T:
+        """Return the smallest item without removing it."""
+        if self._root is None:
+            raise IndexError("peek from an empty PairingHeap")
+        return self._root[0]
+
+    def pop(self) -> T:
+        """Remove and return the smallest item."""
+        if self._root is None:
+            raise IndexError("pop from an empty PairingHeap")
+        top, children = self._root
+        self._size -= 1
+
+        # two-pass merge: link the children in pairs left to right, then the pairs right to left
+        link = self._link
+        pairs = [link(children[i], children[i + 1]) for i in range(0, len(children) - 1, 2)]
+        if len(children) % 2:
+            pairs.append(children[-1])
+        root = None
+        if pairs:
+            root = pairs.pop()
+            while pairs:
+                root = link(pairs.pop(), root)
+        self._root = root
+        return top
+
+    def push(self, item: T) -> None:
+        """Add `item` to the heap."""
+        node = [item, []]
+        self._root = node if self._root is None else self._link(self._root, node)
+        self._size += 1
+
+    def pushpop(self, item: T) -> T:
+        """Push `item`, then pop and return the smallest item."""
+        if self._root is None or not self._root[0] < item:
+            return item
+        top = self.pop()
+        self.push(item)
+        return top
+
+    def replace(self, item: T) -> T:
+        """Pop and return the smallest item, then push `item`."""
+        top = self.pop()
+        self.push(item)
+        return top
+
+
+class RadixHeap:
+    """A radix heap of non-negative integers, with the same API as `Heap`.
+
+    Only works for *monotone* use: an item pushed must not be smaller than the last item popped,
+    which is the case for event timestamps, or distances in Dijkstra's algorithm.
+    In exchange, items are never compared with each other: each goes into a bucket chosen by
+    the highest bit where it differs from the last item popped, and a bucket is only
+    redistributed once, into lower buckets, when it holds the smallest items and the smallest one
+    is popped: `peek()` only looks for it, so it never rejects a valid push.
+
+    ex::
+
+        >>> heap = RadixHeap([5, 1, 4, 2, 3])
+        >>> [heap.pop() for _ in range(3)]
+        [1, 2, 3]
+        >>> heap.push(3)
+        >>> heap.push(2)
+        Traceback (most recent call last):
+        ...
+        ValueError: cannot push 2, smaller than the last item popped 3
+
+    :param data: the initial items.
+    """
+
+    def __init__(self, data: Iterable[int] = ()):
+        self._last = 0
+        self._size = 0
+        self._buckets: List[List[int]] = [[]]
+        for item in data:
+            self.push(item)
+
+    def __len__(self) -> int:
+        """Number of items in the `RadixHeap`."""
+        return self._size
+
+    def __str__(self) -> str:
+        """Show the stored items, bucket by bucket."""
+        return f"RadixHeap({[item for bucket in self._buckets for item in bucket]})"
+
+    def _smallest_bucket(self, action: str) -> int:
+        """Return the index of the first non-empty bucket, which holds the smallest items."""
+        if not self._size:
+            raise IndexError(f"{action} from an empty RadixHeap")
+        buckets = self._buckets
+        index = 0
+        while not buckets[index]:
+            index += 1
+        return index
+
+    def peek(self) -> int:
+        """Return the smallest item without removing it."""
+        buckets = self._buckets
+        if buckets[0]:
+            return buckets[0][-1]
+        # no redistribution: it would move the floor of the buckets above items that can still be pushed
+        return min(buckets[self._smallest_bucket("peek")])
+
+    def pop(self) -> int:
+        """Remove and return the smallest item."""
+        buckets = self._buckets
+        if not buckets[0]:
+            # every item in the first non-empty bucket is smaller than those in the buckets after it
+            index = self._smallest_bucket("pop")
+            bucket = buckets[index]
+            buckets[index] = []
+            self._last = last = min(bucket)
+            for item in bucket:
+                buckets[(item ^ last).bit_length()].append(item)
+        self._size -= 1
+        return buckets[0].pop()
+
+    def push(self, item: int) -> None:
+        """Add `item` to the heap.
+
+        :raise ValueError: when `item` is smaller than the last item popped.
+        """
+        if item < self._last:
+            raise ValueError(f"cannot push {item}, smaller than the last item popped {self._last}")
+        index = (item ^ self._last).bit_length()
+        buckets = self._buckets
+        while len(buckets) <= index:
+            buckets.append([])
+        buckets[index].append(item)
+        self._size += 1
+
+    def pushpop(self, item: int) -> int:
+        """Push `item`, then pop and return the smallest item."""
+        if item < self._last:
+            raise ValueError(f"cannot push {item}, smaller than the last item popped {self._last}")
+        if not self._size or item <= self.peek():
+            return item
+        self.push(item)
+        return self.pop()
+
+    def replace(self, item: int) -> int:
+        """Pop and return the smallest item, then push `item`."""
+        top = self.peek()
+        if item < top:
+            raise ValueError(f"cannot push {item}, smaller than the last item popped {top}")
+        self.pop()
+        self.push(item)
+        return top
+
+
+class ArrayHeap:
+    """A compact min-heap of numeric keys, each with an integer id, stored in two typed `array.array`.
+
+    A `Heap` of `(key, id)` tuples costs over 100 bytes per entry in boxed python objects;
+    here an entry is one C double and one C long long, 16 bytes, sifted in place over the raw buffers.
+    The id is meant to index the payload in some other storage. Keys are compared, ids never are.
+
+    With NumPy, building from many entries at once is one `argsort` of the raw keys, since a sorted
+    array is a valid heap; it costs a transient permutation of the entries. Without NumPy the two
+    arrays are heapified in place by a python loop, with no memory beyond them but over ten times
+    slower than `heapq.heapify()` of a list: the standard library has no bulk sort of an `array`
+    that would not box every entry first, which is no faster. NumPy arrays are accepted as they
+    are, through the buffer protocol.
+
+    ex::
+
+        >>> heap = ArrayHeap([3.0, 1.0, 2.0], ids=[30, 10, 20])
+        >>> heap.push(0.5, 5)
+        >>> heap.nbytes
+        64
+        >>> [heap.pop() for _ in range(len(heap))]
+        [(0.5, 5), (1.0, 10), (2.0, 20), (3.0, 30)]
+
+    :param keys: the initial keys.
+    :param ids: the id of each key, their positions in `keys` when `None`.
+    :param key_type: the `array` type-code of the keys, C double by default.
+    :param id_type: the `array` type-code of the ids, C long long by default.
+    """
+
+    def __init__(
+        self,
+        keys: Iterable[float] = (),
+        ids: Optional[Iterable[int]] = None,
+        key_type: str = "d",
+        id_type: str = "q",
+    ):
+        key_array = self._to_array(key_type, keys)
+        id_array = array.array(id_type, range(len(key_array))) if ids is None else self._to_array(id_type, ids)
+        if len(key_array) != len(id_array):
+            raise ValueError(f"got {len(key_array)} keys but {len(id_array)} ids")
+
+        if numpy is not None and len(key_array) > 1:
+            key_array, id_array = self._sort_by_key(key_array, id_array)
+        self._keys = key_array
+        self._ids = id_array
+        if numpy is None:
+            # bottom-up heapify, like `heapq.heapify()`, without boxing every entry into a tuple
+            for pos in reversed(range(len(key_array) // 2)):
+                self._sift_down(pos, key_array[pos], id_array[pos])
+
+    @staticmethod
+    def _sort_by_key(keys: array.array, ids: array.array) -> Tuple[array.array, array.array]:
+        """Return copies of `keys` and `ids`, both ordered by key, with one NumPy `argsort`."""
+        key_view = numpy.frombuffer(keys, dtype=keys.typecode)
+        id_view = numpy.frombuffer(ids, dtype=ids.typecode)
+        order = numpy.argsort(key_view)
+        return array.array(keys.typecode, key_view[order].tobytes()), array.array(
+            ids.typecode, id_view[order].tobytes()
+        )
+
+    @staticmethod
+    def _same_type(view_format: str, type_code: str) -> bool:
+        """Return whether a buffer of `view_format` holds the same C numbers as an `array` of `type_code`.
+
+        Different codes can name the same type, like 'l' and 'q' for NumPy int64 on 64-bit Linux.
+        """
+        view_format = view_format.lstrip("@")
+        if view_format == type_code:
+            return True
+        kinds = ("bhilq", "BHILQ", "fd")
+        return any(view_format in kind and type_code in kind for kind in kinds) and (
+            struct.calcsize(view_format) == array.array(type_code).itemsize
+        )
+
+    @classmethod
+    def _to_array(cls, type_code: str, values: Iterable) -> array.array:
+        """Copy `values` into a new `array`, straight from its buffer when it has a matching one."""
+        if isinstance(values, array.array) and values.typecode == type_code:
+            return array.array(type_code, values)
+        try:
+            view = memoryview(values)  # type: ignore[arg-type]
+        except TypeError:
+            return array.array(type_code, values)
+        if not cls._same_type(view.format, type_code) or not view.c_contiguous:
+            return array.array(type_code, view.tolist())
+        result = array.array(type_code)
+        result.frombytes(view.cast("B"))
+        return result
+
+    def __len__(self) -> int:
+        """Number of entries in the `ArrayHeap`."""
+        return len(self._keys)
+
+    def __str__(self) -> str:
+        """Show the stored `(key, id)` entries."""
+        return f"ArrayHeap({list(zip(self._keys, self._ids))})"
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the two buffers of entries, in bytes."""
+        return len(self._keys) * (self._keys.itemsize + self._ids.itemsize)
+
+    def _sift_up(self, pos: int, key: float, ident: int) -> None:
+        """Place the entry `(key, ident)` at `pos` or above, moving larger parents down."""
+        keys = self._keys
+        ids = self._ids
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            parent_key = keys[parent]
+            if not key < parent_key:
+                break
+            keys[pos] = parent_key
+            ids[pos] = ids[parent]
+            pos = parent
+        keys[pos] = key
+        ids[pos] = ident
+
+    def _sift_down(self, pos: int, key: float, ident: int) -> None:
+        """Place the entry `(key, ident)` at `pos` or below, moving smaller children up."""
+        keys = self._keys
+        ids = self._ids
+        size = len(keys)
+        while True:
+            child = 2 * pos + 1
+            if child >= size:
+                break
+            right = child + 1
+            if right < size and keys[right] < keys[child]:
+                child = right
+            child_key = keys[child]
+            if not child_key < key:
+                break
+            keys[pos] = child_key
+            ids[pos] = ids[child]
+            pos = child
+        keys[pos] = key
+        ids[pos] = ident
+
+    def peek(self) -> Tuple[float, int]:
+        """Return the `(key, id)` entry with the smallest key without removing it."""
+        return self._keys[0], self._ids[0]
+
+    def pop(self) -> Tuple[float, int]:
+        """Remove and return the `(key, id)` entry with the smallest key."""
+        last_key = self._keys.pop()  # raises IndexError when empty
+        last_id = self._ids.pop()
+        if not self._keys:
+            return last_key, last_id
+        top = self._keys[0], self._ids[0]
+        self._sift_down(0, last_key, last_id)
+        return top
+
+    def push(self, key: float, ident: int) -> None:
+        """Add the entry `(key, ident)` to the heap."""
+        self._keys.append(key)
+        self._ids.append(ident)
+        self._sift_up(len(self._keys) - 1, key, ident)
+
+    def pushpop(self, key: float, ident: int) -> Tuple[float, int]:
+        """Push `(key, ident)`, then pop and return the entry with the smallest key."""
+        if not self._keys or not self._keys[0] < key:
+            return key, ident
+        top = self._keys[0], self._ids[0]
+        self._sift_down(0, key, ident)
+        return top
+
+    def replace(self, key: float, ident: int) -> Tuple[float, int]:
+        """Pop and return the entry with the smallest key, then push `(key, ident)`."""
+        top = self._keys[0], self._ids[0]
+        self._sift_down(0, key, ident)
+        return top
+
+    def snapshot(self, file_path: Union[os.PathLike, str]) -> None:
+        """Save the entries to `file_path`, in heap order, replacing the file atomically.
+
+        A small pickled header is followed by the raw bytes of the two buffers,
+        so saving and loading with `ArrayHeap.load()` are both a single copy.
+        """
+        with atomic_open(file_path, "wb") as file:
+            header = ("ArrayHeap", self._keys.typecode, self._ids.typecode, len(self._keys))
+            pickle.dump(header, file, protocol=5)
+            self._keys.tofile(file)
+            self._ids.tofile(file)
+
+    @classmethod
+    def load(cls, file_path: Union[os.PathLike, str]) -> "ArrayHeap":
+        """Return a heap of the entries saved by `snapshot()`, read straight into its buffers."""
+        with open(file_path, "rb") as file:
+            kind, key_type, id_type, size = pickle.load(file)
+            if kind != "ArrayHeap":
+                raise ValueError(f"{os.fspath(file_path)!r} is a snapshot of {kind}, not ArrayHeap")
+            heap = cls(key_type=key_type, id_type=id_type)
+            heap._keys.fromfile(file, size)
+            heap._ids.fromfile(file, size)
+        return heap
+
+
+class TopK(Generic[K, T]):
+    """Keep the `k` items with the largest keys seen in a stream, like a running `heapq.nlargest`.
+
+    Internally a min-heap of at most `k` `(key, order, item)` entries, so its root is the
+    threshold an item must beat to get in. Most items in a long stream are rejected by a
+    single comparison against that threshold, without ever touching the heap.
+    The `order` tie-breaker keeps the earliest of items with equal keys, the way
+    `heapq.nlargest` does, and means items never need to be compared themselves.
+
+    ex::
+
+        >>> top = TopK(3)
+        >>> top.extend([5, 1, 9, 3, 7, 2])
+        >>> top.items()
+        [9, 7, 5]
+        >>> words = TopK(2, key=len)
+        >>> words.extend(["a", "ccc", "bb", "dddd"])
+        >>> words.items()
+        ['dddd', 'ccc']
+
+    :param k: the number of items to keep.
+    :param key: computes the priority of each item, the identity when `None`.
+    """
+
+    def __init__(self, k: int, key: Optional[Callable[[T], K]] = None):
+        if k < 0:
+            raise ValueError(f"k must not be negative, got {k}")
+        self._k = k
+        self._key = key
+        self._heap: List[Tuple[Any, int, T]] = []
+        self._order = itertools.count(0, -1)  # decreasing: earlier items win ties
+
+    def __len__(self) -> int:
+        """Number of items kept, at most `k`."""
+        return len(self._heap)
+
+    def __str__(self) -> str:
+        """Show the kept items, largest key first."""
+        return f"TopK({self.items()})"
+
+    @property
+    def k(self) -> int:
+        """The number of items to keep."""
+        return self._k
+
+    def threshold(self) -> Any:
+        """Return the key an item must exceed to be kept, once `k` items are kept.
+
+        :raise IndexError: when fewer than `k` items are kept, so every item gets in.
+        """
+        if len(self._heap) < self._k or not self._heap:
+            raise IndexError("fewer than k items kept, there is no threshold")
+        return self._heap[0][0]
+
+    def _offer(self, key: Any, item: T) -> bool:
+        """Keep `item` under an already-computed `key` if it beats the threshold."""
+        heap = self._heap
+        if len(heap) < self._k:
+            heapq.heappush(heap, (key, next(self._order), item))
+            return True
+        if heap and heap[0][0] < key:
+            heapq.heapreplace(heap, (key, next(self._order), item))
+            return True
+        return False
+
+    def push(self, item: T) -> bool:
+        """Offer `item`, and return whether it was kept."""
+        key = item if self._key is None else self._key(item)
+        return self._offer(key, item)
+
+    def extend(self, items: Iterable[T]) -> None:
+        """Offer every item of `items`, like repeated calls to `push()` without the method calls.
+
+        A NumPy array (anything with an `argpartition` method) is pre-selected with
+        `argpartition` when there is no key-function, so only its `k` largest values
+        reach the heap.
+        """
+        if self._key is None and hasattr(items, "argpartition"):
+            items = self._preselect(items)
+
+        # the loop is unrolled by hand: this is the hot path of a long stream
+        heap = self._heap
+        k = self._k
+        key_func = self._key
+        order = self._order
+        for item in items:
+            key = item if key_func is None else key_func(item)
+            if len(heap) < k:
+                heapq.heappush(heap, (key, next(order), item))
+            elif heap and heap[0][0] < key:
+                heapq.heapreplace(heap, (key, next(order), item))
+
+    def _preselect(self, array: Any) -> Any:
+        """Return the (at most) `k` largest values of a NumPy `array`, in their original order."""
+        if self._k == 0:
+            return []
+        if len(array) <= self._k:
+            return array.tolist()
+        # argpartition is not stable: it only gives the k-th largest value, the threshold; then every value
+        # above it is kept, and of the values equal to it only the earliest, the way ties are won in a stream
+        threshold = array[array.argpartition(-self._k)[-self._k]]
+        above = (array > threshold).nonzero()[0].tolist()
+        equal = (array == threshold).nonzero()[0][: self._k - len(above)].tolist()
+        return array[sorted(above + equal)].tolist()
+
+    def merge(self, *others: "TopK[K, T]") -> None:
+        """Fold the items kept by `others` into this one, e.g. partial results from parallel workers.
+
+        The others must use the same key-function: their keys are reused rather than recomputed.
+        """
+        for other in others:
+            for key, _, item in sorted(other._heap, reverse=True):
+                if not self._offer(key, item):
+                    break  # sorted by decreasing key: nothing after this one can get in either
+
+    def items(self) -> List[T]:
+        """Return the kept items, largest key first."""
+        return [item for _, _, item in sorted(self._heap, reverse=True)]
+
+    def clear(self) -> None:
+        """Forget every kept item."""
+        self._heap.clear()
+
+
+class _ReverseKey:
+    """Wraps a key so that it sorts in reverse order, letting a min-heap merge in descending order."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key: Any):
+        self.key = key
+
+    def __lt__(self, other: "_ReverseKey") -> bool:
+        return other.key < self.key
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _ReverseKey) and self.key == other.key
+
+
+def _blocks(items: Iterator[T], block_size: int) -> Iterator[List[T]]:
+    """Read `items` in lists of up to `block_size` items."""
+    while True:
+        block = list(itertools.islice(items, block_size))
+        if not block:
+            return
+        yield block
+
+
+def merge(
+    iterables: Iterable[Iterable[T]],
+    key: Optional[Callable[[T], Any]] = None,
+    reverse: bool = False,
+    block_size: int = 1024,
+) -> Iterator[T]:
+    """Merge sorted `iterables` into one sorted iterator, like `heapq.merge`.
+
+    Items with equal keys come out in the order of their iterables, so the merge is stable,
+    and the items themselves are never compared. Each source is read `block_size` items at a
+    time: the heap only ever holds one entry per source, and once a single source is left
+    its remaining items are passed through without touching the heap.
+
+    ex::
+
+        >>> list(merge([[1, 4, 7], [2, 5, 8], [3, 6, 9]]))
+        [1, 2, 3, 4, 5, 6, 7, 8, 9]
+        >>> list(merge([["ccc", "a"], ["bb"]], key=len, reverse=True))
+        ['ccc', 'bb', 'a']
+
+    :param iterables: the sources, each sorted by `key` (in descending order if `reverse`).
+    :param key: computes the sort-key of each item, the identity when `None`.
+    :param reverse: whether the sources are sorted in descending order.
+    :param block_size: the number of items read from a source at a time.
+    :return: an iterator over every item of every source, in sorted order.
+    """
+    if block_size < 1:
+        raise ValueError(f"block_size must be at least 1, got {block_size}")
+    sources = (itertools.chain.from_iterable(_blocks(iter(iterable), block_size)) for iterable in iterables)
+    return _merge_sources(sources, key, reverse)
+
+
+def _merge_sources(sources: Iterable[Iterator[T]], key: Optional[Callable[[T], Any]], reverse: bool) -> Iterator[T]:
+    """Merge already-opened sources, see `merge()`."""
+
+    def sort_key(item: T) -> Any:
+        item_key = item if key is None else key(item)
+        return _ReverseKey(item_key) if reverse else item_key
+
+    # entries are `[sort_key, source_index, item, next_item]`, updated in place as the source advances
+    heap: List[List[Any]] = []
+    for index, source in enumerate(sources):
+        next_item = source.__next__
+        try:
+            item = next_item()
+        except StopIteration:
+            continue
+        heap.append([sort_key(item), index, item, next_item])
+    heapq.heapify(heap)
+
+    while len(heap) > 1:
+        entry = heap[0]
+        yield entry[2]
+        try:
+            item = entry[3]()
+        except StopIteration:
+            heapq.heappop(heap)
+            continue
+        entry[0] = sort_key(item)
+        entry[2] = item
+        heapq.heapreplace(heap, entry)
+
+    # a single source left: no more comparisons needed
+    if heap:
+        _, _, item, next_item = heap[0]
+        yield item
+        yield from iter(next_item, _EXHAUSTED)
+
+
+# never returned by a source, so `iter(next_item, _EXHAUSTED)` runs until `StopIteration`
+_EXHAUSTED = object()
+
+
+def _prefetch(file: IO[Any], block_size: int, prefetch: int) -> Generator[Any, None, None]:
+    """Iterate over the lines of `file`, read in blocks by a background thread.
+
+    At most `prefetch` blocks wait in the queue: a reader that gets ahead of the merge
+    blocks on the full queue, which is the back-pressure that keeps memory bounded.
+    """
+    blocks: queue.Queue = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(block: Any) -> bool:
+        """Put a block, waking up regularly to give up once `stop` is set."""
+        while not stop.is_set():
+            try:
+                blocks.put(block, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read() -> None:
+        try:
+            for block in _blocks(iter(file), block_size):
+                if not put(block):
+                    return
+        except Exception as e:
+            put(e)  # re-raised by the merge, in the consuming thread
+        else:
+            put(None)
+
+    thread = threading.Thread(target=read, name=f"prefetch {getattr(file, 'name', file)}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            block = blocks.get()
+            if block is None:
+                return
+            if isinstance(block, Exception):
+                raise block
+            yield from block
+    finally:
+        stop.set()
+        thread.join()
+
+
+def merge_files(
+    file_paths: Iterable[Union[os.PathLike, str]],
+    key: Optional[Callable[[Any], Any]] = None,
+    reverse: bool = False,
+    block_size: int = 1024,
+    prefetch: int = 2,
+    mode: str = "rt",
+) -> Iterator[Any]:
+    """Merge the sorted lines of files into one sorted iterator, see `merge()`.
+
+    Files are opened with `just.open.ezopen`, so compressed shards are decompressed on the fly.
+    With `prefetch`, each file is read and decompressed by its own background thread, up to
+    `prefetch` blocks ahead of the merge, so the merge does not wait on the disk.
+    All the files are closed when the iterator is exhausted or closed.
+
+    ex::
+
+        merged = merge_files(["shard-0.txt.gz", "shard-1.txt.gz"], key=lambda line: line.split()[0])
+        with open("merged.txt", "w") as out_file:
+            out_file.writelines(merged)
+
+    :param file_paths: the paths of the files, each sorted by `key`.
+    :param key: computes the sort-key of each line, the line itself when `None`.
+    :param reverse: whether the files are sorted in descending order.
+    :param block_size: the number of lines read from a file at a time.
+    :param prefetch: the number of blocks read ahead from each file, or 0 to read without threads.
+    :param mode: the mode-string for opening the files.
+    :return: an iterator over every line of every file, in sorted order.
+    """
+    if block_size < 1:
+        raise ValueError(f"block_size must be at least 1, got {block_size}")
+    if prefetch < 0:
+        raise ValueError(f"prefetch must not be negative, got {prefetch}")
+    return _merge_files(list(file_paths), key, reverse, block_size, prefetch, mode)
+
+
+def _merge_files(
+    file_paths: list, key: Optional[Callable], reverse: bool, block_size: int, prefetch: int, mode: str
+) -> Iterator[Any]:
+    """Open the files and merge them, see `merge_files()`."""
+    with contextlib.ExitStack() as stack:
+        sources: List[Iterator[Any]] = []
+        for file_path in file_paths:
+            file = stack.enter_context(ezopen(file_path, mode))
+            if prefetch:
+                prefetched = _prefetch(file, block_size, prefetch)
+                stack.callback(prefetched.close)  # stops the thread, before its file is closed
+                sources.append(prefetched)
+            else:
+                sources.append(itertools.chain.from_iterable(_blocks(iter(file), block_size)))
+        yield from _merge_sources(sources, key, reverse)
+
+
+def _write_run(items: Iterable[T], dir_path: Optional[str], suffix: str, block_size: int) -> str:
+    """Write sorted `items` to a new temporary file, pickled in blocks, and return its path.
+
+    The blocks go to a hidden file first, which is flushed to disk then renamed, so the returned run
+    is complete and durable: it can safely replace the runs it was merged from.
+    """
+    fd, file_path = tempfile.mkstemp(prefix="spill-", suffix=".pickle" + suffix, dir=dir_path)
+    os.close(fd)  # only reserves the name
+    head, tail = os.path.split(file_path)
+    temp_path = os.path.join(head, "." + tail)  # same suffix, for the compression of ezopen
+    try:
+        with ezopen(temp_path, "wb") as file:
+            for block in _blocks(iter(items), block_size):
+                pickle.dump(block, file, protocol=pickle.HIGHEST_PROTOCOL)
+        fd = os.open(temp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(temp_path, file_path)
+        _fsync_directory(Path(head))
+    except BaseException:
+        for path in (temp_path, file_path):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+        raise
+    return file_path
+
+
+def _read_items(file_path: str) -> Generator[Any, None, None]:
+    """Iterate over the items of a file written by `_write_run()`."""
+    with ezopen(file_path, "rb") as file:
+        while True:
+            try:
+                block = pickle.load(file)
+            except EOFError:
+                return
+            yield from block
+
+
+def _read_run(file_path: str) -> Iterator[Any]:
+    """Iterate over the items of a file written by `_write_run()`, and delete it once done or closed."""
+    try:
+        yield from _read_items(file_path)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(file_path)
+
+
+class SpillHeap(Generic[T]):
+    """A min-heap for more items than fit in memory, with the same API as `Heap`.
+
+    Items go into an in-memory `Heap` of at most `max_items`. When it fills up, it is sorted and
+    written out to a temporary file as a *run*, compressed according to `suffix` by
+    `just.open.ezopen`. Runs are read back lazily, one block at a time, by merging their heads with
+    the in-memory heap on `pop()`. When there are more than `max_runs` runs, the smallest ones are
+    merged, tier by tier, so the number of open files stays bounded too. Memory use is therefore about `max_items`
+    items, plus a block of `block_size` items per run.
+
+    Items must be picklable. Use it as a context-manager, or call `close()`, to delete the runs.
+
+    ex::
+
+        >>> with SpillHeap([5, 3, 8, 1], max_items=2) as heap:
+        ...     heap.push(4)
+        ...     print(heap.runs, [heap.pop() for _ in range(len(heap))])
+        2 [1, 3, 4, 5, 8]
+
+    :param data: the initial items.
+    :param max_items: the most items kept in memory before spilling them to a run.
+    :param max_runs: the most runs before they are merged into one.
+    :param block_size: the number of items pickled, and read back, at a time.
+    :param suffix: the extension of the run files, which selects their compression, "" for none.
+    :param dir_path: the directory of the run files, the default temporary directory when `None`.
+    """
+
+    def __init__(
+        self,
+        data: Iterable[T] = (),
+        max_items: int = 1_000_000,
+        max_runs: int = 64,
+        block_size: int = 4096,
+        suffix: str = ".gz",
+        dir_path: Optional[str] = None,
+    ):
+        if max_items < 1:
+            raise ValueError(f"max_items must be at least 1, got {max_items}")
+        if max_runs < 2:
+            raise ValueError(f"max_runs must be at least 2, got {max_runs}")
+        self._max_items = max_items
+        self._max_runs = max_runs
+        self._block_size = block_size
+        self._suffix = suffix
+        self._dir_path = dir_path
+        self._memory: Heap[T] = Heap([])
+        self._size = 0
+        # the head of each run, as `[item, run_number, next_item, reader, level, file_path, position]` entries,
+        # `position` being the index of `item` in its file
+        self._runs: List[List[Any]] = []
+        self._run_numbers = itertools.count()
+        for item in data:
+            self.push(item)
+
+    def __enter__(self) -> "SpillHeap[T]":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """Number of items in the `SpillHeap`, in memory and on disk."""
+        return self._size
+
+    def __str__(self) -> str:
+        """Show the number of items, and where they are."""
+        return f"SpillHeap({self._size} items, {len(self._memory)} in memory, {len(self._runs)} runs)"
+
+    @property
+    def runs(self) -> int:
+        """Number of runs on disk."""
+        return len(self._runs)
+
+    def _new_run(self, items: Iterable[T], level: int) -> Optional[List[Any]]:
+        """Write sorted `items` as a run of `level`, and return the entry of its head, `None` when empty."""
+        file_path = _write_run(items, self._dir_path, self._suffix, self._block_size)
+        reader = _read_run(file_path)
+        try:
+            item = next(reader)
+        except StopIteration:
+            return None  # no items, and the reader has deleted the file
+        return [item, next(self._run_numbers), reader.__next__, reader, level, file_path, 0]
+
+    def spill(self) -> None:
+        """Write the items in memory out to a new run, then merge the runs if there are too many."""
+        if not len(self._memory):
+            return
+        items = self._memory._heap
+        items.sort()
+        entry = self._new_run(items, 0)
+        items.clear()
+        if entry is not None:
+            heapq.heappush(self._runs, entry)
+        if len(self._runs) > self._max_runs:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Merge the runs of the lowest level that has several, and those below it, into a run of the next level.
+
+        Runs of a level are about `max_runs` times bigger than those of the level below, so each item
+        is written once per level, rather than once per compaction as when merging every run.
+
+        The runs are merged from new readers of their files, from the position of their heads, and are
+        deleted only once the merged run is durably written: if writing it fails, they are left as they were.
+        """
+        counts = collections.Counter(run[4] for run in self._runs)
+        levels = sorted(counts)
+        shared = [level for level in levels if counts[level] > 1]
+        level = shared[0] if shared else levels[1]  # else every level has one run: merge the two lowest
+        merged = sorted(run for run in self._runs if run[4] <= level)
+        with contextlib.ExitStack() as stack:
+            sources = []
+            for *_, file_path, position in merged:
+                items = _read_items(file_path)
+                stack.callback(items.close)
+                sources.append(itertools.islice(items, position, None))
+            entry = self._new_run(_merge_sources(sources, None, False), level + 1)
+        # the merged run is complete: only now swap it in for the runs it replaces
+        self._runs = [run for run in self._runs if run[4] > level]
+        if entry is not None:
+            self._runs.append(entry)
+        heapq.heapify(self._runs)
+        for _, _, _, reader, *_ in merged:
+            reader.close()
+
+    def close(self) -> None:
+        """Delete every run, and forget every item."""
+        for _, _, _, reader, *_ in self._runs:
+            reader.close()
+        self._runs.clear()
+        self._memory._heap.clear()
+        self._size = 0
+
+    def _from_runs(self) -> bool:
+        """Whether the smallest item is the head of a run rather than in memory."""
+        return bool(self._runs) and (not len(self._memory) or self._runs[0][0] < self._memory.peek())
+
+    def peek(self) -> T:
+        """Return the smallest item without removing it."""
+        if self._from_runs():
+            return self._runs[0][0]
+        return self._memory.peek()
+
+    def pop(self) -> T:
+        """Remove and return the smallest item."""
+        if not self._from_runs():
+            item = self._memory.pop()  # raises IndexError when empty
+            self._size -= 1
+            return item
+
+        entry = self._runs[0]
+        item = entry[0]
+        try:
+            entry[0] = entry[2]()
+        except StopIteration:
+            heapq.heappop(self._runs)  # the reader has deleted its file
+        else:
+            entry[6] += 1
+            heapq.heapreplace(self._runs, entry)
+        self._size -= 1
+        return item
+
+    def push(self, item: T) -> None:
+        """Add `item` to the heap, spilling to disk if memory is full."""
+        self._memory.push(item)
+        self._size += 1
+        if len(self._memory) >= self._max_items:
+            self.spill()
+
+    def pushpop(self, item: T) -> T:
+        """Push `item`, then pop and return the smallest item."""
+        if not self._size or not self.peek() < item:
+            return item
+        top = self.pop()
+        self.push(item)
+        return top
+
+    def replace(self, item: T) -> T:
+        """Pop and return the smallest item, then push `item`."""
+        top = self.pop()
+        self.push(item)
+        return top
+
 
 def main() -> None:
     """Simple test."""
@@ -114,6 +1255,10 @@ def main() -> None:
         top = heap.pop()
         print(f"{top} <- {heap}")
 
+    top_3: TopK[int, int] = TopK(3)
+    top_3.extend(l)
+    print(f"top 3: {top_3}")
+
 
 if __name__ == "__main__":
     main()
@@ -1,45 +1,443 @@
 #!/usr/bin/env python3
 
-"""Lock-file"""
+"""Lock-file
+
+Where ``fcntl`` is available, the lock is an advisory lock of the lock-file, with ``flock``: a process
+waiting for it wakes up as soon as it is released, and the kernel releases the lock of a process that dies.
+Elsewhere, the lock is the existence of the lock-file, created exclusively, and waiting for it polls
+with an exponential backoff.
+
+The lock-file records its owner, as JSON: the PID and hostname of the process, and when it took the lock.
+So without ``fcntl``, a lock-file left behind by a process that crashed can be broken by the next one:
+
+- when its owner ran on the same host, and is not running anymore;
+- or when the lock-file is older than ``stale_after`` seconds, which also works across hosts, e.g. on NFS.
+  The owner can refresh it with a ``heartbeat`` thread, so that a lock held by a live process is never broken.
+"""
 
 
 # standard imports
+import asyncio
 import contextlib
+import errno
+import json
 import logging
 import os
+import socket
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, ContextManager, Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None  # type: ignore[assignment]
 
 
 # global logger
 logger = logging.getLogger(__name__)
 
 
+# the seconds after which the guard of a process breaking a lock-file is itself stale
+_BREAK_TIMEOUT = 10.0
+
+# the first and the longest delays between two tries to create a lock-file, without fcntl
+_MIN_POLL_DELAY = 0.001
+_MAX_POLL_DELAY = 0.1
+
+
 class LockFileExistsError(FileExistsError):
     pass
 
 
+class LockFileTimeoutError(LockFileExistsError, TimeoutError):
+    """Raised when the lock-file is still locked after the timeout."""
+
+
+def lock_owner(file_path: str) -> Optional[Dict[str, Any]]:
+    """Return the owner of a lock-file, as ``{"pid": ..., "host": ..., "started": ...}``.
+
+    :param file_path: the path to the lock-file.
+    :return: the owner, or ``None`` when there is no lock-file, or it is still being written, or it is invalid.
+    """
+    try:
+        with open(file_path) as file:
+            owner = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return owner if isinstance(owner, dict) else None
+
+
+def _pid_alive(pid: int) -> bool:
+    """Return whether a process of this host is running, or may be."""
+    if os.name == "nt":
+        return True  # os.kill() would terminate it
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # e.g. PermissionError: it runs as another user
+    return True
+
+
+def _stale_reason(owner: Optional[Dict[str, Any]], mtime: float, stale_after: Optional[float]) -> Optional[str]:
+    """Return why a lock-file is stale, or ``None`` when its owner may still hold it."""
+    if owner is not None and owner.get("host") == socket.gethostname():
+        pid = owner.get("pid")
+        if isinstance(pid, int) and not _pid_alive(pid):
+            return f"its owner {pid} is not running"
+    if stale_after is not None:
+        age = time.time() - mtime
+        if age > stale_after:
+            return f"it was not refreshed for {age:.1f} seconds"
+    return None
+
+
+def _break_lock(file_path: str, stale: os.stat_result) -> bool:
+    """Delete a stale lock-file, unless it changed since ``stale``, or another process is breaking it.
+
+    :return: whether the lock-file is gone.
+    """
+    guard_path = file_path + ".break"
+    try:
+        guard = os.open(guard_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        # unless it was left behind by a process that crashed while breaking, which is deleted for next time
+        with contextlib.suppress(FileNotFoundError):
+            if time.time() - os.stat(guard_path).st_mtime > _BREAK_TIMEOUT:
+                os.unlink(guard_path)
+        return False
+    try:
+        try:
+            current = os.stat(file_path)
+        except FileNotFoundError:
+            return True
+        if (current.st_ino, current.st_mtime_ns) != (stale.st_ino, stale.st_mtime_ns):
+            return False  # taken again, or refreshed, in the meantime
+        os.unlink(file_path)
+        return True
+    finally:
+        os.close(guard)
+        os.unlink(guard_path)
+
+
+def _create_lock(file_path: str, stale_after: Optional[float]) -> Optional[int]:
+    """Create the lock-file exclusively, breaking it first when it is stale.
+
+    :return: the descriptor of the lock-file, or ``None`` when another process holds it.
+    """
+    while True:
+        try:
+            return os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            pass
+        try:
+            stale = os.stat(file_path)
+        except FileNotFoundError:
+            continue  # released in the meantime
+        owner = lock_owner(file_path)
+        reason = _stale_reason(owner, stale.st_mtime, stale_after)
+        if reason is None or not _break_lock(file_path, stale):
+            return None
+        logger.warning("broke lock-file %r of %r: %s", file_path, owner, reason)
+
+
+def _is_current(file_path: str, fd: int) -> bool:
+    """Return whether ``fd`` is still the file at ``file_path``, i.e. it was not deleted, or broken, since opened."""
+    try:
+        return os.stat(file_path).st_ino == os.fstat(fd).st_ino
+    except FileNotFoundError:
+        return False
+
+
+class _FlockWaiter:
+    """Wait for the lock of a file descriptor in a thread, so that the caller can give up waiting.
+
+    A thread blocked in ``flock`` cannot be interrupted: when the caller gives up, the thread keeps
+    waiting, and closes the descriptor as soon as it gets the lock, which releases it.
+
+    :param fd: the descriptor of the lock-file, owned by the waiter until it is done.
+    :param on_done: called from the thread when it is done, unless the caller gave up.
+    :param operation: ``fcntl.LOCK_EX``, by default, or ``fcntl.LOCK_SH``.
+    """
+
+    def __init__(self, fd: int, on_done: Optional[Callable[[], Any]] = None, operation: Optional[int] = None):
+        self.fd = fd
+        self.operation = fcntl.LOCK_EX if operation is None else operation
+        self.done = threading.Event()
+        self.error: Optional[OSError] = None
+        self._on_done = on_done
+        self._lock = threading.Lock()
+        self._abandoned = False
+        threading.Thread(target=self._run, name=f"lock_file({fd})", daemon=True).start()
+
+    def _run(self) -> None:
+        try:
+            fcntl.flock(self.fd, self.operation)
+        except OSError as e:
+            self.error = e
+        with self._lock:
+            if not self._abandoned:
+                self.done.set()
+                if self._on_done is not None:
+                    self._on_done()
+                return
+        os.close(self.fd)
+
+    def abandon(self) -> bool:
+        """Give up waiting and return ``True``, unless the waiter is done: then the caller owns the descriptor."""
+        with self._lock:
+            if self.done.is_set():
+                return False
+            self._abandoned = True
+            return True
+
+
+def _wait_flock(fd: int, deadline: Optional[float], operation: Optional[int] = None) -> bool:
+    """Wait for the lock of ``fd`` until the ``time.monotonic()`` deadline, or for ever.
+
+    :param operation: ``fcntl.LOCK_EX``, by default, or ``fcntl.LOCK_SH``.
+    :return: whether the lock was acquired; if not, or on an exception, ``fd`` is closed, now or later.
+    """
+    operation = fcntl.LOCK_EX if operation is None else operation
+    if deadline is None:
+        try:
+            fcntl.flock(fd, operation)
+        except BaseException:
+            os.close(fd)
+            raise
+        return True
+    waiter = _FlockWaiter(fd, operation=operation)
+    try:
+        waiter.done.wait(max(0.0, deadline - time.monotonic()))
+    except BaseException:
+        if not waiter.abandon():
+            os.close(fd)
+        raise
+    if waiter.abandon():
+        return False
+    if waiter.error is not None:
+        os.close(fd)
+        raise waiter.error
+    return True
+
+
+async def _wait_flock_async(fd: int, deadline: Optional[float]) -> bool:
+    """Like ``_wait_flock``, but waiting without blocking the event loop, and cancellable."""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def set_done() -> None:
+        if not future.done():
+            future.set_result(None)
+
+    waiter = _FlockWaiter(fd, lambda: loop.call_soon_threadsafe(set_done))
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        pass
+    except BaseException:
+        if not waiter.abandon():
+            os.close(fd)
+        raise
+    if waiter.abandon():
+        return False
+    if waiter.error is not None:
+        os.close(fd)
+        raise waiter.error
+    return True
+
+
+def _open_lock(file_path: str) -> Tuple[int, bool]:
+    """Open the lock-file, and try to lock it without waiting.
+
+    :return: its descriptor, and whether it is locked; when it is not, the caller closes it or waits.
+    """
+    fd = os.open(file_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return fd, False
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd, True
+
+
+def _acquire(file_path: str, stale_after: Optional[float], blocking: bool, deadline: Optional[float]) -> Optional[int]:
+    """Lock the lock-file, waiting for it if ``blocking``, until the deadline.
+
+    :return: the descriptor of the locked lock-file, or ``None`` when another process holds it.
+    """
+    if fcntl is None:
+        delay = _MIN_POLL_DELAY
+        while True:
+            fd = _create_lock(file_path, stale_after)
+            if fd is not None or not blocking:
+                return fd
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    return None
+                delay = min(delay, deadline - time.monotonic())
+            time.sleep(max(0.0, delay))
+            delay = min(delay * 2, _MAX_POLL_DELAY)
+
+    while True:
+        fd, locked = _open_lock(file_path)
+        if not locked:
+            if not blocking:
+                os.close(fd)
+                return None
+            if not _wait_flock(fd, deadline):
+                return None
+        # the previous owner may have deleted the lock-file after we opened it: then lock the new one
+        if _is_current(file_path, fd):
+            return fd
+        os.close(fd)
+
+
+async def _acquire_async(
+    file_path: str, stale_after: Optional[float], blocking: bool, deadline: Optional[float]
+) -> Optional[int]:
+    """Like ``_acquire``, but waiting without blocking the event loop."""
+    if fcntl is None:
+        delay = _MIN_POLL_DELAY
+        while True:
+            fd = _create_lock(file_path, stale_after)
+            if fd is not None or not blocking:
+                return fd
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    return None
+                delay = min(delay, deadline - time.monotonic())
+            await asyncio.sleep(max(0.0, delay))
+            delay = min(delay * 2, _MAX_POLL_DELAY)
+
+    while True:
+        fd, locked = _open_lock(file_path)
+        if not locked:
+            if not blocking:
+                os.close(fd)
+                return None
+            if not await _wait_flock_async(fd, deadline):
+                return None
+        if _is_current(file_path, fd):
+            return fd
+        os.close(fd)
+
+
+def _heartbeat(file_path: str, fd: int, interval: float, stop: threading.Event) -> None:
+    """Refresh the modification time of the lock-file every ``interval`` seconds, until ``stop`` is set."""
+    while not stop.wait(interval):
+        try:
+            os.utime(fd if os.utime in os.supports_fd else file_path)
+        except OSError as e:
+            logger.error("failed to refresh lock-file %r: %s", file_path, e)
+
+
+class _Held:
+    """A lock-file from when it was acquired until it is released: its owner, and its heartbeat thread."""
+
+    def __init__(self, file_path: str, fd: int, heartbeat: Optional[float]):
+        self.file_path = file_path
+        self.fd = fd
+        try:
+            owner = {"pid": os.getpid(), "host": socket.gethostname(), "started": time.time()}
+            data = json.dumps(owner).encode()
+            os.write(fd, data)
+            # cut what remains of the owner of a lock-file left behind, with fcntl; truncating to 0 would be
+            # slower, as ext4 flushes a file truncated to 0 when it is closed
+            os.ftruncate(fd, len(data))
+        except BaseException:
+            self._remove()
+            raise
+        self._stop = threading.Event()
+        self._heartbeat_thread = None
+        if heartbeat is not None:
+            args = (file_path, fd, heartbeat, self._stop)
+            self._heartbeat_thread = threading.Thread(target=_heartbeat, args=args, daemon=True)
+            self._heartbeat_thread.start()
+
+    def release(self) -> None:
+        """Stop the heartbeat, then delete the lock-file and unlock it."""
+        self._stop.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()  # before closing its descriptor
+        self._remove()
+
+    def _remove(self) -> None:
+        try:
+            # only delete the lock-file if it is still ours, and not one taken after breaking ours
+            if _is_current(self.file_path, self.fd):
+                os.unlink(self.file_path)
+                logger.debug("removed lock-file %r", self.file_path)
+            else:
+                logger.error("lock-file %r was broken by another process", self.file_path)
+        finally:
+            os.close(self.fd)
+
+
+def _check_options(
+    blocking: bool, timeout: Optional[float], stale_after: Optional[float], heartbeat: Optional[float]
+) -> Tuple[bool, Optional[float]]:
+    """Return whether to wait, and until when, from the options of ``lock_file``."""
+    if heartbeat is not None and stale_after is not None and heartbeat >= stale_after:
+        raise ValueError(f"heartbeat must be shorter than stale_after, got {heartbeat} >= {stale_after}")
+    if timeout is not None and timeout < 0:
+        raise ValueError(f"timeout must not be negative, got {timeout}")
+    blocking = blocking or timeout is not None
+    return blocking, None if timeout is None else time.monotonic() + timeout
+
+
+def _not_acquired(file_path: str, blocking: bool, timeout: Optional[float]) -> LockFileExistsError:
+    """Log that the lock-file could not be acquired, and return the exception to raise."""
+    owner = lock_owner(file_path)
+    if blocking:
+        logger.critical("lock-file %r still locked after %.3f seconds! owner: %r", file_path, timeout, owner)
+        return LockFileTimeoutError(errno.ETIMEDOUT, "timed out waiting for the lock-file", file_path)
+    logger.critical("lock-file %r already exists! owner: %r", file_path, owner)
+    return LockFileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), file_path)
+
+
 @contextlib.contextmanager
-def lock_file(file_path: str):  # FIXME return type annotation?
+def lock_file(
+    file_path: str,
+    stale_after: Optional[float] = None,
+    heartbeat: Optional[float] = None,
+    blocking: bool = False,
+    timeout: Optional[float] = None,
+) -> Iterator[None]:
     """Lock-file context-manager. Defines a scope of code protected by a lock-file.
     The lock-file at the given path is created when entering the context, and deleted when exiting the context.
-    The context can only be entered if the lock-file does not already exist.
+    The context can only be entered if the lock-file is not locked by another process; by default, it fails
+    at once, and with ``blocking`` or a ``timeout``, it waits for the lock to be released.
 
     ex::
 
-        with lock_file("/tmp/example.lock"):
+        with lock_file("/tmp/example.lock", timeout=10):
             # ensure that only one process can call `access_something_sensitive()`
             access_something_sensitive()
 
     :param file_path: the path to the lock-file.
-    :raise LockFileExistsError: when the lock-file already exists
+    :param stale_after: without ``fcntl``, the seconds after which a lock-file that was not refreshed is stale,
+                        or ``None`` to only break the lock-files of processes of this host that are not running.
+    :param heartbeat: the seconds between two refreshes of the lock-file while it is held, or ``None`` for none;
+                      it must be shorter than ``stale_after`` of the other processes.
+    :param blocking: whether to wait for the lock, for ever without a ``timeout``.
+    :param timeout: the seconds to wait for the lock, which implies ``blocking``.
+    :raise LockFileExistsError: when the lock-file is locked, and not stale.
+    :raise LockFileTimeoutError: when the lock-file is still locked after ``timeout`` seconds.
     :return: a ``ContextManager``
     """
+    blocking, deadline = _check_options(blocking, timeout, stale_after, heartbeat)
 
     logger.debug("opening lock-file %r", file_path)
-    try:
-        open(file_path, mode="x").close()  # create the empty lock-file
-    except FileExistsError as e:
-        logger.critical("lock-file %r already exists!", file_path)
-        raise LockFileExistsError(e)
+    fd = _acquire(file_path, stale_after, blocking, deadline)
+    if fd is None:
+        raise _not_acquired(file_path, blocking, timeout)
+    held = _Held(file_path, fd, heartbeat)
 
     try:
         yield
@@ -50,8 +448,189 @@ def lock_file(file_path: str):  # FIXME return type annotation?
         logger.debug("exiting lock-file %r normally", file_path)
         pass
     finally:
-        os.unlink(file_path)
-        logger.debug("removed lock-file %r", file_path)
+        held.release()
+
+
+@contextlib.asynccontextmanager
+async def async_lock_file(
+    file_path: str,
+    stale_after: Optional[float] = None,
+    heartbeat: Optional[float] = None,
+    blocking: bool = False,
+    timeout: Optional[float] = None,
+) -> AsyncIterator[None]:
+    """Like ``lock_file``, for asyncio: waiting for the lock lets the other tasks run, and can be cancelled.
+
+    ex::
+
+        async with async_lock_file("/tmp/example.lock", timeout=10):
+            await access_something_sensitive()
+
+    The lock is held by the process, so two tasks of the same process exclude each other too.
+    """
+    blocking, deadline = _check_options(blocking, timeout, stale_after, heartbeat)
+
+    logger.debug("opening lock-file %r", file_path)
+    fd = await _acquire_async(file_path, stale_after, blocking, deadline)
+    if fd is None:
+        raise _not_acquired(file_path, blocking, timeout)
+    held = _Held(file_path, fd, heartbeat)
+
+    try:
+        yield
+    finally:
+        held.release()
+
+
+def _lock_rw(file_path: str, operation: int, blocking: bool, deadline: Optional[float]) -> Optional[int]:
+    """Lock ``file_path`` with ``operation``, ``fcntl.LOCK_SH`` or ``LOCK_EX``, after passing its gate.
+
+    The gate gives writers the preference: a writer holds it exclusively while it waits for the readers
+    to leave, so that new readers wait behind it, instead of starving it. A reader only holds it shared,
+    until it gets its lock, so that readers pass it together.
+
+    :return: the descriptor of the locked file, or ``None`` when it is locked by others.
+    """
+    gate = os.open(file_path + ".gate", os.O_RDWR | os.O_CREAT, 0o644)
+    if not _flock(gate, operation, blocking, deadline):
+        return None
+    try:
+        fd = os.open(file_path, os.O_RDWR | os.O_CREAT, 0o644)
+        return fd if _flock(fd, operation, blocking, deadline) else None
+    finally:
+        os.close(gate)
+
+
+def _flock(fd: int, operation: int, blocking: bool, deadline: Optional[float]) -> bool:
+    """Lock ``fd`` with ``operation``, waiting for it if ``blocking``, until the deadline.
+
+    :return: whether ``fd`` is locked; if not, or on an exception, it is closed, now or later.
+    """
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        if not blocking:
+            os.close(fd)
+            return False
+    except BaseException:
+        os.close(fd)
+        raise
+    return _wait_flock(fd, deadline, operation)
+
+
+class FileLock:
+    """A shared or exclusive lock of a file, held by ``read_lock`` or ``write_lock``.
+
+    Converting the lock is not atomic, as with ``flock`` itself: ``upgrade()`` releases the shared
+    lock before waiting for the exclusive one, and ``downgrade()`` may let a waiting writer in before
+    the shared lock is taken back. So what was read under a shared lock must be read again after
+    an upgrade.
+
+    :param file_path: the path to the locked file.
+    :param fd: the descriptor of the locked file.
+    :param exclusive: whether the lock is exclusive.
+    """
+
+    def __init__(self, file_path: str, fd: int, exclusive: bool):
+        self.file_path = file_path
+        self.exclusive = exclusive
+        self._fd: Optional[int] = fd
+
+    def __repr__(self) -> str:
+        state = "released" if self._fd is None else "exclusive" if self.exclusive else "shared"
+        return f"FileLock({self.file_path!r}, {state})"
+
+    def upgrade(self, blocking: bool = True, timeout: Optional[float] = None) -> None:
+        """Turn a shared lock into an exclusive one, waiting for the other readers to leave.
+
+        :raise LockFileExistsError: when not blocking, and the file is locked by others; the lock is then released.
+        :raise LockFileTimeoutError: when the file is still locked by others after ``timeout`` seconds; idem.
+        """
+        if self.exclusive:
+            return
+        blocking, deadline = _check_options(blocking, timeout, None, None)
+        self.release()
+        self._fd = _lock_rw(self.file_path, fcntl.LOCK_EX, blocking, deadline)
+        if self._fd is None:
+            raise _not_acquired(self.file_path, blocking, timeout)
+        self.exclusive = True
+        logger.debug("upgraded lock of %r", self.file_path)
+
+    def downgrade(self) -> None:
+        """Turn an exclusive lock into a shared one, letting other readers in."""
+        if not self.exclusive or self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+        self.exclusive = False
+        logger.debug("downgraded lock of %r", self.file_path)
+
+    def release(self) -> None:
+        """Release the lock, if still held."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+@contextlib.contextmanager
+def _rw_lock(file_path: str, exclusive: bool, blocking: bool, timeout: Optional[float]) -> Iterator[FileLock]:
+    """Hold a shared or exclusive ``FileLock`` of ``file_path``, for ``read_lock`` and ``write_lock``."""
+    if fcntl is None:
+        raise RuntimeError("read_lock and write_lock need fcntl, which is not available")
+    blocking, deadline = _check_options(blocking, timeout, None, None)
+    fd = _lock_rw(file_path, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, blocking, deadline)
+    if fd is None:
+        raise _not_acquired(file_path, blocking, timeout)
+    lock = FileLock(file_path, fd, exclusive)
+    try:
+        yield lock
+    finally:
+        lock.release()
+
+
+def read_lock(file_path: str, blocking: bool = True, timeout: Optional[float] = None) -> ContextManager[FileLock]:
+    """Hold a shared lock of a file: readers hold it together, and only wait for writers.
+
+    The lock is an advisory ``flock``, so it only excludes the processes that take it too. Unlike
+    ``lock_file``, the file, and its ``.gate`` next to it, are not deleted on exit, which would let
+    two processes lock different files of the same path; they are created empty when missing.
+    A writer that is waiting is given the preference over new readers, so that readers cannot starve it.
+
+    ex::
+
+        with read_lock("/var/cache/app/index.lock"):
+            index = load_index()
+
+    :param file_path: the path to the lock-file.
+    :param blocking: whether to wait for the lock, for ever without a ``timeout``.
+    :param timeout: the seconds to wait for the lock, which implies ``blocking``.
+    :raise LockFileExistsError: when not blocking, and a writer holds the lock, or waits for it.
+    :raise LockFileTimeoutError: when the lock is still held by a writer after ``timeout`` seconds.
+    :raise RuntimeError: when ``fcntl`` is not available.
+    :return: a ``ContextManager`` giving the ``FileLock``, which can be upgraded.
+    """
+    return _rw_lock(file_path, False, blocking, timeout)
+
+
+def write_lock(file_path: str, blocking: bool = True, timeout: Optional[float] = None) -> ContextManager[FileLock]:
+    """Hold an exclusive lock of a file: a writer waits for the readers and the writers to leave.
+
+    see ``read_lock``, which shares the same lock-file.
+
+    ex::
+
+        with write_lock("/var/cache/app/index.lock"):
+            save_index(index)
+
+    :param file_path: the path to the lock-file.
+    :param blocking: whether to wait for the lock, for ever without a ``timeout``.
+    :param timeout: the seconds to wait for the lock, which implies ``blocking``.
+    :raise LockFileExistsError: when not blocking, and the lock is held.
+    :raise LockFileTimeoutError: when the lock is still held after ``timeout`` seconds.
+    :raise RuntimeError: when ``fcntl`` is not available.
+    :return: a ``ContextManager`` giving the ``FileLock``, which can be downgraded.
+    """
+    return _rw_lock(file_path, True, blocking, timeout)
 
 
 def main() -> None:
@@ -62,12 +641,36 @@ def main() -> None:
     LOCK_FILE_PATH = "LOCK_FILE"
     logger.debug("lock-file exists: %s", os.path.isfile(LOCK_FILE_PATH))
 
-    with lock_file(LOCK_FILE_PATH):
+    with lock_file(LOCK_FILE_PATH, stale_after=10, heartbeat=1):
+        logger.info("lock-file %r is owned by %r", LOCK_FILE_PATH, lock_owner(LOCK_FILE_PATH))
         try:
             with lock_file(LOCK_FILE_PATH):
                 pass
         except LockFileExistsError:
             logger.info("file %r was locked!", LOCK_FILE_PATH)
+        try:
+            with lock_file(LOCK_FILE_PATH, timeout=0.1):
+                pass
+        except LockFileTimeoutError:
+            logger.info("file %r was still locked after 0.1 seconds!", LOCK_FILE_PATH)
+
+    async def test_async() -> None:
+        async with async_lock_file(LOCK_FILE_PATH, timeout=1):
+            logger.info("file %r is locked by a task", LOCK_FILE_PATH)
+
+    asyncio.run(test_async())
+
+    # test reader-writer locks
+
+    if fcntl is not None:
+        with read_lock(LOCK_FILE_PATH) as lock, read_lock(LOCK_FILE_PATH):
+            logger.info("two readers hold %r", lock)
+        with write_lock(LOCK_FILE_PATH) as lock:
+            logger.info("a writer holds %r", lock)
+            lock.downgrade()
+            logger.info("the writer now holds %r", lock)
+        os.unlink(LOCK_FILE_PATH)
+        os.unlink(LOCK_FILE_PATH + ".gate")
 
 
 if __name__ == "__main__":
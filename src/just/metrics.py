@@ -0,0 +1,302 @@
+"""Export the durations measured by `just.timing` to monitoring systems, off the hot path.
+
+A `MetricsSink` is given to `timing` or `timed` with `sink=`: every duration is appended to
+a queue, which is cheap and never blocks, and a background thread flushes the queue in
+batches to each of its exporters:
+
+- `JsonLinesExporter` appends one JSON object per duration to a file.
+- `StatsdExporter` sends StatsD timers over UDP, packed into as few datagrams as possible.
+- `PrometheusExporter` keeps a summary per name, with quantiles from `just.timing.TimingStats`,
+  and writes it as Prometheus exposition text to a file, e.g. for the textfile collector of
+  the node exporter, or serves it over HTTP for Prometheus to scrape.
+
+Errors of an exporter are logged and do not stop the others.
+
+see: https://github.com/statsd/statsd/blob/master/docs/metric_types.md
+see: https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+
+import abc
+import collections
+import http.server
+import json
+import logging
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from typing import IO, Deque, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from just.atomic import atomic_open
+from just.timing import TimingStats, timing
+
+
+# global logger
+logger = logging.getLogger(__name__)
+
+
+# a measured duration: name, seconds, and the Unix time when it was added
+Record = Tuple[str, float, float]
+
+
+class Exporter(abc.ABC):
+    """Send batches of durations somewhere. ``export()`` is only called by the flush thread of a sink."""
+
+    @abc.abstractmethod
+    def export(self, records: List[Record]) -> None:
+        """Send the durations of a batch."""
+
+    def close(self) -> None:
+        """Release the resources of the exporter, after the last batch."""
+
+
+class JsonLinesExporter(Exporter):
+    """Append every duration to a file, as a ``{"name": ..., "seconds": ..., "timestamp": ...}`` line.
+
+    :param file: the path of the file, opened for appending, or a text file object, which is not closed.
+    """
+
+    def __init__(self, file: Union[os.PathLike, str, IO[str]]):
+        if isinstance(file, (str, os.PathLike)):
+            self._file: IO[str] = open(file, "a")
+            self._owned = True
+        else:
+            self._file = file
+            self._owned = False
+
+    def export(self, records: List[Record]) -> None:
+        for name, seconds, timestamp in records:
+            self._file.write(json.dumps({"name": name, "seconds": seconds, "timestamp": timestamp}) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._owned:
+            self._file.close()
+
+
+class StatsdExporter(Exporter):
+    """Send every duration as a StatsD timer, ``name:milliseconds|ms``, over UDP.
+
+    Timers are packed into datagrams of at most ``max_packet_size`` bytes, one per line.
+    The socket is non-blocking, and a datagram that cannot be sent is dropped, as usual with StatsD.
+
+    :param address: the ``(host, port)`` of the StatsD server.
+    :param prefix: prepended to every name, e.g. ``"myapp."``.
+    :param max_packet_size: the largest datagram, 1432 bytes fits the usual Ethernet MTU.
+    """
+
+    def __init__(self, address: Tuple[str, int] = ("127.0.0.1", 8125), prefix: str = "", max_packet_size: int = 1432):
+        self.address = address
+        self.prefix = prefix
+        self.max_packet_size = max_packet_size
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def export(self, records: List[Record]) -> None:
+        packet: List[bytes] = []
+        size = 0
+        for name, seconds, _ in records:
+            line = f"{self.prefix}{_statsd_name(name)}:{seconds * 1000:.3f}|ms".encode()
+            if packet and size + 1 + len(line) > self.max_packet_size:
+                self._send(b"\n".join(packet))
+                packet, size = [], 0
+            size += len(line) + (1 if packet else 0)
+            packet.append(line)
+        if packet:
+            self._send(b"\n".join(packet))
+
+    def _send(self, datagram: bytes) -> None:
+        try:
+            self._socket.sendto(datagram, self.address)
+        except OSError as e:
+            logger.debug("dropped StatsD datagram of %d bytes: %s", len(datagram), e)
+
+    def close(self) -> None:
+        self._socket.close()
+
+
+def _statsd_name(name: str) -> str:
+    """Replace the characters that StatsD uses as separators, and spaces, by underscores."""
+    return re.sub(r"[^\w.\-]", "_", name)
+
+
+class PrometheusExporter(Exporter):
+    """Keep a summary of the durations of every name, and expose it as Prometheus text.
+
+    The summary is a single metric, ``<namespace>_timing_seconds``, with a ``name`` label, and the
+    count, sum and quantiles of every duration since the exporter was created.
+
+    :param file_path: the file where the text is written after every batch, atomically, or ``None``.
+    :param port: the port where the text is served over HTTP, ``0`` for any free port, or ``None``.
+    :param host: the address the HTTP server listens on.
+    :param namespace: the prefix of the metric name.
+    :param quantiles: the quantiles of each summary.
+    """
+
+    def __init__(
+        self,
+        file_path: Union[os.PathLike, str, None] = None,
+        port: Optional[int] = None,
+        host: str = "127.0.0.1",
+        namespace: str = "just",
+        quantiles: Sequence[float] = (0.5, 0.9, 0.99),
+    ):
+        self.file_path = file_path
+        self.metric = f"{namespace}_timing_seconds"
+        self.quantiles = quantiles
+        self._stats: Dict[str, TimingStats] = {}
+        self._lock = threading.Lock()  # the HTTP server renders while the flush thread exports
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+        if port is not None:
+            self._server = http.server.ThreadingHTTPServer((host, port), self._handler())
+            threading.Thread(target=self._server.serve_forever, name="PrometheusExporter", daemon=True).start()
+
+    @property
+    def server_address(self) -> Optional[Tuple[str, int]]:
+        """The ``(host, port)`` of the HTTP server, or ``None`` without one."""
+        if self._server is None:
+            return None
+        host, port = self._server.server_address[:2]
+        return str(host), port
+
+    def export(self, records: List[Record]) -> None:
+        with self._lock:
+            for name, seconds, _ in records:
+                stats = self._stats.get(name)
+                if stats is None:
+                    stats = self._stats[name] = TimingStats(name)
+                stats.add(seconds)
+        if self.file_path is not None:
+            with atomic_open(self.file_path, "w") as file:
+                file.write(self.render())
+
+    def render(self) -> str:
+        """Return the summaries in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.metric} Durations measured by just.timing.",
+            f"# TYPE {self.metric} summary",
+        ]
+        with self._lock:
+            for name, stats in sorted(self._stats.items()):
+                label = f'name="{_escape_label(name)}"'
+                for q in self.quantiles:
+                    lines.append(f'{self.metric}{{{label},quantile="{q}"}} {stats.quantile(q)!r}')
+                lines.append(f"{self.metric}_sum{{{label}}} {stats.total!r}")
+                lines.append(f"{self.metric}_count{{{label}}} {stats.count}")
+        return "\n".join(lines) + "\n"
+
+    def _handler(self) -> type:
+        """Return a request handler class that serves ``render()`` for every path."""
+        exporter = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                logger.debug(format, *args)
+
+        return Handler
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def _escape_label(value: str) -> str:
+    """Escape a label value of the Prometheus text format."""
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+class MetricsSink:
+    """Collect durations without blocking, and export them in batches from a background thread.
+
+    ``add()`` only appends to a bounded queue: when the exporters fall behind, the oldest
+    durations are dropped rather than slowing down the code being timed.
+
+    ex::
+
+        sink = MetricsSink([StatsdExporter(("127.0.0.1", 8125), prefix="myapp.")])
+        with timing("handle request", sink=sink):
+            handle(request)
+        sink.close()  # export what remains
+
+    :param exporters: where the batches are sent.
+    :param flush_interval: the seconds between two flushes.
+    :param max_pending: the number of durations kept waiting for the next flush.
+    """
+
+    def __init__(self, exporters: Iterable[Exporter], flush_interval: float = 1.0, max_pending: int = 100_000):
+        if flush_interval <= 0:
+            raise ValueError(f"flush_interval must be positive, got {flush_interval}")
+        self.exporters = list(exporters)
+        self.flush_interval = flush_interval
+        self._pending: Deque[Record] = collections.deque(maxlen=max_pending)
+        self._flush_lock = threading.Lock()  # flush() may be called while the thread flushes
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="MetricsSink", daemon=True)
+        self._thread.start()
+
+    def add(self, name: str, seconds: float) -> None:
+        """Queue a duration for the next flush."""
+        self._pending.append((name, seconds, time.time()))
+
+    def flush(self) -> None:
+        """Export the queued durations now, to every exporter."""
+        with self._flush_lock:
+            pending = self._pending
+            records = [pending.popleft() for _ in range(len(pending))]
+            if not records:
+                return
+            for exporter in self.exporters:
+                try:
+                    exporter.export(records)
+                except Exception:
+                    logger.exception("failed to export %d records to %r", len(records), exporter)
+
+    def _run(self) -> None:
+        """Flush every ``flush_interval`` seconds until closed."""
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        """Stop the flush thread, export the remaining durations, and close the exporters."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join()
+        self.flush()
+        for exporter in self.exporters:
+            exporter.close()
+
+    def __enter__(self) -> "MetricsSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def main() -> None:
+    """Simple test."""
+
+    logging.basicConfig(format="%(asctime)s %(levelname)-8s %(message)s", level=logging.DEBUG)
+
+    prometheus = PrometheusExporter(port=0)
+    with MetricsSink([prometheus, JsonLinesExporter(sys.stdout)], flush_interval=0.1) as sink:
+        for i in range(10):
+            with timing("sleep", do_print=False, sink=sink):
+                time.sleep(0.001 * i)
+        sink.flush()
+        print(prometheus.render())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""Priority-queues for threads and for asyncio tasks, ordered like `just.heap2.KeyHeap`.
+
+`PriorityQueue` is the `queue.PriorityQueue` of this package: blocking `put`/`get` with
+timeouts and `maxsize`, plus `put_many`/`get_many` that move a whole batch under one
+acquisition of the lock. `AsyncPriorityQueue` is the same for asyncio, in the style of
+`asyncio.Queue`.
+
+Both take a key-function instead of requiring `(priority, item)` tuples, and items with
+equal keys come out in the order they were put, so the items themselves are never compared.
+
+see: https://docs.python.org/3/library/queue.html
+see: https://docs.python.org/3/library/asyncio-queue.html
+"""
+
+import asyncio
+import collections
+import itertools
+import math
+import queue
+import threading
+import time
+from typing import Any, Callable, Deque, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+from just.heap2 import KeyHeap
+
+
+K = TypeVar("K")
+T = TypeVar("T")
+
+
+class _Entries(Generic[K, T]):
+    """The heap shared by both queues: a `KeyHeap` of `(sequence, item)` entries.
+
+    The sequence number breaks ties between equal keys, first in first out,
+    so `KeyHeap` never falls through to comparing the items.
+    """
+
+    def __init__(self, key: Callable[[T], K]):
+        self._sequence = itertools.count()
+        self._heap: KeyHeap[Any, Tuple[int, T]] = KeyHeap([], key=lambda entry: (key(entry[1]), entry[0]))
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, item: T) -> None:
+        self._heap.push((next(self._sequence), item))
+
+    def pop(self) -> T:
+        return self._heap.pop()[1]
+
+
+class PriorityQueue(Generic[K, T]):
+    """Thread-safe priority-queue, the item with the smallest key comes out first.
+
+    Producers block in `put()` while the queue holds `maxsize` items, consumers block in
+    `get()` while it is empty. All waiting happens on two conditions of a single lock,
+    and every change of size notifies exactly as many waiters as it can satisfy.
+
+    ex::
+
+        >>> q = PriorityQueue(key=len)
+        >>> q.put_many(["ccc", "a", "bb"])
+        >>> q.get()
+        'a'
+        >>> q.get_many(10)
+        ['bb', 'ccc']
+
+    :param key: computes the priority of each item.
+    :param maxsize: the most items the queue holds, unbounded when ``<= 0``.
+    """
+
+    def __init__(self, key: Callable[[T], K], maxsize: int = 0):
+        self.maxsize = maxsize
+        self._entries = _Entries(key)
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def __len__(self) -> int:
+        """Approximate number of items, it may change as soon as it is returned."""
+        return len(self._entries)
+
+    def qsize(self) -> int:
+        """Approximate number of items, like `queue.Queue.qsize()`."""
+        return len(self._entries)
+
+    def empty(self) -> bool:
+        """Whether the queue is empty, approximately."""
+        return not len(self._entries)
+
+    def full(self) -> bool:
+        """Whether the queue is full, approximately."""
+        return 0 < self.maxsize <= len(self._entries)
+
+    def _room(self) -> int:
+        """The number of items that can be put without blocking, must hold the lock."""
+        if self.maxsize <= 0:
+            return len(self._entries) + 1  # anything positive
+        return self.maxsize - len(self._entries)
+
+    @staticmethod
+    def _deadline(block: bool, timeout: Optional[float]) -> Optional[float]:
+        """Validate the timeout the way `queue.Queue` does, and turn it into a deadline."""
+        if not block or timeout is None:
+            return None
+        if timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+        return time.monotonic() + timeout
+
+    @staticmethod
+    def _wait(condition: threading.Condition, block: bool, deadline: Optional[float], error: type) -> None:
+        """Wait once on `condition` until `deadline`, or raise `error` when not allowed to wait."""
+        if not block:
+            raise error
+        if deadline is None:
+            condition.wait()
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0.0:
+            raise error
+        condition.wait(remaining)
+
+    def put(self, item: T, block: bool = True, timeout: Optional[float] = None) -> None:
+        """Put `item` into the queue, waiting for room if it is full.
+
+        :raise queue.Full: when there is no room after `timeout` seconds, or immediately if not `block`.
+        """
+        deadline = self._deadline(block, timeout)
+        with self._not_full:
+            while self._room() <= 0:
+                self._wait(self._not_full, block, deadline, queue.Full)
+            self._entries.push(item)
+            self._not_empty.notify()
+
+    def put_nowait(self, item: T) -> None:
+        """Put `item` without blocking, like `put(item, block=False)`."""
+        self.put(item, block=False)
+
+    def put_many(self, items: Iterable[T], block: bool = True, timeout: Optional[float] = None) -> None:
+        """Put every item of `items`, acquiring the lock once rather than once per item.
+
+        When the queue is bounded, as many items as fit are put before waiting for more room,
+        so a batch larger than `maxsize` still goes through as consumers make room.
+
+        :raise queue.Full: as `put()`; the items put before the queue filled up stay in it.
+        """
+        pending: Deque[T] = collections.deque(items)
+        deadline = self._deadline(block, timeout)
+        with self._not_full:
+            while pending:
+                room = self._room()
+                if room <= 0:
+                    self._wait(self._not_full, block, deadline, queue.Full)
+                    continue
+                count = min(room, len(pending))
+                for _ in range(count):
+                    self._entries.push(pending.popleft())
+                self._not_empty.notify(count)
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> T:
+        """Remove and return the item with the smallest key, waiting for one if the queue is empty.
+
+        :raise queue.Empty: when there is no item after `timeout` seconds, or immediately if not `block`.
+        """
+        deadline = self._deadline(block, timeout)
+        with self._not_empty:
+            while not len(self._entries):
+                self._wait(self._not_empty, block, deadline, queue.Empty)
+            item = self._entries.pop()
+            self._not_full.notify()
+            return item
+
+    def get_nowait(self) -> T:
+        """Get an item without blocking, like `get(block=False)`."""
+        return self.get(block=False)
+
+    def get_many(self, max_items: int, block: bool = True, timeout: Optional[float] = None) -> List[T]:
+        """Remove and return up to `max_items` items, smallest key first, under one acquisition of the lock.
+
+        Waits only for the first item: whatever else is already queued comes along with it.
+
+        :raise queue.Empty: as `get()`.
+        """
+        if max_items < 1:
+            raise ValueError(f"max_items must be at least 1, got {max_items}")
+        deadline = self._deadline(block, timeout)
+        with self._not_empty:
+            while not len(self._entries):
+                self._wait(self._not_empty, block, deadline, queue.Empty)
+            count = min(max_items, len(self._entries))
+            items = [self._entries.pop() for _ in range(count)]
+            self._not_full.notify(count)
+            return items
+
+
+class AsyncPriorityQueue(Generic[K, T]):
+    """Priority-queue for asyncio tasks, the item with the smallest key comes out first.
+
+    Like `asyncio.Queue` it is not thread-safe, and has no timeouts of its own:
+    wrap a call in `asyncio.wait_for()` to give it one. Waiting tasks are woken one at a time,
+    and a task cancelled right after being woken passes its wake-up on to the next one.
+
+    ex::
+
+        >>> async def demo():
+        ...     q = AsyncPriorityQueue(key=len)
+        ...     await q.put_many(["ccc", "a", "bb"])
+        ...     return [await q.get()] + await q.get_many(10)
+        >>> asyncio.run(demo())
+        ['a', 'bb', 'ccc']
+
+    :param key: computes the priority of each item.
+    :param maxsize: the most items the queue holds, unbounded when ``<= 0``.
+    """
+
+    def __init__(self, key: Callable[[T], K], maxsize: int = 0):
+        self.maxsize = maxsize
+        self._entries = _Entries(key)
+        self._getters: Deque[asyncio.Future] = collections.deque()
+        self._putters: Deque[asyncio.Future] = collections.deque()
+
+    def __len__(self) -> int:
+        """Number of items in the queue."""
+        return len(self._entries)
+
+    def qsize(self) -> int:
+        """Number of items in the queue, like `asyncio.Queue.qsize()`."""
+        return len(self._entries)
+
+    def empty(self) -> bool:
+        """Whether the queue is empty."""
+        return not len(self._entries)
+
+    def full(self) -> bool:
+        """Whether the queue is full."""
+        return 0 < self.maxsize <= len(self._entries)
+
+    @staticmethod
+    def _wakeup_next(waiters: Deque[asyncio.Future], count: int = 1) -> None:
+        """Wake up to `count` of the `waiters` that are still waiting."""
+        while waiters and count > 0:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                count -= 1
+
+    async def _wait(self, waiters: Deque[asyncio.Future], ready: Callable[[], bool]) -> None:
+        """Wait in line on `waiters` once, passing the wake-up on if cancelled after receiving it."""
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await waiter
+        except BaseException:
+            waiter.cancel()  # no-op if it was already woken
+            try:
+                waiters.remove(waiter)
+            except ValueError:
+                pass  # already removed by the waker
+            if ready() and not waiter.cancelled():
+                self._wakeup_next(waiters)
+            raise
+
+    def put_nowait(self, item: T) -> None:
+        """Put `item` without waiting.
+
+        :raise asyncio.QueueFull: when the queue is full.
+        """
+        if self.full():
+            raise asyncio.QueueFull
+        self._entries.push(item)
+        self._wakeup_next(self._getters)
+
+    async def put(self, item: T) -> None:
+        """Put `item` into the queue, waiting for room if it is full."""
+        while self.full():
+            await self._wait(self._putters, lambda: not self.full())
+        self.put_nowait(item)
+
+    async def put_many(self, items: Iterable[T]) -> None:
+        """Put every item of `items`, waking as many getters as items were put at once."""
+        pending: Deque[T] = collections.deque(items)
+        while pending:
+            if self.full():
+                await self._wait(self._putters, lambda: not self.full())
+                continue
+            count = 0
+            while pending and not self.full():
+                self._entries.push(pending.popleft())
+                count += 1
+            self._wakeup_next(self._getters, count)
+
+    def get_nowait(self) -> T:
+        """Remove and return the item with the smallest key without waiting.
+
+        :raise asyncio.QueueEmpty: when the queue is empty.
+        """
+        if self.empty():
+            raise asyncio.QueueEmpty
+        item = self._entries.pop()
+        self._wakeup_next(self._putters)
+        return item
+
+    async def get(self) -> T:
+        """Remove and return the item with the smallest key, waiting for one if the queue is empty."""
+        while self.empty():
+            await self._wait(self._getters, lambda: not self.empty())
+        return self.get_nowait()
+
+    async def get_many(self, max_items: int) -> List[T]:
+        """Remove and return up to `max_items` items, smallest key first, waiting only for the first one."""
+        if max_items < 1:
+            raise ValueError(f"max_items must be at least 1, got {max_items}")
+        while self.empty():
+            await self._wait(self._getters, lambda: not self.empty())
+        count = min(max_items, len(self._entries))
+        items = [self._entries.pop() for _ in range(count)]
+        self._wakeup_next(self._putters, count)
+        return items
+
+
+def main() -> None:
+    """Simple test."""
+
+    # one consumer thread, several producers, then a sentinel that sorts after every item, so none is left behind
+    q: PriorityQueue[float, float] = PriorityQueue(key=lambda x: x, maxsize=8)
+    results = []
+
+    def consume() -> None:
+        while True:
+            item = q.get()
+            if item == math.inf:
+                break
+            results.append(item)
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    producers = [threading.Thread(target=q.put_many, args=(range(i, 100, 4),)) for i in range(4)]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+    q.put(math.inf)
+    consumer.join()
+    print(f"consumed {len(results)} items")
+
+    # asyncio flavour
+    async def demo() -> List[str]:
+        aq: AsyncPriorityQueue[int, str] = AsyncPriorityQueue(key=len)
+        await aq.put_many(["ccc", "a", "bb"])
+        return await aq.get_many(3)
+
+    print(asyncio.run(demo()))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,74 +3,1159 @@ see: https://www.bitecode.dev/p/python-cocktail-mix-a-context-manager
 see: https://lobste.rs/s/xhe7sr/python_cocktail_mix_context_manager'
 """
 
+import abc
+import asyncio
+import collections
+import concurrent.futures
+import contextvars
 import functools
+import inspect
 import logging
+import random
+import threading
 import time
-from typing import Callable, ParamSpec, Type, TypeVar
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, ParamSpec, Tuple, Type, TypeVar, Union
 
 
 logger = logging.getLogger(__name__)
 
-
 P = ParamSpec("P")
 R = TypeVar("R")
 
+# the exceptions caught by `retry`: one type, or a tuple of them, as for an `except` clause
+Errors = Union[Type[BaseException], Tuple[Type[BaseException], ...]]
+
+
+class Backoff(abc.ABC):
+    """Compute the delay before each retry.
+
+    A backoff is called with the number of the attempt that just failed, starting at 1, and the
+    previous delay, 0 before the first retry. Jitter spreads the retries of many clients that
+    failed at the same time, so that they do not all hit a recovering service at once.
+
+    see: https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    """
+
+    @abc.abstractmethod
+    def __call__(self, attempt: int, previous: float) -> float:
+        """Return the seconds to wait before the next attempt."""
+
+
+class ConstantBackoff(Backoff):
+    """The same delay before every retry.
+
+    :param delay: the seconds to wait.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def __call__(self, attempt: int, previous: float) -> float:
+        return self.delay
+
+
+class ExponentialBackoff(Backoff):
+    """A delay multiplied by ``factor`` after every failed attempt: ``base``, ``base * factor``...
+
+    ex::
+
+        >>> backoff = ExponentialBackoff(0.1)
+        >>> [backoff(attempt, 0) for attempt in (1, 2, 3)]
+        [0.1, 0.2, 0.4]
+
+    :param base: the seconds to wait before the first retry.
+    :param factor: the growth of the delay from one retry to the next.
+    """
+
+    def __init__(self, base: float, factor: float = 2.0):
+        self.base = base
+        self.factor = factor
+
+    def __call__(self, attempt: int, previous: float) -> float:
+        return self.base * self.factor ** (attempt - 1)
+
+
+class FullJitterBackoff(ExponentialBackoff):
+    """A random delay between 0 and the exponential backoff.
+
+    :param base: the largest delay before the first retry.
+    :param factor: the growth of the largest delay from one retry to the next.
+    :param rng: the source of randomness, ``random`` by default.
+    """
+
+    def __init__(self, base: float, factor: float = 2.0, rng: Optional[random.Random] = None):
+        super().__init__(base, factor)
+        self.rng = rng if rng is not None else random
+
+    def __call__(self, attempt: int, previous: float) -> float:
+        return self.rng.uniform(0, super().__call__(attempt, previous))
+
+
+class DecorrelatedJitterBackoff(Backoff):
+    """A random delay between ``base`` and ``factor`` times the previous delay.
+
+    It grows about as fast as the exponential backoff, but each delay depends on the previous
+    random one rather than on the attempt, which spreads the clients further apart.
+
+    :param base: the smallest delay.
+    :param factor: the largest growth of the delay from one retry to the next.
+    :param rng: the source of randomness, ``random`` by default.
+    """
+
+    def __init__(self, base: float, factor: float = 3.0, rng: Optional[random.Random] = None):
+        self.base = base
+        self.factor = factor
+        self.rng = rng if rng is not None else random
+
+    def __call__(self, attempt: int, previous: float) -> float:
+        return self.rng.uniform(self.base, max(self.base, previous * self.factor))
+
+
+class RetryBudget:
+    """Allow retries only up to a share of the successful calls, so that retries cannot multiply the load.
+
+    A token bucket: every successful call deposits ``ratio`` of a token, and every retry withdraws
+    one, or is denied when there is none. So when a dependency is down, retries stop after the
+    tokens saved up, instead of multiplying the calls by the number of tries exactly when it is
+    weakest. ``min_per_second`` tokens are also added with time, to allow some retries when there
+    is little traffic, and at most ``max_tokens`` are kept, which is also how many there are at first.
+
+    A budget is thread-safe, and meant to be shared by every call to a same target, e.g. with
+    ``shared_budget("database")``.
+
+    ex::
+
+        >>> budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+        >>> budget.withdraw(), budget.withdraw()
+        (True, False)
+        >>> budget.deposit(); budget.deposit()
+        >>> budget.withdraw(), budget.denied
+        (True, 1)
+
+    see: https://github.com/grpc/proposal/blob/master/A6-client-retries.md#throttling-retry-attempts-and-hedged-rpcs
+
+    :param ratio: the tokens deposited by each successful call, e.g. 0.1 for at most 10% of retries.
+    :param min_per_second: the tokens added every second, whatever the calls.
+    :param max_tokens: the largest number of tokens kept.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 10.0, max_tokens: float = 100.0):
+        if ratio < 0 or min_per_second < 0 or max_tokens < 1:
+            raise ValueError(f"invalid budget: ratio={ratio}, min_per_second={min_per_second}, max_tokens={max_tokens}")
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._time = time.monotonic()
+        self._lock = threading.Lock()
+        # counters
+        self.deposits = 0
+        self.withdrawals = 0
+        self.denied = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"RetryBudget(tokens={self.tokens:.1f}, deposits={self.deposits},"
+            f" withdrawals={self.withdrawals}, denied={self.denied})"
+        )
+
+    def _refill(self) -> None:
+        """Add the tokens earned with time since the last refill. Called with the lock held."""
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._time) * self.min_per_second)
+        self._time = now
+
+    @property
+    def tokens(self) -> float:
+        """The number of tokens available now."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def deposit(self) -> None:
+        """Record a successful call."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+            self.deposits += 1
+
+    def withdraw(self) -> bool:
+        """Take a token for a retry, and return whether there was one, i.e. whether the retry is allowed."""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                self.denied += 1
+                return False
+            self._tokens -= 1
+            self.withdrawals += 1
+            return True
+
+
+# the budgets shared by name, see `shared_budget`
+_shared_budgets: Dict[str, RetryBudget] = {}
+_shared_budgets_lock = threading.Lock()
+
+
+def shared_budget(target: str = "", **kwargs: Any) -> RetryBudget:
+    """Return the ``RetryBudget`` of a target, shared by the whole process, created on the first call.
+
+    :param target: the name of what is called, e.g. a service; the default budget is named ``""``.
+    :param kwargs: the arguments of ``RetryBudget``, used only when it is created.
+    """
+    with _shared_budgets_lock:
+        budget = _shared_budgets.get(target)
+        if budget is None:
+            budget = _shared_budgets[target] = RetryBudget(**kwargs)
+        return budget
+
+
+class RetryEvent:
+    """The outcome of one attempt of a retried call, as given to an ``on_attempt`` hook.
+
+    :param name: the name of the retried function, or of the retry loop.
+    :param attempt: the number of the attempt, from 1.
+    :param tries: the largest number of attempts.
+    :param outcome: ``SUCCESS``, ``RETRY`` when another attempt follows, or ``FAILURE`` when giving up.
+    :param elapsed: the seconds since the first attempt began.
+    :param delay: the seconds before the next attempt, 0 unless retrying.
+    :param exception: the exception raised by the attempt, or ``None``.
+    """
+
+    SUCCESS = "success"
+    RETRY = "retry"
+    FAILURE = "failure"
+
+    __slots__ = ("name", "attempt", "tries", "outcome", "elapsed", "delay", "exception")
+
+    def __init__(
+        self,
+        name: str,
+        attempt: int,
+        tries: int,
+        outcome: str,
+        elapsed: float,
+        delay: float = 0.0,
+        exception: Optional[BaseException] = None,
+    ):
+        self.name = name
+        self.attempt = attempt
+        self.tries = tries
+        self.outcome = outcome
+        self.elapsed = elapsed
+        self.delay = delay
+        self.exception = exception
+
+    def __repr__(self) -> str:
+        return (
+            f"RetryEvent({self.name!r}, attempt={self.attempt}/{self.tries}, outcome={self.outcome!r},"
+            f" elapsed={self.elapsed:.3f}, delay={self.delay:.3f}, exception={self.exception!r})"
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the event as a dict that ``json`` can dump, with the exception as its ``repr``."""
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields["exception"] = None if self.exception is None else repr(self.exception)
+        return fields
+
+
+class RetryStats:
+    """Count the attempts of the calls to a retried function, to size its timeouts and budgets from data.
+
+    ``retry`` keeps one per decorated function, as its ``retry_stats`` attribute and in
+    ``dump_retry_stats()``. The counters are thread-safe.
+
+    ex::
+
+        >>> stats = RetryStats("fetch")
+        >>> for outcome, attempt, delay in [("success", 1, 0), ("retry", 1, 0.5), ("success", 2, 0)]:
+        ...     stats.record(outcome, attempt, delay)
+        >>> stats
+        RetryStats('fetch', calls=2, attempts=3, first_try_successes=1, successes=2, failures=0, sleep_seconds=0.500)
+
+    :param name: the name of the retried function, or of the retry loop.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __repr__(self) -> str:
+        counters = ", ".join(f"{name}={value}" for name, value in self.to_dict().items() if name != "sleep_seconds")
+        return f"RetryStats({self.name!r}, {counters}, sleep_seconds={self.sleep_seconds:.3f})"
+
+    def reset(self) -> None:
+        """Set the counters to zero."""
+        with self._lock:
+            self.calls = 0  # the calls that succeeded or failed for good
+            self.attempts = 0
+            self.first_try_successes = 0
+            self.successes = 0
+            self.failures = 0
+            self.sleep_seconds = 0.0  # the delays before retrying, i.e. the latency added by retries
+
+    def record(self, outcome: str, attempt: int, delay: float = 0.0) -> None:
+        """Count an attempt.
+
+        :param outcome: ``RetryEvent.SUCCESS``, ``RETRY`` or ``FAILURE``.
+        :param attempt: the number of the attempt, from 1.
+        :param delay: the seconds before the next attempt.
+        """
+        with self._lock:
+            self.attempts += 1
+            if outcome == RetryEvent.RETRY:
+                self.sleep_seconds += delay
+                return
+            self.calls += 1
+            if outcome == RetryEvent.SUCCESS:
+                self.successes += 1
+                self.first_try_successes += attempt == 1
+            else:
+                self.failures += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the counters by name."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "first_try_successes": self.first_try_successes,
+                "successes": self.successes,
+                "failures": self.failures,
+                "sleep_seconds": self.sleep_seconds,
+            }
+
+
+# the stats of the retried functions and loops by name, see `get_retry_stats`
+_retry_stats: Dict[str, RetryStats] = {}
+_retry_stats_lock = threading.Lock()
+
+
+def get_retry_stats(name: str) -> RetryStats:
+    """Return the ``RetryStats`` of a name, shared by the whole process, created on the first call.
+
+    :param name: the name of the retried function, e.g. ``"module.function"``, or of a retry loop.
+    """
+    with _retry_stats_lock:
+        stats = _retry_stats.get(name)
+        if stats is None:
+            stats = _retry_stats[name] = RetryStats(name)
+        return stats
+
+
+def dump_retry_stats() -> Dict[str, Dict[str, Any]]:
+    """Return the counters of every retried function and named retry loop, e.g. for ``json.dump``."""
+    with _retry_stats_lock:
+        stats = list(_retry_stats.values())
+    return {s.name: s.to_dict() for s in stats}
+
+
+class _Attempts:
+    """Decide, after each failed attempt of one call, whether to retry and after what delay.
+
+    :param tries: the largest number of attempts.
+    :param backoff: the delay before each retry.
+    :param max_delay: the largest delay, or ``None``.
+    :param deadline: the seconds from the first attempt after which no retry starts, or ``None``.
+    :param retry_if: a predicate on the exceptions that are retried, or ``None`` for all of them.
+    :param retry_if_result: a predicate on the results that are retried, or ``None`` for none of them.
+    :param error: the exceptions that are retried by a retry loop, the decorators catch them themselves.
+    :param budget: the ``RetryBudget`` that allows each retry, and where each success is deposited, or ``None``.
+    :param stats: the ``RetryStats`` counting each attempt, or ``None``.
+    :param on_attempt: the hook called with a ``RetryEvent`` after each attempt, or ``None``.
+    :param name: the name of the call in the events.
+    """
+
+    def __init__(
+        self,
+        tries: int,
+        backoff: Backoff,
+        max_delay: Optional[float] = None,
+        deadline: Optional[float] = None,
+        retry_if: Optional[Callable[[BaseException], bool]] = None,
+        retry_if_result: Optional[Callable[[Any], bool]] = None,
+        error: Errors = Exception,
+        budget: Optional[RetryBudget] = None,
+        stats: Optional[RetryStats] = None,
+        on_attempt: Optional[Callable[[RetryEvent], None]] = None,
+        name: str = "",
+    ):
+        self.tries = tries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_if = retry_if
+        self.retry_if_result = retry_if_result
+        self.budget = budget
+        self.stats = stats
+        self.on_attempt = on_attempt
+        self.name = name
+        # the state of a retry loop, where the attempts are driven by the iterator and ended by `RetryAttempt`
+        self.error = error
+        self.done = False
+        self.next_delay = 0.0
+        self.attempt = 0  # the number of the current attempt, from 1
+        self.delay = 0.0  # the previous delay
+        self.last_exception: Optional[BaseException] = None
+        self.time_begin = time.monotonic()
+
+    def __iter__(self):
+        """Count the attempts, as many as allowed."""
+        while self.attempt < self.tries:
+            self.attempt += 1
+            yield self.attempt
+
+    @property
+    def elapsed(self) -> float:
+        """The seconds since the first attempt."""
+        return time.monotonic() - self.time_begin
+
+    def caught(self, error: BaseException) -> Optional[float]:
+        """Return the delay before retrying after the current attempt raised ``error``, or ``None`` to raise it."""
+        self.last_exception = error
+        # fail fast on an open circuit: retrying could only wait for the same answer
+        if isinstance(error, CircuitOpenError) or (self.retry_if is not None and not self.retry_if(error)):
+            self.emit(RetryEvent.FAILURE, exception=error)
+            return None
+        return self.failed("caught %s", error, error)
+
+    def returned(self, result: Any) -> Optional[float]:
+        """Return the delay before retrying after the current attempt returned ``result``, or ``None`` to return it."""
+        if self.retry_if_result is None or not self.retry_if_result(result):
+            self.succeeded()
+            return None
+        return self.failed("got %r", result)
+
+    def succeeded(self) -> None:
+        """Record that the current attempt succeeded."""
+        if self.budget is not None:
+            self.budget.deposit()
+        self.emit(RetryEvent.SUCCESS)
+
+    def emit(self, outcome: str, delay: float = 0.0, exception: Optional[BaseException] = None) -> None:
+        """Count the outcome of the current attempt, and give it to the hook, whose errors are only logged."""
+        if self.stats is not None:
+            self.stats.record(outcome, self.attempt, delay)
+        if self.on_attempt is not None:
+            event = RetryEvent(self.name, self.attempt, self.tries, outcome, self.elapsed, delay, exception)
+            try:
+                self.on_attempt(event)
+            except Exception:
+                logger.exception("failed to handle %r", event)
+
+    def failed(self, message: str, arg: Any, exception: Optional[BaseException] = None) -> Optional[float]:
+        """Record that the current attempt failed, and return the delay before the next one, or ``None`` to give up.
+
+        :param message: the format of what went wrong, e.g. ``"caught %s"``.
+        :param arg: the argument of ``message``, the exception or the result.
+        :param exception: the exception raised by the attempt, or ``None`` for a result.
+        """
+        delay = self._next_delay(message, arg)
+        if delay is None:
+            self.emit(RetryEvent.FAILURE, exception=exception)
+        else:
+            self.emit(RetryEvent.RETRY, delay, exception)
+        return delay
+
+    def _next_delay(self, message: str, arg: Any) -> Optional[float]:
+        """Log whether the current attempt is retried, and return the delay before the next one, or ``None``."""
+        if self.attempt >= self.tries:
+            logger.error(message + " - aborting %d / %d ...", arg, self.attempt, self.tries)
+            return None
+        delay = self.backoff(self.attempt, self.delay)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        if self.deadline is not None and self.elapsed + delay > self.deadline:
+            logger.error(
+                message + " - aborting %d / %d, the deadline of %.3f seconds would be exceeded ...",
+                arg,
+                self.attempt,
+                self.tries,
+                self.deadline,
+            )
+            return None
+        if self.budget is not None and not self.budget.withdraw():
+            logger.error(
+                message + " - aborting %d / %d, the retry budget is exhausted ...", arg, self.attempt, self.tries
+            )
+            return None
+        logger.warning(message + " - retrying %d / %d ...", arg, self.attempt, self.tries)
+        self.delay = delay
+        return delay
+
 
 # FIXME default value for error?
-# FIXME support multiple exceptions in tuple? Union[Type[Exception], Tuple[Type[Exception], ...]]
 # FIXME support logger as parameter?
-def retry(error: Type[Exception], tries: int, delay: float = 0.0):
+def retry(
+    error: Errors,
+    tries: int,
+    delay: float = 0.0,
+    backoff: Optional[Backoff] = None,
+    max_delay: Optional[float] = None,
+    deadline: Optional[float] = None,
+    retry_if: Optional[Callable[[BaseException], bool]] = None,
+    retry_if_result: Optional[Callable[[Any], bool]] = None,
+    budget: Optional[RetryBudget] = None,
+    on_attempt: Optional[Callable[[RetryEvent], None]] = None,
+):
+    """Call the decorated function again when it raises ``error``, up to ``tries`` times in all.
+
+    Every retry is logged as a warning, and giving up as an error; then the exception of the last
+    attempt reaches the caller. With ``retry_if_result``, a result can be a failure too, and the
+    last result is returned when giving up.
+
+    A coroutine function is retried when awaiting it raises, and waits with ``asyncio.sleep``,
+    so that the event loop runs other tasks in the meantime.
+
+    ex::
+
+        @retry((ConnectionError, TimeoutError), tries=5, backoff=FullJitterBackoff(0.1), max_delay=2, deadline=10)
+        def fetch(url):
+            ...
+
+    :param error: the type of the exceptions that are retried, or a tuple of types.
+    :param tries: the largest number of attempts, at least 1.
+    :param delay: the seconds to wait before every retry, without ``backoff``.
+    :param backoff: the ``Backoff`` computing the delay before each retry.
+    :param max_delay: the largest delay before a retry.
+    :param deadline: the seconds from the first attempt beyond which no retry is started: when the delay
+                     before the next attempt would exceed it, the last failure is final.
+    :param retry_if: a predicate on the caught exception, which is raised at once when it is false.
+    :param retry_if_result: a predicate on the result, which is retried when it is true, e.g. ``lambda r: r is None``.
+    :param budget: the ``RetryBudget`` that must allow every retry, e.g. ``shared_budget()``, and that every
+                   success replenishes.
+    :param on_attempt: a hook called with a ``RetryEvent`` after every attempt, e.g. to export it; its
+                       exceptions are logged and ignored.
+    """
+    backoff_or_delay = backoff if backoff is not None else ConstantBackoff(delay)
+
     def decorate(func: Callable[P, R]) -> Callable[P, R]:
+        name = f"{func.__module__}.{getattr(func, '__qualname__', repr(func))}"
+        stats = get_retry_stats(name)
+        # makes the attempts of each call, with the options of the decorator
+        new_attempts = functools.partial(
+            _Attempts,
+            tries,
+            backoff_or_delay,
+            max_delay,
+            deadline,
+            retry_if,
+            retry_if_result,
+            budget=budget,
+            stats=stats,
+            on_attempt=on_attempt,
+            name=name,
+        )
+        if inspect.iscoroutinefunction(func):
+            return _retry_async(func, error, tries, new_attempts, stats)
+
         # preserves metadata (name, stack, etc.) of func when decorated
         @functools.wraps(func)
         def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
-            for i in range(1, tries+1):
+            attempts = new_attempts()
+            for _ in attempts:
                 try:
-                    return func(*args, **kwargs)
+                    result = func(*args, **kwargs)
                 except error as e:
-                    if i >= tries:
-                        logger.error("caught %s - aborting %d / %d ...", e, i, tries)
-                        raise  # last attempt: the caller gets the exception
-                    logger.warning("caught %s - retrying %d / %d ...", e, i, tries)
-                    if delay > 0:
-                        time.sleep(delay)
+                    next_delay = attempts.caught(e)
+                    if next_delay is None:
+                        raise  # last attempt, or not to be retried: the caller gets the exception
+                else:
+                    next_delay = attempts.returned(result)
+                    if next_delay is None:
+                        return result
+                if next_delay > 0:
+                    time.sleep(next_delay)
             raise ValueError(f"tries must be at least 1, got {tries}")
+
+        wrapper.retry_stats = stats  # type: ignore[attr-defined]
         return wrapper
+
     return decorate
 
 
-class RetryContext:
+def _retry_async(
+    func: Callable, error: Errors, tries: int, new_attempts: Callable[[], _Attempts], stats: RetryStats
+) -> Callable:
+    """Wrap the coroutine function ``func`` like ``retry`` does, sleeping with ``asyncio.sleep``."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        attempts = new_attempts()
+        for _ in attempts:
+            try:
+                result = await func(*args, **kwargs)
+            except error as e:
+                next_delay = attempts.caught(e)
+                if next_delay is None:
+                    raise
+            else:
+                next_delay = attempts.returned(result)
+                if next_delay is None:
+                    return result
+            # sleep even for no delay, to let other tasks run between attempts
+            await asyncio.sleep(next_delay)
+        raise ValueError(f"tries must be at least 1, got {tries}")
 
-    def __init__(self, success: Callable, attempt: int):
-        self._success = success
-        self._attempt = attempt
+    wrapper.retry_stats = stats  # type: ignore[attr-defined]
+    return wrapper
 
-    def __enter__(self):
-        pass
 
-    def __exit__(self, exc_type, exc_value, traceback):
-        if exc_value:
-            logger.warning("failed attempt %d", self._attempt)
-        else:
-            self._success()
-        return True  # FIXME swallow exception?
+class RetryAttempt:
+    """One attempt of the body of a retry loop, as a context-manager around it.
+
+    An exception raised in the body is caught when it is to be retried, so that the loop goes on
+    to the next attempt, and it propagates on the last attempt, or past the deadline. Exceptions
+    that are not ``Exception``, like ``KeyboardInterrupt`` or the ``CancelledError`` of asyncio,
+    always propagate. The loop stops after the first attempt whose body does not raise.
+
+    The body can read the ``number`` of the attempt, the seconds ``elapsed`` since the first one,
+    and the ``last_exception`` raised by the previous one, ``None`` for the first attempt.
+
+    :param attempts: the attempts of the loop.
+    :param number: the number of this attempt, from 1.
+    """
+
+    def __init__(self, attempts: "_Attempts", number: int):
+        self._attempts = attempts
+        self.number = number
+        self.last_exception = attempts.last_exception
+
+    def __repr__(self) -> str:
+        return f"RetryAttempt(number={self.number}, elapsed={self.elapsed:.3f}, last_exception={self.last_exception!r})"
+
+    @property
+    def elapsed(self) -> float:
+        """The seconds since the first attempt began."""
+        return self._attempts.elapsed
+
+    def __enter__(self) -> "RetryAttempt":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        attempts = self._attempts
+        if exc_value is None:
+            attempts.done = True
+            attempts.succeeded()
+            return False
+        if not isinstance(exc_value, attempts.error) or not isinstance(exc_value, Exception):
+            return False
+        next_delay = attempts.caught(exc_value)
+        if next_delay is None:
+            attempts.done = True
+            return False  # last attempt, or not to be retried: the exception propagates
+        attempts.next_delay = next_delay
+        return True
+
+
+# the context-manager of each attempt of a `RetryIterator`, by its former name
+RetryContext = RetryAttempt
 
 
 class RetryIterator:
-    def __init__(self, attempts: int):
-        self._max_attempts = attempts
-        self._success = False
+    """Retry the body of a ``for`` loop, like ``retry`` does for a function.
 
-    def __iter__(self):
-        for i in range(self._max_attempts):
-            yield RetryContext(self.succeed, i+1)
-            if self._success:
-                break
-            else:
-                logger.warning("caught something - retrying %d / %d ...", i+1, self._max_attempts)
+    ex::
+
+        for attempt in RetryIterator(attempts=5, error=ConnectionError, backoff=FullJitterBackoff(0.1)):
+            with attempt:
+                response = fetch(url)
+
+    Each attempt tells its ``number``, the seconds ``elapsed`` since the first one, and the
+    ``last_exception`` of the previous one. The exception of the last attempt is raised, so the
+    code after the loop runs only after a success.
+
+    :param attempts: the largest number of attempts, at least 1.
+    :param error: the type of the exceptions that are retried, or a tuple of types; others propagate at once.
+    :param backoff: the ``Backoff`` computing the delay before each retry, none by default.
+    :param max_delay: the largest delay before a retry.
+    :param deadline: the seconds from the first attempt beyond which no retry is started.
+    :param retry_if: a predicate on the caught exception, which is raised at once when it is false.
+    :param budget: the ``RetryBudget`` that must allow every retry, and that every success replenishes.
+    :param on_attempt: a hook called with a ``RetryEvent`` after every attempt.
+    :param name: the name of the loop in the events, and in ``dump_retry_stats()`` when given.
+    """
+
+    def __init__(
+        self,
+        attempts: int,
+        error: Errors = Exception,
+        backoff: Optional[Backoff] = None,
+        max_delay: Optional[float] = None,
+        deadline: Optional[float] = None,
+        retry_if: Optional[Callable[[BaseException], bool]] = None,
+        budget: Optional[RetryBudget] = None,
+        on_attempt: Optional[Callable[[RetryEvent], None]] = None,
+        name: Optional[str] = None,
+    ):
+        if attempts < 1:
+            raise ValueError(f"attempts must be at least 1, got {attempts}")
+        backoff = backoff if backoff is not None else ConstantBackoff(0.0)
+        stats = get_retry_stats(name) if name is not None else None
+        self._attempts = _Attempts(
+            attempts, backoff, max_delay, deadline, retry_if, None, error, budget, stats, on_attempt, name or ""
+        )
+
+    def __iter__(self) -> Iterator[RetryAttempt]:
+        attempts = self._attempts
+        while not attempts.done and attempts.attempt < attempts.tries:
+            if attempts.attempt > 0 and attempts.next_delay > 0:
+                time.sleep(attempts.next_delay)
+            attempts.attempt += 1
+            yield RetryAttempt(attempts, attempts.attempt)
+
+    def succeed(self) -> None:
+        """Stop after the current attempt, which is also what happens when its body does not raise."""
+        self._attempts.done = True
+
+
+class AsyncRetryIterator:
+    """Retry the body of an ``async for`` loop, waiting between attempts with ``asyncio.sleep``.
+
+    ex::
+
+        async for attempt in AsyncRetryIterator(5, error=ConnectionError, backoff=FullJitterBackoff(0.1)):
+            with attempt:
+                response = await fetch(url)
+
+    A task waiting for its next attempt only holds a timer of the event loop, so thousands of
+    them cost next to nothing, and cancelling it interrupts the wait at once.
+
+    The arguments are the same as those of ``RetryIterator``, in the same order.
+
+    :param attempts: the largest number of attempts, at least 1.
+    :param error: the type of the exceptions that are retried, or a tuple of types; others propagate at once.
+    :param backoff: the ``Backoff`` computing the delay before each retry, none by default.
+    :param max_delay: the largest delay before a retry.
+    :param deadline: the seconds from the first attempt beyond which no retry is started.
+    :param retry_if: a predicate on the caught exception, which is raised at once when it is false.
+    :param budget: the ``RetryBudget`` that must allow every retry, and that every success replenishes.
+    :param on_attempt: a hook called with a ``RetryEvent`` after every attempt.
+    :param name: the name of the loop in the events, and in ``dump_retry_stats()`` when given.
+    """
+
+    def __init__(
+        self,
+        attempts: int,
+        error: Errors = Exception,
+        backoff: Optional[Backoff] = None,
+        max_delay: Optional[float] = None,
+        deadline: Optional[float] = None,
+        retry_if: Optional[Callable[[BaseException], bool]] = None,
+        budget: Optional[RetryBudget] = None,
+        on_attempt: Optional[Callable[[RetryEvent], None]] = None,
+        name: Optional[str] = None,
+    ):
+        if attempts < 1:
+            raise ValueError(f"attempts must be at least 1, got {attempts}")
+        backoff = backoff if backoff is not None else ConstantBackoff(0.0)
+        stats = get_retry_stats(name) if name is not None else None
+        self._attempts = _Attempts(
+            attempts, backoff, max_delay, deadline, retry_if, None, error, budget, stats, on_attempt, name or ""
+        )
+
+    def __aiter__(self) -> "AsyncRetryIterator":
+        return self
+
+    async def __anext__(self) -> RetryAttempt:
+        attempts = self._attempts
+        if attempts.done or attempts.attempt >= attempts.tries:
+            raise StopAsyncIteration
+        if attempts.attempt > 0:
+            await asyncio.sleep(attempts.next_delay)
+        attempts.attempt += 1
+        return RetryAttempt(attempts, attempts.attempt)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling through a ``CircuitBreaker`` that is open.
+
+    :param name: the name of the circuit-breaker.
+    :param retry_after: the seconds until the circuit-breaker lets a call through again.
+    """
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"circuit {name!r} is open, retry after {retry_after:.3f} seconds")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Reject calls at once while a service fails, instead of waiting for each of them to fail.
+
+    The breaker is *closed* at first: calls go through, and their outcomes are kept in a sliding
+    window of the last ``window`` calls. When at least ``min_calls`` are in the window and the
+    share of failures reaches ``failure_rate``, the breaker *opens*: every call raises
+    ``CircuitOpenError`` without being made. After ``cooldown`` seconds it is *half-open*: up to
+    ``half_open_calls`` calls go through as probes; it closes again when they all succeed, and
+    opens again as soon as one fails.
+
+    Only exceptions of type ``error`` are failures; other exceptions propagate without counting.
+    The breaker is thread-safe, and it can be used by asyncio tasks: it never blocks.
+
+    ex::
+
+        breaker = CircuitBreaker(failure_rate=0.5, window=20, cooldown=30, name="database")
+
+        @retry(ConnectionError, tries=3)  # CircuitOpenError is never retried
+        @breaker
+        def query(sql):
+            ...
+
+        with breaker:
+            connection.execute(sql)
+
+    see: https://martinfowler.com/bliki/CircuitBreaker.html
+
+    :param failure_rate: the share of failures in the window that opens the breaker.
+    :param window: the number of the last calls whose outcomes are kept.
+    :param min_calls: the number of calls in the window below which the breaker does not open.
+    :param cooldown: the seconds for which the breaker stays open.
+    :param half_open_calls: the number of probe calls let through when half-open.
+    :param error: the type of the exceptions that are failures, or a tuple of types.
+    :param name: the name of the breaker, in messages.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        window: int = 20,
+        min_calls: int = 10,
+        cooldown: float = 30.0,
+        half_open_calls: int = 1,
+        error: Errors = Exception,
+        name: str = "",
+    ):
+        if not 0 < failure_rate <= 1:
+            raise ValueError(f"failure_rate must be in ]0, 1], got {failure_rate}")
+        if window < 1 or half_open_calls < 1:
+            raise ValueError(f"window and half_open_calls must be at least 1, got {window} and {half_open_calls}")
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.half_open_calls = half_open_calls
+        self.error = error
+        self.name = name
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._outcomes: Deque[bool] = collections.deque(maxlen=window)  # True for a failure
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0  # the probe calls in progress, of the current half-open window
+        self._probe_successes = 0
+        self._half_opens = 0  # the number of the current half-open window, that each probe is let through in
+        # the half-open window of each call in progress in the `with` blocks of the current thread or task,
+        # `None` for a call that is not a probe
+        self._context_probes: contextvars.ContextVar[Tuple[Optional[int], ...]] = contextvars.ContextVar(
+            f"CircuitBreaker({name!r})", default=()
+        )
+        # counters
+        self.rejected = 0
+
+    def __repr__(self) -> str:
+        return f"CircuitBreaker({self.name!r}, state={self.state!r}, rejected={self.rejected})"
+
+    @property
+    def state(self) -> str:
+        """``CLOSED``, ``OPEN`` or ``HALF_OPEN``."""
+        with self._lock:
+            self._update()
+            return self._state
+
+    def _update(self) -> None:
+        """Go from open to half-open once the cooldown is over. Called with the lock held."""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            logger.info("circuit %r is half-open", self.name)
+            self._state = self.HALF_OPEN
+            self._half_opens += 1
+            self._probes = 0
+            self._probe_successes = 0
+
+    def _open(self) -> None:
+        """Open the breaker. Called with the lock held."""
+        logger.warning("circuit %r is open for %.3f seconds", self.name, self.cooldown)
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+
+    def _before(self) -> Optional[int]:
+        """Let a call through, or raise ``CircuitOpenError``; return the half-open window of a probe, else ``None``."""
+        with self._lock:
+            self._update()
+            if self._state == self.CLOSED:
+                return None
+            if self._state == self.HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return self._half_opens
+            self.rejected += 1
+            retry_after = max(0.0, self._opened_at + self.cooldown - time.monotonic())
+        raise CircuitOpenError(self.name, retry_after)
+
+    def _after(self, probe: Optional[int], failed: Optional[bool]) -> None:
+        """Record the outcome of a call: failed, succeeded, or ``None`` when it raised something else."""
+        with self._lock:
+            if probe is not None:
+                if probe != self._half_opens:
+                    return  # a probe of an earlier half-open window, whose slot is already gone
+                self._probes -= 1
+                if self._state != self.HALF_OPEN or failed is None:
+                    return  # another probe already decided
+                if failed:
+                    self._open()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    logger.info("circuit %r is closed", self.name)
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                    self._failures = 0
+                return
+            if failed is None or self._state != self.CLOSED:
+                return
+            if len(self._outcomes) == self._outcomes.maxlen:
+                self._failures -= self._outcomes[0]
+            self._outcomes.append(failed)
+            self._failures += failed
+            if len(self._outcomes) >= self.min_calls and self._failures >= self.failure_rate * len(self._outcomes):
+                self._open()
+
+    def _outcome(self, exc_value: Optional[BaseException]) -> Optional[bool]:
+        """Whether an exception is a failure, ``None`` for an exception that does not count."""
+        if exc_value is None:
+            return False
+        return True if isinstance(exc_value, self.error) else None
+
+    def __enter__(self) -> "CircuitBreaker":
+        probe = self._before()
+        self._context_probes.set(self._context_probes.get() + (probe,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        probes = self._context_probes.get()
+        self._context_probes.set(probes[:-1])
+        self._after(probes[-1], self._outcome(exc_value))
+
+    async def __aenter__(self) -> "CircuitBreaker":
+        return self.__enter__()
 
-    def succeed(self):
-        self._success = True
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        self.__exit__(exc_type, exc_value, traceback)
+
+    def __call__(self, func: Callable) -> Callable:
+        """Decorate a function, or a coroutine function, so that it is called through the breaker."""
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                probe = self._before()
+                try:
+                    result = await func(*args, **kwargs)
+                except BaseException as e:
+                    self._after(probe, self._outcome(e))
+                    raise
+                self._after(probe, False)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            probe = self._before()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                self._after(probe, self._outcome(e))
+                raise
+            self._after(probe, False)
+            return result
+
+        return wrapper
+
+
+class HedgeDelay:
+    """The delay after which ``hedge`` starts another attempt: a quantile of the recent latencies.
+
+    Until ``min_samples`` latencies are known, the delay is ``initial``. With the default 95th
+    percentile, about one call in twenty is hedged, which cuts the tail latency for about 5% more load.
+
+    ex::
+
+        >>> delay = HedgeDelay(quantile=0.5, window=4, initial=1.0, min_samples=2)
+        >>> delay()
+        1.0
+        >>> for seconds in (0.1, 0.2, 0.3, 0.4, 0.5):
+        ...     delay.add(seconds)
+        >>> delay()  # the median of the last 4
+        0.4
+
+    :param quantile: the quantile of the latencies, e.g. 0.95 for p95.
+    :param window: the number of the last latencies that are kept.
+    :param initial: the delay in seconds until ``min_samples`` latencies are known.
+    :param min_samples: the number of latencies needed to adapt the delay.
+    :param min_delay: the smallest delay in seconds, to bound the extra load when latencies are tiny.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        window: int = 100,
+        initial: float = 0.1,
+        min_samples: int = 10,
+        min_delay: float = 0.0,
+    ):
+        if not 0.0 <= quantile <= 1.0:
+            raise ValueError(f"quantile must be between 0 and 1, got {quantile}")
+        self.quantile = quantile
+        self.initial = initial
+        self.min_samples = max(1, min_samples)
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = collections.deque(maxlen=window)
+
+    def __repr__(self) -> str:
+        return f"HedgeDelay(quantile={self.quantile}, delay={self():.3f})"
+
+    def add(self, seconds: float) -> None:
+        """Record the latency of a call, from its start to its first result."""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def __call__(self) -> float:
+        """Return the delay in seconds."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.initial
+            latencies = sorted(self._latencies)
+        return max(self.min_delay, latencies[min(len(latencies) - 1, int(self.quantile * len(latencies)))])
+
+
+_hedge_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """Return the thread pool shared by the hedged functions, created on first use."""
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="hedge")
+        return _hedge_executor
+
+
+def hedge(
+    after: Union[float, HedgeDelay, None] = None,
+    max_parallel: int = 2,
+    executor: Optional[concurrent.futures.Executor] = None,
+):
+    """Start another attempt of the decorated function when the first one is slow, and return the first result.
+
+    This cuts the tail latency of idempotent calls, like reads: instead of waiting for a slow attempt
+    to fail before retrying, a second attempt runs alongside it after ``after`` seconds, then a third
+    one, and so on up to ``max_parallel`` attempts. The first attempt to return wins, and the others
+    are cancelled. An attempt that raises does not start another one: the exception reaches the caller
+    when no attempt is left running. Retries are the job of ``retry``, which can wrap a hedged function.
+
+    A function runs in a thread pool, where an attempt that already started cannot be stopped:
+    the loser runs to completion, and its result is dropped. A coroutine function runs as asyncio
+    tasks, and the loser is cancelled.
+
+    ex::
+
+        @retry(ConnectionError, tries=3)
+        @hedge(HedgeDelay(quantile=0.95), max_parallel=2)
+        def get(key):
+            ...
+
+    :param after: the seconds before starting another attempt, or a ``HedgeDelay`` that adapts them to the
+                  latencies of the function; by default, a new ``HedgeDelay()``.
+    :param max_parallel: the largest number of attempts running at once, 1 to never hedge.
+    :param executor: the executor where the attempts of a function run, by default a thread pool shared by
+                     every hedged function.
+    """
+    if max_parallel < 1:
+        raise ValueError(f"max_parallel must be at least 1, got {max_parallel}")
+    if after is None:
+        after = HedgeDelay()
+    delay: Callable[[], float] = after if isinstance(after, HedgeDelay) else lambda: after
+
+    # the latency of the whole call: the first attempt's when it wins, else a lower bound of it, at least the delay,
+    # so that hedged calls do not pull the quantile down to the latency of the attempts that beat a slow one
+    def record(seconds: float) -> None:
+        if isinstance(after, HedgeDelay):
+            after.add(seconds)
+
+    def decorate(func: Callable[P, R]) -> Callable[P, R]:
+        if inspect.iscoroutinefunction(func):
+            return _hedge_async(func, delay, record, max_parallel)
+
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            pool = executor if executor is not None else _get_hedge_executor()
+            call = functools.partial(func, *args, **kwargs)
+            start = time.monotonic()
+            # each attempt runs in a copy of the context of the caller, as if called directly
+            pending = {pool.submit(contextvars.copy_context().run, call)}
+            launched = 1
+            error: Optional[BaseException] = None
+            try:
+                while pending:
+                    timeout = delay() if launched < max_parallel else None
+                    done, pending = concurrent.futures.wait(
+                        pending, timeout, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        error = future.exception()
+                        if error is None:
+                            record(time.monotonic() - start)
+                            return future.result()
+                    if not done:
+                        launched += 1
+                        logger.debug("hedging %s after %.3f seconds - attempt %d", func.__qualname__, timeout, launched)
+                        pending.add(pool.submit(contextvars.copy_context().run, call))
+                raise error  # type: ignore[misc]
+            finally:
+                for future in pending:
+                    future.cancel()
+
+        return wrapper
+
+    return decorate
+
+
+def _hedge_async(func: Callable, delay: Callable[[], float], record: Callable[[float], None], max_parallel: int):
+    """Wrap the coroutine function ``func`` like ``hedge`` does, with an asyncio task per attempt."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.monotonic()
+        pending = {asyncio.ensure_future(func(*args, **kwargs))}
+        launched = 1
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                timeout = delay() if launched < max_parallel else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        record(time.monotonic() - start)
+                        return task.result()
+                if not done:
+                    launched += 1
+                    logger.debug("hedging %s after %.3f seconds - attempt %d", func.__qualname__, timeout, launched)
+                    pending.add(asyncio.ensure_future(func(*args, **kwargs)))
+            raise error  # type: ignore[misc]
+        finally:
+            # cancel the losers, and wait for them to handle it
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    return wrapper
 
 
 def main() -> None:
@@ -99,14 +1184,37 @@ def main() -> None:
         return flaky_func()
 
     print(test_func())
+    print(test_func.retry_stats)
 
     # test context-manager
 
-    flaky_func = flaky(30)
+    flaky_func = flaky(3)
 
-    for attempt in RetryIterator(attempts=5):
+    for attempt in RetryIterator(attempts=5, error=RuntimeError, backoff=ExponentialBackoff(0.1)):
         with attempt:
-            print(flaky_func())
+            print(attempt, flaky_func())
+
+    # test async iterator
+
+    flaky_func = flaky(2)
+
+    async def test_async() -> None:
+        async for attempt in AsyncRetryIterator(3, error=RuntimeError, backoff=ExponentialBackoff(0.1)):
+            with attempt:
+                print(flaky_func())
+
+    asyncio.run(test_async())
+
+    # test hedging: the first attempt is slow, the second one wins
+
+    slow = iter([0.5, 0.01])
+
+    @hedge(after=0.05)
+    def test_hedge() -> str:
+        time.sleep(next(slow))
+        return "fast"
+
+    print(test_hedge())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+"""Unit-tests for just.atomic"""
+
+# standard imports
+import os
+import stat
+import tempfile
+import unittest
+
+# tested imports
+from just.atomic import atomic_open
+
+
+class TestAtomicOpen(unittest.TestCase):
+    """test for `just.atomic.atomic_open`"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, "file.txt")
+        with open(self.file_path, "w") as file:
+            file.write("old")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_replace(self):
+        """the file is replaced on exit, and not before"""
+        with atomic_open(self.file_path, "w") as file:
+            file.write("new")
+            with open(self.file_path) as current:
+                self.assertEqual(current.read(), "old")
+        with open(self.file_path) as current:
+            self.assertEqual(current.read(), "new")
+        self.assertEqual(os.listdir(self.temp_dir.name), ["file.txt"])
+
+    def test_binary(self):
+        with atomic_open(self.file_path, "wb") as file:
+            file.write(b"\x00\x01")
+        with open(self.file_path, "rb") as current:
+            self.assertEqual(current.read(), b"\x00\x01")
+
+    def test_error(self):
+        """the file is untouched when the body raises, and the temporary file is deleted"""
+        with self.assertRaises(RuntimeError):
+            with atomic_open(self.file_path, "w") as file:
+                file.write("new")
+                raise RuntimeError("failed write")
+        with open(self.file_path) as current:
+            self.assertEqual(current.read(), "old")
+        self.assertEqual(os.listdir(self.temp_dir.name), ["file.txt"])
+
+    def test_mode(self):
+        for mode in ("r", "a", "w+", "rb"):
+            with self.subTest(mode=mode):
+                with self.assertRaises(ValueError):
+                    with atomic_open(self.file_path, mode):
+                        pass
+
+    def test_permissions(self):
+        """the replaced file keeps its permissions, and a new file gets those of `open()`"""
+        os.chmod(self.file_path, 0o640)
+        with atomic_open(self.file_path, "w") as file:
+            file.write("new")
+        self.assertEqual(stat.S_IMODE(os.stat(self.file_path).st_mode), 0o640)
+
+        umask = os.umask(0o022)
+        try:
+            new_path = os.path.join(self.temp_dir.name, "new.txt")
+            with atomic_open(new_path, "w") as file:
+                file.write("new")
+        finally:
+            os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(new_path).st_mode), 0o644)
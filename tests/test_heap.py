@@ -45,6 +45,43 @@ class TestHeap(unittest.TestCase):
         h = Heap(HEAP_DATA)
         self.assertIs(h.heap, HEAP_DATA)
 
+    def test_data_copy(self):
+        """test Heap(data, copy=True) leaves data untouched"""
+        HEAP_DATA = ["ccc", "bb", "a"]
+        h = Heap(HEAP_DATA, copy=True)
+        self.assertIsNot(h.heap, HEAP_DATA)
+        self.assertEqual(HEAP_DATA, ["ccc", "bb", "a"])
+        self.assertEqual(h.pop(), "a")
+        self.assertEqual(len(HEAP_DATA), 3)
+
+    def test_specialized(self):
+        """test Heap() picks a subclass by whether there is a key"""
+        self.assertIsInstance(Heap(), Heap)
+        self.assertIsInstance(Heap(key=len), Heap)
+        self.assertIsNot(type(Heap()), type(Heap(key=len)))
+
+    def test_subclass(self):
+        """test a subclass of Heap is constructed as it is, and works with or without a key"""
+
+        class CountingHeap(Heap):
+            pushes = 0
+
+            def push(self, item):
+                self.pushes += 1
+                super().push(item)
+
+        for key in (None, len):
+            with self.subTest(key=key):
+                h = CountingHeap(key=key)
+                self.assertIs(type(h), CountingHeap)
+                for item in ("ccc", "a", "bb"):
+                    h.push(item)
+                self.assertEqual(h.peek(), "a")
+                self.assertEqual(h.pushpop("dddd"), "a")
+                self.assertEqual(h.replace("a"), "bb")
+                self.assertEqual(h.pop(), "a")
+                self.assertEqual(h.pushes, 3)
+
     # FIXME should it raise TypeError anyway when empty?
     def test_data_bad(self):
         """test Heap(x) where x is non empty non list raises TypeError"""
@@ -1,6 +1,22 @@
+import array
+import gzip
+import heapq
+import itertools
+import math
+import os
+import random
+import tempfile
+import threading
 import unittest
+from unittest import mock
 
-from just.heap2 import Heap, KeyHeap
+from just import heap2
+from just.heap2 import ArrayHeap, DaryHeap, Heap, KeyHeap, PairingHeap, RadixHeap, SpillHeap, TopK, merge, merge_files
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # type: ignore[assignment]
 
 
 class TestHeap(unittest.TestCase):
@@ -150,3 +166,487 @@ class TestKeyHeap(unittest.TestCase):
         self.assertEqual(self.heap_test.pop(), "aaa")
         with self.assertRaises(IndexError):
             _ = self.heap_test.pop()
+
+
+class TestEngines(unittest.TestCase):
+    """Tests that the alternative heap engines behave like `just.heap2.Heap`, on a monotone trace."""
+
+    ENGINES = {
+        "DaryHeap(d=2)": lambda data: DaryHeap(data, d=2),
+        "DaryHeap(d=3)": lambda data: DaryHeap(data, d=3),
+        "DaryHeap(d=4)": DaryHeap,
+        "PairingHeap": PairingHeap,
+        "RadixHeap": RadixHeap,
+    }
+
+    def run_trace(self, make_heap):
+        """Apply the same random monotone operations to `make_heap` and to `Heap`, return both results."""
+        rng = random.Random(42)
+        data = [rng.randrange(100) for _ in range(50)]
+        heap = make_heap(data)
+        reference = Heap(data)
+        popped, expected = [], []
+        for _ in range(1000):
+            op = rng.choice(["push", "pop", "pushpop", "replace", "peek"])
+            if op == "push" or not reference:
+                item = (reference.peek() if reference else 0) + rng.randrange(100)
+                heap.push(item)
+                reference.push(item)
+            elif op == "pop":
+                popped.append(heap.pop())
+                expected.append(reference.pop())
+            elif op == "peek":
+                popped.append(heap.peek())
+                expected.append(reference.peek())
+            else:
+                item = reference.peek() + rng.randrange(100)
+                popped.append(getattr(heap, op)(item))
+                expected.append(getattr(reference, op)(item))
+            self.assertEqual(len(heap), len(reference))
+        while reference:
+            popped.append(heap.pop())
+            expected.append(reference.pop())
+        return popped, expected
+
+    def test_trace(self):
+        for name, make_heap in self.ENGINES.items():
+            with self.subTest(engine=name):
+                popped, expected = self.run_trace(make_heap)
+                self.assertEqual(popped, expected)
+
+    def test_empty(self):
+        for name, make_heap in self.ENGINES.items():
+            with self.subTest(engine=name):
+                heap = make_heap([])
+                self.assertFalse(heap)
+                for op in (heap.pop, heap.peek):
+                    with self.assertRaises(IndexError):
+                        op()
+                with self.assertRaises(IndexError):
+                    heap.replace(1)
+                self.assertEqual(heap.pushpop(1), 1)
+                self.assertFalse(heap)
+
+    def test_str(self):
+        self.assertEqual(str(DaryHeap([3, 1, 2])), "DaryHeap([1, 3, 2])")
+        self.assertEqual(str(PairingHeap([2, 1])), "PairingHeap([1, 2])")
+        self.assertEqual(str(RadixHeap([1, 0])), "RadixHeap([0, 1])")
+
+    def test_dary_invalid(self):
+        with self.assertRaises(ValueError):
+            DaryHeap([], d=1)
+
+    def test_radix_monotone(self):
+        heap = RadixHeap([10, 20])
+        self.assertEqual(heap.pop(), 10)
+        for op in (heap.push, heap.pushpop, heap.replace):
+            with self.assertRaises(ValueError):
+                op(5)
+        self.assertEqual(len(heap), 1)
+
+    def test_radix_peek_then_push(self):
+        heap = RadixHeap([5, 8])
+        self.assertEqual(heap.peek(), 5)
+        heap.push(3)
+        self.assertEqual([heap.pop() for _ in range(3)], [3, 5, 8])
+
+    def test_radix_pushpop_then_push(self):
+        heap = RadixHeap([10])
+        self.assertEqual(heap.pushpop(4), 4)
+        heap.push(4)
+        self.assertEqual([heap.pop(), heap.pop()], [4, 10])
+
+
+class TestArrayHeap(unittest.TestCase):
+    """Tests for class `just.heap2.ArrayHeap`, checked against `Heap` of `(key, id)` tuples."""
+
+    def test_order(self):
+        rng = random.Random(7)
+        keys = [rng.random() for _ in range(200)]
+        heap = ArrayHeap(keys)
+        reference = Heap(zip(keys, range(len(keys))))
+        for i in range(200):
+            key = rng.random()
+            heap.push(key, 1000 + i)
+            reference.push((key, 1000 + i))
+        for key in (0.5, 0.25):
+            self.assertEqual(heap.pushpop(key, -1), reference.pushpop((key, -1)))
+            self.assertEqual(heap.replace(key + 0.125, -2), reference.replace((key + 0.125, -2)))
+        self.assertEqual(heap.peek(), reference.peek())
+        popped = [heap.pop() for _ in range(len(heap))]
+        self.assertEqual(popped, [reference.pop() for _ in range(len(reference))])
+
+    def test_ids(self):
+        heap = ArrayHeap([3.0, 1.0, 2.0], ids=[30, 10, 20])
+        self.assertEqual(heap.peek(), (1.0, 10))
+        self.assertEqual(heap.pop(), (1.0, 10))
+
+    def test_bulk_build(self):
+        """the bulk build is a valid heap, with or without numpy, each id kept with its key"""
+        rng = random.Random(11)
+        keys = [float(rng.randrange(50)) for _ in range(500)]
+        ids = list(range(500))
+        for module in (heap2.numpy, None):
+            with self.subTest(numpy=module is not None), mock.patch.object(heap2, "numpy", module):
+                heap = ArrayHeap(keys, ids=ids)
+                popped = [heap.pop() for _ in range(len(heap))]
+                self.assertEqual([key for key, _ in popped], sorted(keys))
+                self.assertTrue(all(keys[ident] == key for key, ident in popped))
+
+    def test_buffers(self):
+        """entries are stored in typed arrays, 16 bytes each by default"""
+        heap = ArrayHeap(array.array("d", [2.0, 1.0]), ids=array.array("q", [2, 1]))
+        self.assertEqual(heap.nbytes, 32)
+        self.assertIsInstance(heap._keys, array.array)
+        self.assertEqual(heap.peek(), (1.0, 1))
+        small = ArrayHeap([2, 1], key_type="f", id_type="i")
+        self.assertEqual(small.nbytes, 16)
+
+    def test_mismatch(self):
+        with self.assertRaises(ValueError):
+            ArrayHeap([1.0, 2.0], ids=[1])
+
+    def test_empty(self):
+        heap = ArrayHeap()
+        self.assertFalse(heap)
+        with self.assertRaises(IndexError):
+            heap.pop()
+        with self.assertRaises(IndexError):
+            heap.peek()
+        self.assertEqual(heap.pushpop(1.0, 1), (1.0, 1))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        heap = ArrayHeap(numpy.array([3.0, 1.0, 2.0]), ids=numpy.array([3, 1, 2]))
+        self.assertEqual([heap.pop() for _ in range(3)], [(1.0, 1), (2.0, 2), (3.0, 3)])
+
+    def test_same_type(self):
+        """buffers of another type-code for the same C type are copied as raw bytes"""
+        self.assertTrue(ArrayHeap._same_type("d", "d"))
+        self.assertTrue(ArrayHeap._same_type("@q", "q"))
+        self.assertEqual(ArrayHeap._same_type("l", "q"), array.array("l").itemsize == 8)
+        self.assertFalse(ArrayHeap._same_type("Q", "q"))
+        self.assertFalse(ArrayHeap._same_type("q", "d"))
+        self.assertFalse(ArrayHeap._same_type("<q", "q"))
+
+
+class TestTopK(unittest.TestCase):
+    """Tests for class `just.heap2.TopK`."""
+
+    def test_items(self):
+        top = TopK(3)
+        top.extend([5, 1, 9, 3, 7, 2])
+        self.assertEqual(top.items(), [9, 7, 5])
+        self.assertEqual(len(top), 3)
+
+    def test_push(self):
+        top = TopK(2)
+        self.assertTrue(top.push(1))
+        self.assertTrue(top.push(3))
+        self.assertTrue(top.push(2))
+        self.assertFalse(top.push(0))
+        self.assertEqual(top.items(), [3, 2])
+
+    def test_key(self):
+        top = TopK(2, key=len)
+        top.extend(["a", "ccc", "bb", "dddd"])
+        self.assertEqual(top.items(), ["dddd", "ccc"])
+
+    def test_ties_keep_earliest(self):
+        top = TopK(2, key=len)
+        top.extend(["aa", "bb", "cc", "d"])
+        self.assertEqual(top.items(), ["aa", "bb"])
+
+    def test_unorderable_items(self):
+        """items with equal keys are never compared"""
+        top = TopK(2, key=lambda d: d["k"])
+        top.extend([{"k": 1}, {"k": 1}, {"k": 1}])
+        self.assertEqual(top.items(), [{"k": 1}, {"k": 1}])
+
+    def test_threshold(self):
+        top = TopK(2)
+        top.push(5)
+        with self.assertRaises(IndexError):
+            top.threshold()
+        top.push(3)
+        self.assertEqual(top.threshold(), 3)
+
+    def test_zero(self):
+        top = TopK(0)
+        top.extend([1, 2, 3])
+        self.assertEqual(top.items(), [])
+        with self.assertRaises(ValueError):
+            TopK(-1)
+
+    def test_matches_sorted(self):
+        rng = random.Random(0)
+        data = [rng.randrange(1000) for _ in range(1000)]
+        top = TopK(10)
+        top.extend(data)
+        self.assertEqual(top.items(), sorted(data, reverse=True)[:10])
+
+    def test_merge(self):
+        rng = random.Random(1)
+        data = [rng.random() for _ in range(300)]
+        parts = [TopK(5) for _ in range(3)]
+        for i, part in enumerate(parts):
+            part.extend(data[i * 100 : (i + 1) * 100])
+        merged = TopK(5)
+        merged.merge(*parts)
+        self.assertEqual(merged.items(), sorted(data, reverse=True)[:5])
+
+    def test_clear(self):
+        top = TopK(2)
+        top.extend([1, 2])
+        top.clear()
+        self.assertFalse(top)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy(self):
+        data = numpy.array([5.0, 1.0, 9.0, 3.0, 7.0, 2.0])
+        top = TopK(3)
+        top.extend(data)
+        self.assertEqual(top.items(), [9.0, 7.0, 5.0])
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy_ties(self):
+        """the earliest of equal values are kept, as without numpy: -0.0 == 0.0 tells them apart"""
+        values = [1.0, -0.0, 0.0, 0.0, 2.0, 0.0] + [0.0] * 100
+        top = TopK(3)
+        top.extend(numpy.array(values))
+        expected = heapq.nlargest(3, values)
+        self.assertEqual([math.copysign(1, x) for x in top.items()], [math.copysign(1, x) for x in expected])
+
+
+class TestMerge(unittest.TestCase):
+    """Tests for function `just.heap2.merge`."""
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.sources = [sorted(rng.randrange(100) for _ in range(rng.randrange(50))) for _ in range(10)]
+
+    def test_merge(self):
+        for block_size in (1, 7, 1024):
+            with self.subTest(block_size=block_size):
+                merged = list(merge(self.sources, block_size=block_size))
+                self.assertEqual(merged, list(heapq.merge(*self.sources)))
+
+    def test_reverse(self):
+        sources = [sorted(source, reverse=True) for source in self.sources]
+        self.assertEqual(list(merge(sources, reverse=True)), list(heapq.merge(*sources, reverse=True)))
+
+    def test_stable(self):
+        """items with equal keys come out in the order of their sources, and are never compared"""
+        sources = [[{"k": 1, "s": 0}, {"k": 2, "s": 0}], [{"k": 1, "s": 1}], [{"k": 2, "s": 2}]]
+        merged = list(merge(sources, key=lambda d: d["k"]))
+        self.assertEqual([(d["k"], d["s"]) for d in merged], [(1, 0), (1, 1), (2, 0), (2, 2)])
+        merged = list(merge([list(reversed(s)) for s in sources], key=lambda d: d["k"], reverse=True))
+        self.assertEqual([(d["k"], d["s"]) for d in merged], [(2, 0), (2, 2), (1, 0), (1, 1)])
+
+    def test_lazy(self):
+        """sources are consumed one block at a time"""
+        source = iter(range(100))
+        merged = merge([source, []], block_size=10)
+        self.assertEqual(next(merged), 0)
+        self.assertEqual(next(source), 10)
+
+    def test_empty(self):
+        self.assertEqual(list(merge([])), [])
+        self.assertEqual(list(merge([[], []])), [])
+        with self.assertRaises(ValueError):
+            merge([], block_size=0)
+
+
+class TestMergeFiles(unittest.TestCase):
+    """Tests for function `just.heap2.merge_files`, on plain and compressed files."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        rng = random.Random(5)
+        self.lines = []
+        self.file_paths = []
+        for i in range(4):
+            lines = sorted(f"{rng.randrange(10000):05d}\n" for _ in range(500))
+            self.lines.extend(lines)
+            file_path = os.path.join(self.temp_dir.name, f"shard-{i}.txt" + (".gz" if i % 2 else ""))
+            with (gzip.open if i % 2 else open)(file_path, "wt") as file:
+                file.writelines(lines)
+            self.file_paths.append(file_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_merge_files(self):
+        for prefetch in (0, 1, 4):
+            with self.subTest(prefetch=prefetch):
+                merged = list(merge_files(self.file_paths, block_size=64, prefetch=prefetch))
+                self.assertEqual(merged, sorted(self.lines))
+
+    def test_close(self):
+        """closing the merge early stops the prefetching threads"""
+        threads = threading.active_count()
+        merged = merge_files(self.file_paths, block_size=8, prefetch=1)
+        self.assertEqual(next(merged), min(self.lines))
+        merged.close()
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            merge_files(self.file_paths, prefetch=-1)
+
+
+class TestSpillHeap(unittest.TestCase):
+    """Tests for class `just.heap2.SpillHeap`, with tiny limits so that it spills."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_heap(self, data=(), **kwargs):
+        kwargs.setdefault("max_items", 10)
+        kwargs.setdefault("block_size", 4)
+        return SpillHeap(data, dir_path=self.temp_dir.name, **kwargs)
+
+    def test_trace(self):
+        """random operations give the same results as `Heap`"""
+        rng = random.Random(11)
+        data = [rng.randrange(1000) for _ in range(100)]
+        with self.make_heap(data, max_runs=3) as heap:
+            reference = Heap(data)
+            self.assertGreater(heap.runs, 0)
+            for _ in range(1000):
+                op = rng.choice(["push", "push", "pop", "pushpop", "replace", "peek"])
+                item = rng.randrange(1000)
+                if op == "push" or not reference:
+                    heap.push(item)
+                    reference.push(item)
+                elif op in ("pop", "peek"):
+                    self.assertEqual(getattr(heap, op)(), getattr(reference, op)())
+                else:
+                    self.assertEqual(getattr(heap, op)(item), getattr(reference, op)(item))
+                self.assertEqual(len(heap), len(reference))
+                self.assertLessEqual(heap.runs, 4)
+            self.assertEqual([heap.pop() for _ in range(len(heap))], [reference.pop() for _ in range(len(reference))])
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_runs_deleted(self):
+        """run files are deleted once read, or when the heap is closed"""
+        heap = self.make_heap(range(35, 0, -1))
+        self.assertEqual(heap.runs, 3)
+        self.assertEqual(len(os.listdir(self.temp_dir.name)), 3)
+        for _ in range(15):  # 5 items in memory, then the whole run of the next 10
+            heap.pop()
+        self.assertEqual(len(os.listdir(self.temp_dir.name)), 2)
+        heap.close()
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+        self.assertFalse(heap)
+
+    def test_tiered(self):
+        """runs are merged tier by tier: each item is written a few times, not once per compaction"""
+        written = []
+        original_write_run = heap2._write_run
+
+        def write_run(items, *args):
+            items = list(items)
+            written.append(len(items))
+            return original_write_run(items, *args)
+
+        with mock.patch("just.heap2._write_run", write_run):
+            with self.make_heap(range(2000, 0, -1), max_runs=4) as heap:
+                self.assertLessEqual(heap.runs, 4)
+                self.assertEqual([heap.pop() for _ in range(10)], list(range(1, 11)))
+        self.assertLess(sum(written), 2000 * 6)  # 200 spills, each item in about log4(200) merges
+
+    def test_failed_compaction(self):
+        """a merged run that cannot be written loses no item: the runs it merges are kept as they were"""
+        original_write_run = heap2._write_run
+
+        def fail():
+            raise OSError("disk full")
+            yield
+
+        def write_run(items, *args):
+            if isinstance(items, list):  # a spill, not a merge
+                return original_write_run(items, *args)
+            return original_write_run(itertools.chain(itertools.islice(items, 5), fail()), *args)
+
+        heap = self.make_heap(range(40, 20, -1), max_runs=2)
+        self.assertEqual(heap.runs, 2)
+        self.assertEqual([heap.pop() for _ in range(3)], [21, 22, 23])  # the heads of the runs have moved on
+        with mock.patch("just.heap2._write_run", write_run):
+            with self.assertRaises(OSError):
+                for item in range(20, 10, -1):
+                    heap.push(item)
+        self.assertEqual(heap.runs, 3)
+        self.assertEqual(len(os.listdir(self.temp_dir.name)), 3)
+        self.assertEqual([heap.pop() for _ in range(len(heap))], list(range(11, 21)) + list(range(24, 41)))
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_uncompressed(self):
+        with self.make_heap(["b", "d", "a", "c"] * 5, max_items=3, suffix="") as heap:
+            self.assertTrue(all(name.endswith(".pickle") for name in os.listdir(self.temp_dir.name)))
+            self.assertEqual([heap.pop() for _ in range(len(heap))], sorted(["b", "d", "a", "c"] * 5))
+
+    def test_empty(self):
+        with self.make_heap() as heap:
+            with self.assertRaises(IndexError):
+                heap.pop()
+            with self.assertRaises(IndexError):
+                heap.peek()
+            self.assertEqual(heap.pushpop(1), 1)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.make_heap(max_items=0)
+        with self.assertRaises(ValueError):
+            self.make_heap(max_runs=1)
+
+
+class TestSnapshot(unittest.TestCase):
+    """Tests for the `snapshot()` and `load()` methods of the heaps."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, "heap.snapshot")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_heap(self):
+        heap = Heap([5, 3, 8, 1])
+        heap.snapshot(self.file_path)
+        loaded = Heap.load(self.file_path)
+        self.assertEqual(loaded._heap, heap._heap)
+        loaded.push(2)
+        self.assertEqual([loaded.pop() for _ in range(len(loaded))], [1, 2, 3, 5, 8])
+
+    def test_key_heap(self):
+        heap = KeyHeap(["ccc", "a", "bb"], key=len)
+        heap.snapshot(self.file_path)
+        loaded = KeyHeap.load(self.file_path, key=len)
+        self.assertEqual(loaded._heap, heap._heap)
+        loaded.push("dddd")
+        self.assertEqual([loaded.pop() for _ in range(len(loaded))], ["a", "bb", "ccc", "dddd"])
+
+    def test_array_heap(self):
+        heap = ArrayHeap([3.0, 1.0, 2.0], ids=[30, 10, 20], id_type="i")
+        heap.snapshot(self.file_path)
+        loaded = ArrayHeap.load(self.file_path)
+        self.assertEqual(loaded._keys, heap._keys)
+        self.assertEqual(loaded._ids, heap._ids)
+        self.assertEqual(loaded._ids.typecode, "i")
+        self.assertEqual([loaded.pop() for _ in range(len(loaded))], [(1.0, 10), (2.0, 20), (3.0, 30)])
+
+    def test_wrong_kind(self):
+        Heap([1]).snapshot(self.file_path)
+        with self.assertRaises(ValueError):
+            KeyHeap.load(self.file_path, key=len)
+
+    def test_overwrite(self):
+        """a snapshot replaces the previous one, leaving no temporary file behind"""
+        Heap([1]).snapshot(self.file_path)
+        Heap([2]).snapshot(self.file_path)
+        self.assertEqual(Heap.load(self.file_path).peek(), 2)
+        self.assertEqual(os.listdir(self.temp_dir.name), ["heap.snapshot"])
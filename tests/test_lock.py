@@ -1,9 +1,18 @@
 """Unit-tests for just-lock"""
 
 # standard imports
+import asyncio
+import contextlib
+import json
 import os
+import socket
+import subprocess
+import sys
 import tempfile
+import time
+import threading
 import unittest
+from unittest import mock
 
 # local imports
 import just.lock
@@ -46,3 +55,361 @@ class TestLock(unittest.TestCase):
                 raise RuntimeError(f"Exception when file {self.lock_file} locked!")
 
         self.assertFalse(os.path.isfile(self.lock_file), f"lock-file {self.lock_file} still exists")
+
+
+@mock.patch("just.lock.fcntl", None)
+class TestStaleLock(unittest.TestCase):
+    """test for the owner of a lock-file, and the breaking of stale ones, without fcntl"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.lock_file = os.path.join(self.temp_dir.name, "LOCK_FILE")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_lock(self, pid, host=None, age=0.0):
+        """write a lock-file as if `pid` took it `age` seconds ago"""
+        with open(self.lock_file, "w") as file:
+            json.dump({"pid": pid, "host": host or socket.gethostname(), "started": time.time() - age}, file)
+        os.utime(self.lock_file, (time.time() - age, time.time() - age))
+
+    def dead_pid(self):
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        return process.pid
+
+    def test_owner(self):
+        with just.lock.lock_file(self.lock_file):
+            owner = just.lock.lock_owner(self.lock_file)
+        self.assertEqual((owner["pid"], owner["host"]), (os.getpid(), socket.gethostname()))
+        self.assertLess(abs(owner["started"] - time.time()), 60)
+        self.assertIsNone(just.lock.lock_owner(self.lock_file))
+
+    def test_dead_owner(self):
+        """the lock-file of a process of this host that is not running is broken"""
+        self.write_lock(self.dead_pid())
+        with self.assertLogs("just.lock", level="WARNING") as cm:
+            with just.lock.lock_file(self.lock_file):
+                self.assertEqual(just.lock.lock_owner(self.lock_file)["pid"], os.getpid())
+        self.assertIn("is not running", cm.output[0])
+        self.assertFalse(os.path.exists(self.lock_file))
+
+    def test_live_owner(self):
+        """the lock-file of a running process is not broken, unless it is stale"""
+        self.write_lock(os.getppid(), age=3600)
+        with self.assertRaises(just.lock.LockFileExistsError):
+            with just.lock.lock_file(self.lock_file):
+                pass
+        with self.assertRaises(just.lock.LockFileExistsError):
+            with just.lock.lock_file(self.lock_file, stale_after=7200):
+                pass
+        with self.assertLogs("just.lock", level="WARNING") as cm:
+            with just.lock.lock_file(self.lock_file, stale_after=60):
+                pass
+        self.assertIn("it was not refreshed for", cm.output[0])
+
+    def test_other_host(self):
+        """the owner of a lock-file of another host cannot be checked, only its age"""
+        self.write_lock(self.dead_pid(), host="other." + socket.gethostname(), age=10)
+        with self.assertRaises(just.lock.LockFileExistsError):
+            with just.lock.lock_file(self.lock_file, stale_after=60):
+                pass
+        self.write_lock(1, host="other." + socket.gethostname(), age=120)
+        with self.assertLogs("just.lock", level="WARNING"):
+            with just.lock.lock_file(self.lock_file, stale_after=60):
+                pass
+
+    def test_invalid_lock(self):
+        """a lock-file that is not JSON, e.g. of an older version, is only broken when stale"""
+        open(self.lock_file, "w").close()
+        with self.assertRaises(just.lock.LockFileExistsError):
+            with just.lock.lock_file(self.lock_file, stale_after=60):
+                pass
+        os.utime(self.lock_file, (0, 0))
+        with self.assertLogs("just.lock", level="WARNING"):
+            with just.lock.lock_file(self.lock_file, stale_after=60):
+                pass
+
+    def test_heartbeat(self):
+        """the lock-file is refreshed while it is held"""
+        with just.lock.lock_file(self.lock_file, stale_after=1, heartbeat=0.01):
+            os.utime(self.lock_file, (0, 0))
+            deadline = time.monotonic() + 5
+            while os.stat(self.lock_file).st_mtime == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertGreater(os.stat(self.lock_file).st_mtime, 0)
+
+    def test_broken(self):
+        """a lock that was broken does not delete the lock-file of the new owner on exit"""
+        with self.assertLogs("just.lock", level="ERROR") as cm:
+            with just.lock.lock_file(self.lock_file):
+                os.unlink(self.lock_file)
+                self.write_lock(os.getppid())
+        self.assertIn("was broken by another process", cm.output[0])
+        self.assertEqual(just.lock.lock_owner(self.lock_file)["pid"], os.getppid())
+
+    def test_break_guard(self):
+        """only one process breaks a stale lock-file at a time"""
+        self.write_lock(self.dead_pid())
+        open(self.lock_file + ".break", "w").close()
+        with self.assertRaises(just.lock.LockFileExistsError):
+            with just.lock.lock_file(self.lock_file):
+                pass
+        os.utime(self.lock_file + ".break", (0, 0))  # its process crashed
+        with self.assertRaises(just.lock.LockFileExistsError):
+            with just.lock.lock_file(self.lock_file):
+                pass
+        with self.assertLogs("just.lock", level="WARNING"):
+            with just.lock.lock_file(self.lock_file):
+                pass
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            with just.lock.lock_file(self.lock_file, stale_after=1, heartbeat=1):
+                pass
+
+
+class TestBlockingLock(unittest.TestCase):
+    """test for `just.lock.lock_file` waiting for the lock, with fcntl when available, and without"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.lock_file = os.path.join(self.temp_dir.name, "LOCK_FILE")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def backends(self):
+        """run the test with fcntl, if available, then without"""
+        for fcntl in [just.lock.fcntl, None] if just.lock.fcntl else [None]:
+            with self.subTest(fcntl=fcntl is not None), mock.patch("just.lock.fcntl", fcntl):
+                yield
+
+    def hold(self, seconds):
+        """hold the lock in another thread for a while, and return when it is held"""
+        held = threading.Event()
+
+        def run():
+            with just.lock.lock_file(self.lock_file):
+                held.set()
+                time.sleep(seconds)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        held.wait(5)
+        self.addCleanup(thread.join)
+        return thread
+
+    def test_wait(self):
+        for _ in self.backends():
+            self.hold(0.1)
+            for kwargs in ({"timeout": 5}, {"blocking": True}):
+                start = time.monotonic()
+                with just.lock.lock_file(self.lock_file, **kwargs):
+                    self.assertTrue(os.path.isfile(self.lock_file))
+                self.assertLess(time.monotonic() - start, 2)
+                self.assertFalse(os.path.isfile(self.lock_file))
+
+    def test_timeout(self):
+        for _ in self.backends():
+            self.hold(0.5)
+            start = time.monotonic()
+            with self.assertLogs("just.lock", level="CRITICAL"):
+                with self.assertRaises(just.lock.LockFileTimeoutError) as cm:
+                    with just.lock.lock_file(self.lock_file, timeout=0.05):
+                        pass
+            self.assertGreaterEqual(time.monotonic() - start, 0.05)
+            self.assertIsInstance(cm.exception, just.lock.LockFileExistsError)
+            self.assertIsInstance(cm.exception, TimeoutError)
+            # the lock is released in the end, though a thread still waited for it after the timeout
+            with just.lock.lock_file(self.lock_file, timeout=5):
+                pass
+
+    def test_exclusion(self):
+        """threads waiting for the lock never hold it at once"""
+        for _ in self.backends():
+            holders = []
+            overlaps = []
+
+            def run():
+                for _ in range(20):
+                    with just.lock.lock_file(self.lock_file, timeout=10):
+                        holders.append(1)
+                        overlaps.append(len(holders))
+                        holders.pop()
+
+            threads = [threading.Thread(target=run) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(overlaps), 80)
+            self.assertEqual(max(overlaps), 1)
+
+    @unittest.skipIf(just.lock.fcntl is None, "requires fcntl")
+    def test_left_behind(self):
+        """with fcntl, a lock-file left behind by a process is not locked, whoever its owner"""
+        with open(self.lock_file, "w") as file:
+            json.dump({"pid": os.getppid(), "host": socket.gethostname(), "started": time.time()}, file)
+        with just.lock.lock_file(self.lock_file):
+            self.assertEqual(just.lock.lock_owner(self.lock_file)["pid"], os.getpid())
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            with just.lock.lock_file(self.lock_file, timeout=-1):
+                pass
+
+
+class TestAsyncLock(unittest.IsolatedAsyncioTestCase):
+    """test for `just.lock.async_lock_file`"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.lock_file = os.path.join(self.temp_dir.name, "LOCK_FILE")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    async def test_lock(self):
+        async with just.lock.async_lock_file(self.lock_file):
+            self.assertTrue(os.path.isfile(self.lock_file))
+            with self.assertLogs("just.lock", level="CRITICAL"):
+                with self.assertRaises(just.lock.LockFileExistsError):
+                    async with just.lock.async_lock_file(self.lock_file):
+                        pass
+        self.assertFalse(os.path.isfile(self.lock_file))
+
+    async def test_wait(self):
+        """waiting for the lock lets the other tasks run, e.g. the one releasing it"""
+        for fcntl in (just.lock.fcntl, None):
+            with self.subTest(fcntl=fcntl is not None), mock.patch("just.lock.fcntl", fcntl):
+                stack = contextlib.ExitStack()
+                stack.enter_context(just.lock.lock_file(self.lock_file))
+                asyncio.get_running_loop().call_later(0.05, stack.close)
+                async with just.lock.async_lock_file(self.lock_file, timeout=5):
+                    self.assertEqual(just.lock.lock_owner(self.lock_file)["pid"], os.getpid())
+                with self.assertLogs("just.lock", level="CRITICAL"):
+                    with just.lock.lock_file(self.lock_file):
+                        with self.assertRaises(just.lock.LockFileTimeoutError):
+                            async with just.lock.async_lock_file(self.lock_file, timeout=0.05):
+                                pass
+
+    async def test_cancel(self):
+        """a task waiting for the lock can be cancelled, and the lock is released in the end"""
+        with just.lock.lock_file(self.lock_file):
+            task = asyncio.ensure_future(just.lock.async_lock_file(self.lock_file, blocking=True).__aenter__())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        async with just.lock.async_lock_file(self.lock_file, timeout=5):
+            pass
+
+
+@unittest.skipIf(just.lock.fcntl is None, "requires fcntl")
+class TestReadWriteLock(unittest.TestCase):
+    """test for `just.lock.read_lock` and `just.lock.write_lock`"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.lock_file = os.path.join(self.temp_dir.name, "LOCK_FILE")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def assertLocked(self, lock, **kwargs):
+        with self.assertLogs("just.lock", level="CRITICAL"):
+            with self.assertRaises(just.lock.LockFileExistsError):
+                with lock(self.lock_file, **kwargs):
+                    pass
+
+    def test_readers(self):
+        """readers hold the lock together, and exclude writers"""
+        with just.lock.read_lock(self.lock_file) as lock:
+            with just.lock.read_lock(self.lock_file, blocking=False):
+                self.assertFalse(lock.exclusive)
+            self.assertLocked(just.lock.write_lock, blocking=False)
+            self.assertLocked(just.lock.write_lock, timeout=0.05)
+        with just.lock.write_lock(self.lock_file, blocking=False):
+            pass
+        # the files stay, for the next processes to lock the same ones
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), ["LOCK_FILE", "LOCK_FILE.gate"])
+
+    def test_writer(self):
+        """a writer excludes readers and writers"""
+        with just.lock.write_lock(self.lock_file) as lock:
+            self.assertTrue(lock.exclusive)
+            self.assertLocked(just.lock.read_lock, blocking=False)
+            self.assertLocked(just.lock.read_lock, timeout=0.05)
+            self.assertLocked(just.lock.write_lock, blocking=False)
+
+    def test_writer_preference(self):
+        """new readers wait behind a waiting writer, instead of starving it"""
+        events = []
+        with just.lock.read_lock(self.lock_file):
+
+            def write():
+                with just.lock.write_lock(self.lock_file, timeout=5):
+                    events.append("write")
+
+            writer = threading.Thread(target=write)
+            writer.start()
+            time.sleep(0.05)  # the writer waits for the reader, holding the gate
+            self.assertLocked(just.lock.read_lock, timeout=0.05)
+            self.assertEqual(events, [])
+        writer.join()
+        with just.lock.read_lock(self.lock_file, timeout=5):
+            events.append("read")
+        self.assertEqual(events, ["write", "read"])
+
+    def test_upgrade_downgrade(self):
+        with just.lock.read_lock(self.lock_file) as lock:
+            lock.upgrade(timeout=5)
+            self.assertTrue(lock.exclusive)
+            self.assertLocked(just.lock.read_lock, blocking=False)
+            lock.downgrade()
+            self.assertFalse(lock.exclusive)
+            with just.lock.read_lock(self.lock_file, blocking=False):
+                pass
+            self.assertLocked(just.lock.write_lock, blocking=False)
+        self.assertIn("released", repr(lock))
+
+    def test_upgrade_locked(self):
+        """an upgrade that fails releases the lock"""
+        with just.lock.read_lock(self.lock_file) as lock:
+            with just.lock.read_lock(self.lock_file):
+                with self.assertLogs("just.lock", level="CRITICAL"):
+                    with self.assertRaises(just.lock.LockFileTimeoutError):
+                        lock.upgrade(timeout=0.05)
+            with just.lock.write_lock(self.lock_file, blocking=False):
+                pass
+
+    def test_exclusion(self):
+        """writers never overlap with anyone, while readers overlap with each other"""
+        readers = []
+        writers = []
+        overlaps = []
+
+        def run(lock, holders, count):
+            for _ in range(count):
+                with lock(self.lock_file, timeout=10):
+                    holders.append(1)
+                    overlaps.append((len(readers), len(writers)))
+                    time.sleep(0.001)
+                    holders.pop()
+
+        threads = [threading.Thread(target=run, args=(just.lock.read_lock, readers, 20)) for _ in range(4)]
+        threads += [threading.Thread(target=run, args=(just.lock.write_lock, writers, 5)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(overlaps), 90)
+        self.assertTrue(all(w == 0 or (w, r) == (1, 0) for r, w in overlaps))
+
+    def test_no_fcntl(self):
+        with mock.patch("just.lock.fcntl", None):
+            with self.assertRaises(RuntimeError):
+                with just.lock.read_lock(self.lock_file):
+                    pass
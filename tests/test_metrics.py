@@ -0,0 +1,184 @@
+"""Unit-tests for just.metrics"""
+
+# standard imports
+import io
+import json
+import os
+import socket
+import tempfile
+import time
+import unittest
+import urllib.request
+
+# tested imports
+from just.metrics import Exporter, JsonLinesExporter, MetricsSink, PrometheusExporter, StatsdExporter
+from just.timing import timed, timing
+
+
+class ListExporter(Exporter):
+    """keep every batch, to check what a sink exports"""
+
+    def __init__(self):
+        self.batches = []
+        self.closed = False
+
+    def export(self, records):
+        self.batches.append(records)
+
+    def close(self):
+        self.closed = True
+
+
+class FailingExporter(Exporter):
+    def export(self, records):
+        raise RuntimeError("unreachable")
+
+
+class TestMetricsSink(unittest.TestCase):
+    """Tests for class `just.metrics.MetricsSink`."""
+
+    def test_flush(self):
+        exporter = ListExporter()
+        with MetricsSink([exporter], flush_interval=60) as sink:
+            sink.add("a", 0.5)
+            sink.add("b", 1.5)
+            sink.flush()
+            sink.flush()  # nothing left, nothing exported
+            self.assertEqual(len(exporter.batches), 1)
+            self.assertEqual([record[:2] for record in exporter.batches[0]], [("a", 0.5), ("b", 1.5)])
+        self.assertTrue(exporter.closed)
+
+    def test_abstract(self):
+        """an exporter must define export(), while close() does nothing by default"""
+        with self.assertRaises(TypeError):
+            Exporter()
+        FailingExporter().close()
+
+    def test_background(self):
+        """durations are exported by the thread, without calling flush()"""
+        exporter = ListExporter()
+        with MetricsSink([exporter], flush_interval=0.01) as sink:
+            sink.add("a", 0.5)
+            deadline = time.monotonic() + 5
+            while not exporter.batches and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(exporter.batches[0][0][:2], ("a", 0.5))
+
+    def test_close(self):
+        """closing exports what remains"""
+        exporter = ListExporter()
+        sink = MetricsSink([exporter], flush_interval=60)
+        sink.add("a", 0.5)
+        sink.close()
+        sink.close()
+        self.assertEqual(len(exporter.batches), 1)
+
+    def test_max_pending(self):
+        """the oldest durations are dropped when too many are pending"""
+        exporter = ListExporter()
+        with MetricsSink([exporter], flush_interval=60, max_pending=2) as sink:
+            for seconds in (1.0, 2.0, 3.0):
+                sink.add("a", seconds)
+        self.assertEqual([record[1] for record in exporter.batches[0]], [2.0, 3.0])
+
+    def test_failing_exporter(self):
+        """an exporter that fails does not stop the others"""
+        exporter = ListExporter()
+        with self.assertLogs("just.metrics", level="ERROR"):
+            with MetricsSink([FailingExporter(), exporter], flush_interval=60) as sink:
+                sink.add("a", 0.5)
+        self.assertEqual(len(exporter.batches), 1)
+
+    def test_timing(self):
+        exporter = ListExporter()
+        with MetricsSink([exporter], flush_interval=60) as sink:
+            with timing("context", sink=sink):
+                pass
+
+            @timed(sink=sink)
+            def function():
+                pass
+
+            function()
+        self.assertEqual([record[0] for record in exporter.batches[0]], ["context", function.__qualname__])
+
+
+class TestJsonLinesExporter(unittest.TestCase):
+    """Tests for class `just.metrics.JsonLinesExporter`."""
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "metrics.jsonl")
+            with MetricsSink([JsonLinesExporter(file_path)]) as sink:
+                sink.add("a", 0.5)
+                sink.add("b", 1.5)
+            with open(file_path) as file:
+                lines = [json.loads(line) for line in file]
+        self.assertEqual([(line["name"], line["seconds"]) for line in lines], [("a", 0.5), ("b", 1.5)])
+        self.assertIn("timestamp", lines[0])
+
+    def test_file_object(self):
+        """a file object is written to, and left open"""
+        file = io.StringIO()
+        with MetricsSink([JsonLinesExporter(file)]) as sink:
+            sink.add("a", 0.5)
+        self.assertEqual(json.loads(file.getvalue())["name"], "a")
+
+
+class TestStatsdExporter(unittest.TestCase):
+    """Tests for class `just.metrics.StatsdExporter`, against a local UDP socket."""
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.settimeout(5)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_timers(self):
+        exporter = StatsdExporter(self.server.getsockname(), prefix="app.")
+        exporter.export([("handle request", 0.0125, 0.0), ("b", 1.0, 0.0)])
+        exporter.close()
+        self.assertEqual(self.server.recv(65536), b"app.handle_request:12.500|ms\napp.b:1000.000|ms")
+
+    def test_packets(self):
+        """timers are split into datagrams no larger than max_packet_size"""
+        exporter = StatsdExporter(self.server.getsockname(), max_packet_size=32)
+        exporter.export([("name", 0.001, 0.0)] * 5)  # 13 bytes per timer, 2 per datagram
+        exporter.close()
+        datagrams = [self.server.recv(65536) for _ in range(3)]
+        self.assertTrue(all(len(datagram) <= 32 for datagram in datagrams))
+        self.assertEqual(b"\n".join(datagrams).count(b"|ms"), 5)
+
+
+class TestPrometheusExporter(unittest.TestCase):
+    """Tests for class `just.metrics.PrometheusExporter`."""
+
+    def test_render(self):
+        exporter = PrometheusExporter(quantiles=(0.5,))
+        exporter.export([('say "hi"', 1.0, 0.0), ('say "hi"', 3.0, 0.0)])
+        text = exporter.render()
+        self.assertIn("# TYPE just_timing_seconds summary", text)
+        self.assertIn('just_timing_seconds_count{name="say \\"hi\\""} 2', text)
+        self.assertIn('just_timing_seconds_sum{name="say \\"hi\\""} 4.0', text)
+        self.assertRegex(text, r'just_timing_seconds\{name="say \\"hi\\"",quantile="0.5"\} [\d.]+')
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "metrics.prom")
+            exporter = PrometheusExporter(file_path=file_path)
+            exporter.export([("a", 1.0, 0.0)])
+            with open(file_path) as file:
+                self.assertEqual(file.read(), exporter.render())
+
+    def test_http(self):
+        exporter = PrometheusExporter(port=0)
+        try:
+            exporter.export([("a", 1.0, 0.0)])
+            host, port = exporter.server_address
+            with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5) as response:
+                self.assertEqual(response.status, 200)
+                self.assertEqual(response.read().decode(), exporter.render())
+        finally:
+            exporter.close()
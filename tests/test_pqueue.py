@@ -0,0 +1,133 @@
+"""Unit-tests for just.pqueue"""
+
+# standard imports
+import asyncio
+import queue
+import threading
+import unittest
+
+# tested imports
+from just.pqueue import AsyncPriorityQueue, PriorityQueue
+
+
+class TestPriorityQueue(unittest.TestCase):
+    """Tests for class `just.pqueue.PriorityQueue`."""
+
+    def test_order(self):
+        q = PriorityQueue(key=len)
+        for item in ["ccc", "a", "bb"]:
+            q.put(item)
+        self.assertEqual([q.get(), q.get(), q.get()], ["a", "bb", "ccc"])
+
+    def test_fifo_ties(self):
+        """items with equal keys come out in the order they were put, and are never compared"""
+        q = PriorityQueue(key=lambda d: d["k"])
+        items = [{"k": 1, "n": n} for n in range(5)]
+        q.put_many(items)
+        self.assertEqual(q.get_many(5), items)
+
+    def test_get_empty(self):
+        q = PriorityQueue(key=len)
+        with self.assertRaises(queue.Empty):
+            q.get_nowait()
+        with self.assertRaises(queue.Empty):
+            q.get(timeout=0.01)
+        with self.assertRaises(queue.Empty):
+            q.get_many(2, block=False)
+
+    def test_put_full(self):
+        q = PriorityQueue(key=len, maxsize=1)
+        q.put("a")
+        self.assertTrue(q.full())
+        with self.assertRaises(queue.Full):
+            q.put_nowait("b")
+        with self.assertRaises(queue.Full):
+            q.put("b", timeout=0.01)
+        with self.assertRaises(ValueError):
+            q.put("b", timeout=-1)
+
+    def test_put_many_partial(self):
+        """a batch that does not fit puts what it can before giving up"""
+        q = PriorityQueue(key=int, maxsize=2)
+        with self.assertRaises(queue.Full):
+            q.put_many([3, 1, 2], block=False)
+        self.assertEqual(q.get_many(10), [1, 3])
+
+    def test_get_many(self):
+        q = PriorityQueue(key=int)
+        q.put_many([5, 3, 4, 1, 2])
+        self.assertEqual(q.get_many(2), [1, 2])
+        self.assertEqual(q.get_many(10), [3, 4, 5])
+        with self.assertRaises(ValueError):
+            q.get_many(0)
+
+    def test_blocking_get(self):
+        """a blocked consumer is woken by a producer thread"""
+        q = PriorityQueue(key=int)
+        timer = threading.Timer(0.01, q.put, args=(42,))
+        timer.start()
+        self.assertEqual(q.get(timeout=5), 42)
+        timer.join()
+
+    def test_threads(self):
+        """every item put by several producers through a small queue is consumed exactly once"""
+        q = PriorityQueue(key=int, maxsize=4)
+        consumed = []
+
+        def consume():
+            while True:
+                items = q.get_many(3, timeout=5)
+                if -1 in items:
+                    consumed.extend(item for item in items if item != -1)
+                    break
+                consumed.extend(items)
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+        producers = [threading.Thread(target=q.put_many, args=(range(i, 400, 4),)) for i in range(4)]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        q.put(-1, timeout=5)
+        consumer.join()
+        self.assertEqual(sorted(consumed), list(range(400)))
+        self.assertTrue(q.empty())
+
+
+class TestAsyncPriorityQueue(unittest.IsolatedAsyncioTestCase):
+    """Tests for class `just.pqueue.AsyncPriorityQueue`."""
+
+    async def test_order(self):
+        q = AsyncPriorityQueue(key=len)
+        await q.put_many(["ccc", "a", "bb"])
+        self.assertEqual(await q.get(), "a")
+        self.assertEqual(await q.get_many(10), ["bb", "ccc"])
+
+    async def test_nowait(self):
+        q = AsyncPriorityQueue(key=int, maxsize=1)
+        with self.assertRaises(asyncio.QueueEmpty):
+            q.get_nowait()
+        q.put_nowait(1)
+        with self.assertRaises(asyncio.QueueFull):
+            q.put_nowait(2)
+
+    async def test_blocking(self):
+        """producers wait for room, consumers wait for items"""
+        q = AsyncPriorityQueue(key=int, maxsize=2)
+        producer = asyncio.create_task(q.put_many(range(10)))
+        consumed = []
+        while len(consumed) < 10:
+            consumed.append(await asyncio.wait_for(q.get(), timeout=5))
+        await producer
+        self.assertEqual(sorted(consumed), list(range(10)))
+
+    async def test_cancelled_getter(self):
+        """a getter cancelled while waiting does not swallow the next item"""
+        q = AsyncPriorityQueue(key=int)
+        first = asyncio.create_task(q.get())
+        second = asyncio.create_task(q.get())
+        await asyncio.sleep(0)
+        q.put_nowait(1)
+        first.cancel()
+        self.assertEqual(await asyncio.wait_for(second, timeout=5), 1)
@@ -4,13 +4,40 @@
 
 
 # standard imports
+import asyncio
+import collections
+import contextvars
+import inspect
+import json
 import logging
+import random
+import threading
+import time
 import unittest
 from typing import Callable
 from unittest import mock
 
 # tested imports
-from just.retry import retry
+from just.retry import (
+    AsyncRetryIterator,
+    Backoff,
+    CircuitBreaker,
+    CircuitOpenError,
+    ConstantBackoff,
+    DecorrelatedJitterBackoff,
+    ExponentialBackoff,
+    FullJitterBackoff,
+    HedgeDelay,
+    RetryBudget,
+    RetryEvent,
+    RetryIterator,
+    RetryStats,
+    dump_retry_stats,
+    get_retry_stats,
+    hedge,
+    retry,
+    shared_budget,
+)
 
 
 # name of the logger used by `just.retry`, where the retry-messages are logged
@@ -97,3 +124,797 @@ class TestRetry(unittest.TestCase):
 
                 self.assertEqual(str(caught.exception), f"tries must be at least 1, got {tries}")
                 func.assert_not_called()
+
+
+class TestBackoff(unittest.TestCase):
+    """test for the backoff strategies of `just.retry`"""
+
+    def test_abstract(self):
+        """a backoff must define `__call__`"""
+
+        class NoDelay(Backoff):
+            pass
+
+        with self.assertRaises(TypeError):
+            NoDelay()  # type: ignore[abstract]
+
+    def test_constant(self):
+        backoff = ConstantBackoff(0.5)
+        self.assertEqual([backoff(attempt, 0.5) for attempt in range(1, 4)], [0.5, 0.5, 0.5])
+
+    def test_exponential(self):
+        backoff = ExponentialBackoff(0.1, factor=3)
+        self.assertEqual([round(backoff(attempt, 0), 6) for attempt in range(1, 4)], [0.1, 0.3, 0.9])
+
+    def test_full_jitter(self):
+        backoff = FullJitterBackoff(0.1, rng=random.Random(0))
+        for attempt in range(1, 10):
+            self.assertTrue(0 <= backoff(attempt, 0) <= 0.1 * 2 ** (attempt - 1))
+
+    def test_decorrelated_jitter(self):
+        backoff = DecorrelatedJitterBackoff(0.1, rng=random.Random(0))
+        delay = 0.0
+        for attempt in range(1, 10):
+            previous, delay = delay, backoff(attempt, delay)
+            self.assertTrue(0.1 <= delay <= max(0.1, previous * 3))
+
+
+@mock.patch("just.retry.time.sleep")
+class TestRetryOptions(unittest.TestCase):
+    """test for the options of `just.retry.retry`, without actually sleeping"""
+
+    def test_backoff(self, sleep):
+        decorated = retry(RuntimeError, tries=4, backoff=ExponentialBackoff(1), max_delay=3)(flaky(FAILURES))
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING):
+            self.assertEqual(decorated(), "ok")
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1, 2, 3])
+
+    def test_delay(self, sleep):
+        decorated = retry(RuntimeError, tries=4, delay=0.5)(flaky(FAILURES))
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING):
+            decorated()
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.5, 0.5, 0.5])
+
+    def test_deadline(self, sleep):
+        """no retry starts when its delay would go past the deadline, and the last exception is raised"""
+        decorated = retry(RuntimeError, tries=10, backoff=ExponentialBackoff(1), deadline=2.5)(flaky(FAILURES))
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING) as cm:
+            with self.assertRaises(RuntimeError):
+                decorated()
+        # sleeping is mocked, so no time passes: the delays of 1 and 2 fit, then 4 would end past 2.5
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1, 2])
+        self.assertIn("deadline of 2.500 seconds", cm.output[-1])
+
+    def test_tuple(self, sleep):
+        errors = iter([KeyError("a"), IndexError("b")])
+
+        def func():
+            for e in errors:
+                raise e
+            return "ok"
+
+        decorated = retry((KeyError, IndexError), tries=3)(func)
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING):
+            self.assertEqual(decorated(), "ok")
+
+    def test_retry_if(self, sleep):
+        """an exception rejected by the predicate is raised at once"""
+        func = mock.Mock(side_effect=RuntimeError("fatal"))
+        decorated = retry(RuntimeError, tries=3, retry_if=lambda e: str(e) != "fatal")(func)
+        with self.assertRaises(RuntimeError):
+            decorated()
+        self.assertEqual(func.call_count, 1)
+
+    def test_retry_if_result(self, sleep):
+        func = mock.Mock(side_effect=[None, None, "ok"])
+        decorated = retry(RuntimeError, tries=3, retry_if_result=lambda result: result is None)(func)
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING) as cm:
+            self.assertEqual(decorated(), "ok")
+        self.assertEqual(cm.output[0], f"WARNING:{LOGGER_NAME}:got None - retrying 1 / 3 ...")
+
+        # giving up returns the last result
+        func = mock.Mock(return_value=None)
+        decorated = retry(RuntimeError, tries=2, retry_if_result=lambda result: result is None)(func)
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING) as cm:
+            self.assertIsNone(decorated())
+        self.assertEqual(cm.output[-1], f"ERROR:{LOGGER_NAME}:got None - aborting 2 / 2 ...")
+
+
+class TestRetryAsync(unittest.IsolatedAsyncioTestCase):
+    """test for `just.retry.retry` on coroutine functions"""
+
+    async def test_retry_success(self):
+        flaky_func = flaky(FAILURES)
+
+        @retry(RuntimeError, tries=FAILURES + 1)
+        async def decorated():
+            await asyncio.sleep(0)
+            return flaky_func()
+
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING) as cm:
+            self.assertEqual(await decorated(), "ok")
+        self.assertEqual(len(cm.output), FAILURES)
+
+    async def test_retry_failure(self):
+        @retry(RuntimeError, tries=2)
+        async def decorated():
+            raise RuntimeError("always")
+
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING) as cm:
+            with self.assertRaises(RuntimeError):
+                await decorated()
+        self.assertEqual(cm.output[-1], f"ERROR:{LOGGER_NAME}:caught always - aborting 2 / 2 ...")
+
+    async def test_concurrent(self):
+        """many tasks waiting to retry do not block each other, nor the event loop"""
+        calls = collections.Counter()
+
+        @retry(RuntimeError, tries=2, delay=0.05)
+        async def decorated(i):
+            calls[i] += 1
+            if calls[i] == 1:
+                raise RuntimeError(i)
+            return i
+
+        logging.getLogger(LOGGER_NAME).disabled = True
+        try:
+            time_begin = time.monotonic()
+            results = await asyncio.gather(*(decorated(i) for i in range(1000)))
+        finally:
+            logging.getLogger(LOGGER_NAME).disabled = False
+        self.assertEqual(results, list(range(1000)))
+        self.assertLess(time.monotonic() - time_begin, 5)
+
+
+@mock.patch("just.retry.time.sleep")
+class TestRetryTelemetry(unittest.TestCase):
+    """test for the events and the counters of the retried calls"""
+
+    def test_events(self, sleep):
+        events = []
+
+        @retry(RuntimeError, tries=4, delay=1, on_attempt=events.append)
+        def func(flaky_func):
+            return flaky_func()
+
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING):
+            func(flaky(3))
+            with self.assertRaises(RuntimeError):
+                func(flaky(5))
+        outcomes = [(event.attempt, event.outcome) for event in events]
+        self.assertEqual(outcomes[:4], [(1, "retry"), (2, "retry"), (3, "retry"), (4, "success")])
+        self.assertEqual(outcomes[4:], [(1, "retry"), (2, "retry"), (3, "retry"), (4, "failure")])
+        self.assertIsInstance(events[-1].exception, RuntimeError)
+        self.assertEqual(events[0].delay, 1)
+        self.assertEqual(events[0].name, f"{__name__}.{func.__qualname__}")
+        self.assertEqual(json.loads(json.dumps(events[-1].to_dict()))["outcome"], RetryEvent.FAILURE)
+
+    def test_stats(self, sleep):
+        @retry(RuntimeError, tries=3, delay=0.5)
+        def func(flaky_func):
+            return flaky_func()
+
+        func.retry_stats.reset()
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING):
+            func(flaky(0))
+            func(flaky(1))
+            with self.assertRaises(RuntimeError):
+                func(flaky(3))
+        expected = {
+            "calls": 3,
+            "attempts": 6,
+            "first_try_successes": 1,
+            "successes": 2,
+            "failures": 1,
+            "sleep_seconds": 1.5,
+        }
+        self.assertEqual(func.retry_stats.to_dict(), expected)
+        name = f"{__name__}.{func.__qualname__}"
+        self.assertIs(get_retry_stats(name), func.retry_stats)
+        self.assertEqual(dump_retry_stats()[name], expected)
+
+    def test_not_retried(self, sleep):
+        """an exception rejected by `retry_if` is a failure of the first attempt"""
+        events = []
+
+        @retry(RuntimeError, tries=3, retry_if=lambda e: False, on_attempt=events.append)
+        def func():
+            raise RuntimeError("fatal")
+
+        with self.assertRaises(RuntimeError):
+            func()
+        self.assertEqual([(event.attempt, event.outcome) for event in events], [(1, "failure")])
+
+    def test_failing_hook(self, sleep):
+        """an exception of the hook is logged, and the call goes on"""
+
+        def hook(event):
+            raise ValueError("broken hook")
+
+        @retry(RuntimeError, tries=2, on_attempt=hook)
+        def func():
+            return "ok"
+
+        with self.assertLogs(LOGGER_NAME, level=logging.ERROR) as cm:
+            self.assertEqual(func(), "ok")
+        self.assertIn("failed to handle RetryEvent(", cm.output[0])
+
+    def test_iterator(self, sleep):
+        events = []
+        get_retry_stats("test loop").reset()
+        func = flaky(1)
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING):
+            for attempt in RetryIterator(3, on_attempt=events.append, name="test loop"):
+                with attempt:
+                    func()
+        self.assertEqual([event.outcome for event in events], ["retry", "success"])
+        self.assertEqual(dump_retry_stats()["test loop"]["attempts"], 2)
+
+    def test_async(self, sleep):
+        events = []
+
+        @retry(RuntimeError, tries=3, on_attempt=events.append)
+        async def func(flaky_func):
+            return flaky_func()
+
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING):
+            self.assertEqual(asyncio.run(func(flaky(1))), "ok")
+        self.assertEqual([event.outcome for event in events], ["retry", "success"])
+        self.assertEqual(func.retry_stats.first_try_successes, 0)
+
+    def test_repr(self, sleep):
+        stats = RetryStats("name")
+        stats.record(RetryEvent.FAILURE, 1)
+        self.assertEqual(
+            repr(stats),
+            "RetryStats('name', calls=1, attempts=1, first_try_successes=0, successes=0, failures=1,"
+            " sleep_seconds=0.000)",
+        )
+
+
+class TestRetryIterator(unittest.TestCase):
+    """test for `just.retry.RetryIterator`"""
+
+    def test_success(self):
+        func = flaky(2)
+        numbers = []
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING) as cm:
+            for attempt in RetryIterator(attempts=3, error=RuntimeError):
+                numbers.append((attempt.number, type(attempt.last_exception)))
+                with attempt:
+                    result = func()
+        self.assertEqual(result, "ok")
+        self.assertEqual(numbers, [(1, type(None)), (2, RuntimeError), (3, RuntimeError)])
+        self.assertEqual(len(cm.output), 2)
+
+    def test_final_raise(self):
+        """the exception of the last attempt reaches the caller, instead of leaving the loop"""
+        func = flaky(5)
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING) as cm:
+            with self.assertRaises(RuntimeError):
+                for attempt in RetryIterator(3):
+                    with attempt:
+                        func()
+        self.assertTrue(cm.output[-1].startswith(f"ERROR:{LOGGER_NAME}:caught"))
+        self.assertIn("aborting 3 / 3", cm.output[-1])
+
+    def test_other_error(self):
+        """exceptions other than `error`, or rejected by `retry_if`, propagate at once"""
+        for kwargs in ({"error": ValueError}, {"retry_if": lambda e: "transient" in str(e)}):
+            with self.subTest(**kwargs):
+                numbers = []
+                with self.assertRaises(RuntimeError):
+                    for attempt in RetryIterator(3, **kwargs):
+                        with attempt:
+                            numbers.append(attempt.number)
+                            raise RuntimeError("fatal")
+                self.assertEqual(numbers, [1])
+
+    def test_base_exception(self):
+        """exceptions that are not `Exception` are never swallowed"""
+        numbers = []
+        with self.assertRaises(KeyboardInterrupt):
+            for attempt in RetryIterator(3, error=BaseException):
+                with attempt:
+                    numbers.append(attempt.number)
+                    raise KeyboardInterrupt()
+        self.assertEqual(numbers, [1])
+
+    @mock.patch("just.retry.time.sleep")
+    def test_backoff(self, sleep):
+        func = flaky(3)
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING):
+            for attempt in RetryIterator(4, backoff=ExponentialBackoff(1), max_delay=3):
+                with attempt:
+                    func()
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2, 3])
+
+    def test_deadline(self):
+        func = flaky(5)
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING) as cm:
+            with self.assertRaises(RuntimeError):
+                for attempt in RetryIterator(5, backoff=ConstantBackoff(60), deadline=1):
+                    with attempt:
+                        func()
+        self.assertIn("the deadline of 1.000 seconds would be exceeded", cm.output[-1])
+
+    def test_succeed(self):
+        """succeed() stops the loop, as the former API required"""
+        numbers = []
+        for attempt in (retry_iterator := RetryIterator(3)):
+            numbers.append(attempt.number)
+            retry_iterator.succeed()
+        self.assertEqual(numbers, [1])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            RetryIterator(0)
+
+
+class TestAsyncRetryIterator(unittest.IsolatedAsyncioTestCase):
+    """test for `just.retry.AsyncRetryIterator`"""
+
+    async def test_success(self):
+        flaky_func = flaky(FAILURES)
+        numbers = []
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING):
+            async for attempt in AsyncRetryIterator(FAILURES + 1, error=RuntimeError):
+                with attempt:
+                    numbers.append(attempt.number)
+                    result = flaky_func()
+        self.assertEqual(result, "ok")
+        self.assertEqual(numbers, [1, 2, 3, 4])
+
+    async def test_failure(self):
+        """the exception of the last attempt propagates out of the loop"""
+        flaky_func = flaky(FAILURES)
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING):
+            with self.assertRaises(RuntimeError):
+                async for attempt in AsyncRetryIterator(FAILURES, error=RuntimeError):
+                    with attempt:
+                        flaky_func()
+
+    async def test_other_error(self):
+        """an exception that is not retried propagates at once"""
+        count = 0
+        with self.assertRaises(KeyError):
+            async for attempt in AsyncRetryIterator(3, error=RuntimeError):
+                with attempt:
+                    count += 1
+                    raise KeyError()
+        self.assertEqual(count, 1)
+
+    async def test_backoff(self):
+        with mock.patch("just.retry.asyncio.sleep") as sleep:
+            with self.assertLogs(LOGGER_NAME, level=logging.WARNING):
+                with self.assertRaises(RuntimeError):
+                    async for attempt in AsyncRetryIterator(3, error=RuntimeError, backoff=ExponentialBackoff(1)):
+                        with attempt:
+                            raise RuntimeError()
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1, 2])
+
+    async def test_cancel(self):
+        """cancelling a task waiting for its next attempt stops it at once"""
+        started = asyncio.Event()
+
+        async def loop():
+            async for attempt in AsyncRetryIterator(3, error=Exception, backoff=ConstantBackoff(60)):
+                with attempt:
+                    started.set()
+                    raise RuntimeError()
+
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING):
+            task = asyncio.create_task(loop())
+            await started.wait()
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await asyncio.wait_for(task, timeout=5)
+
+    async def test_cancel_in_body(self):
+        """a cancellation in the body is never retried, even when catching every exception"""
+        attempts = []
+
+        async def loop():
+            async for attempt in AsyncRetryIterator(3, error=BaseException):
+                with attempt:
+                    attempts.append(attempt.number)
+                    await asyncio.sleep(60)
+
+        task = asyncio.create_task(loop())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(attempts, [1])
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            AsyncRetryIterator(0, error=RuntimeError)
+
+    def test_same_arguments(self):
+        """both iterators take the same arguments, in the same order"""
+        self.assertEqual(inspect.signature(AsyncRetryIterator), inspect.signature(RetryIterator))
+
+
+class TestRetryBudget(unittest.TestCase):
+    """test for `just.retry.RetryBudget`"""
+
+    def test_tokens(self):
+        budget = RetryBudget(ratio=0.25, min_per_second=0, max_tokens=2)
+        self.assertEqual([budget.withdraw() for _ in range(3)], [True, True, False])
+        for _ in range(4):
+            budget.deposit()
+        self.assertEqual([budget.withdraw() for _ in range(2)], [True, False])
+        self.assertEqual((budget.deposits, budget.withdrawals, budget.denied), (4, 3, 2))
+
+    def test_max_tokens(self):
+        budget = RetryBudget(ratio=1, min_per_second=0, max_tokens=2)
+        for _ in range(10):
+            budget.deposit()
+        self.assertEqual(budget.tokens, 2)
+
+    def test_min_per_second(self):
+        with mock.patch("just.retry.time.monotonic", return_value=100.0) as monotonic:
+            budget = RetryBudget(ratio=0, min_per_second=10, max_tokens=1)
+            self.assertTrue(budget.withdraw())
+            self.assertFalse(budget.withdraw())
+            monotonic.return_value = 100.2  # 2 tokens later, capped to 1
+            self.assertTrue(budget.withdraw())
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            RetryBudget(ratio=-1)
+
+    def test_shared(self):
+        self.assertIs(shared_budget("test_shared"), shared_budget("test_shared"))
+        self.assertIsNot(shared_budget("test_shared"), shared_budget("test_shared_other"))
+
+    def test_threads(self):
+        """withdrawals from many threads never exceed the tokens"""
+        budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=100)
+        allowed = []
+
+        def withdraw():
+            allowed.extend(budget.withdraw() for _ in range(50))
+
+        threads = [threading.Thread(target=withdraw) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(allowed.count(True), 100)
+        self.assertEqual(budget.denied, 300)
+
+    def test_retry(self):
+        """retries stop when the budget is exhausted, and successes replenish it"""
+        budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+        func = mock.Mock(side_effect=RuntimeError("down"))
+        failing = retry(RuntimeError, tries=5, budget=budget)(func)
+        with self.assertLogs(LOGGER_NAME, level=logging.WARNING) as cm:
+            with self.assertRaises(RuntimeError):
+                failing()
+        self.assertEqual(func.call_count, 2)  # the first try, and the only retry allowed
+        self.assertEqual(
+            cm.output[-1], f"ERROR:{LOGGER_NAME}:caught down - aborting 2 / 5, the retry budget is exhausted ..."
+        )
+
+        succeeding = retry(RuntimeError, tries=5, budget=budget)(mock.Mock(return_value="ok"))
+        succeeding()
+        succeeding()
+        self.assertEqual(budget.deposits, 2)
+        self.assertTrue(budget.withdraw())
+
+
+@mock.patch("just.retry.time.monotonic", return_value=1000.0)
+class TestCircuitBreaker(unittest.TestCase):
+    """test for `just.retry.CircuitBreaker`, with a mocked clock"""
+
+    def fail(self, breaker, count=1):
+        for _ in range(count):
+            with self.assertRaises(RuntimeError):
+                with breaker:
+                    raise RuntimeError("down")
+
+    def succeed(self, breaker, count=1):
+        for _ in range(count):
+            with breaker:
+                pass
+
+    def test_open(self, monotonic):
+        """the breaker opens when the failure rate reaches the threshold, with enough calls"""
+        breaker = CircuitBreaker(failure_rate=0.5, window=4, min_calls=4, cooldown=10)
+        with self.assertLogs(LOGGER_NAME, level=logging.INFO):
+            self.fail(breaker, 3)
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)  # not enough calls yet
+            self.succeed(breaker)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError) as caught:
+            with breaker:
+                self.fail("not called")
+        self.assertEqual(caught.exception.retry_after, 10)
+        self.assertEqual(breaker.rejected, 1)
+
+    def test_window(self, monotonic):
+        """old outcomes slide out of the window"""
+        breaker = CircuitBreaker(failure_rate=0.5, window=4, min_calls=4)
+        self.fail(breaker, 1)
+        self.succeed(breaker, 5)
+        self.fail(breaker, 1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open(self, monotonic):
+        breaker = CircuitBreaker(failure_rate=1, window=2, min_calls=2, cooldown=10, half_open_calls=2)
+        with self.assertLogs(LOGGER_NAME, level=logging.INFO) as cm:
+            self.fail(breaker, 2)
+            monotonic.return_value += 10
+            self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            # a probe failing opens the breaker again
+            self.fail(breaker)
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+            monotonic.return_value += 10
+            # the probes all succeeding close it
+            self.succeed(breaker, 2)
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(cm.output[-1], f"INFO:{LOGGER_NAME}:circuit '' is closed")
+
+    def test_half_open_limit(self, monotonic):
+        """only a limited number of probes go through at once"""
+        breaker = CircuitBreaker(failure_rate=1, window=1, min_calls=1, cooldown=10, half_open_calls=1)
+        with self.assertLogs(LOGGER_NAME, level=logging.INFO):
+            self.fail(breaker)
+            monotonic.return_value += 10
+            with breaker:
+                with self.assertRaises(CircuitOpenError):
+                    with breaker:
+                        pass
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_stale_probe(self, monotonic):
+        """a probe that outlives the re-opening of the breaker neither frees a slot nor counts in the next window"""
+        breaker = CircuitBreaker(failure_rate=1, window=1, min_calls=1, cooldown=10, half_open_calls=2)
+        with self.assertLogs(LOGGER_NAME, level=logging.INFO):
+            self.fail(breaker)
+            monotonic.return_value += 10
+            with breaker:  # a slow probe
+                self.fail(breaker)  # another probe fails: open again
+                monotonic.return_value += 10
+                self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            with breaker, breaker:
+                with self.assertRaises(CircuitOpenError):
+                    with breaker:
+                        pass
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_other_error(self, monotonic):
+        """exceptions that are not failures do not count"""
+        breaker = CircuitBreaker(window=1, min_calls=1, error=ConnectionError)
+        for _ in range(3):
+            with self.assertRaises(KeyError):
+                with breaker:
+                    raise KeyError()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_decorator(self, monotonic):
+        breaker = CircuitBreaker(failure_rate=1, window=2, min_calls=2)
+        func = mock.Mock(side_effect=RuntimeError("down"))
+        decorated = breaker(func)
+        with self.assertLogs(LOGGER_NAME, level=logging.INFO):
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    decorated()
+        with self.assertRaises(CircuitOpenError):
+            decorated()
+        self.assertEqual(func.call_count, 2)
+
+    def test_retry(self, monotonic):
+        """retry does not retry an open circuit"""
+        breaker = CircuitBreaker(failure_rate=1, window=2, min_calls=2)
+        func = mock.Mock(side_effect=RuntimeError("down"))
+        decorated = retry(Exception, tries=5)(breaker(func))
+        with self.assertLogs(LOGGER_NAME, level=logging.INFO) as cm:
+            with self.assertRaises(CircuitOpenError):
+                decorated()
+        self.assertEqual(func.call_count, 2)
+        self.assertEqual(len([line for line in cm.output if "retrying" in line]), 2)
+
+    def test_threads(self, monotonic):
+        breaker = CircuitBreaker(failure_rate=0.5, window=100, min_calls=100)
+
+        def call():
+            for i in range(100):
+                with breaker:
+                    pass
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker._context_probes.get(), ())
+
+    def test_invalid(self, monotonic):
+        with self.assertRaises(ValueError):
+            CircuitBreaker(failure_rate=0)
+        with self.assertRaises(ValueError):
+            CircuitBreaker(window=0)
+
+
+class TestCircuitBreakerAsync(unittest.IsolatedAsyncioTestCase):
+    """test for `just.retry.CircuitBreaker` with asyncio"""
+
+    async def test_decorator(self):
+        breaker = CircuitBreaker(failure_rate=1, window=2, min_calls=2, cooldown=60)
+        calls = 0
+
+        @breaker
+        async def func():
+            nonlocal calls
+            calls += 1
+            raise RuntimeError("down")
+
+        with self.assertLogs(LOGGER_NAME, level=logging.INFO):
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    await func()
+        with self.assertRaises(CircuitOpenError):
+            await func()
+        self.assertEqual(calls, 2)
+
+    async def test_context_manager(self):
+        """concurrent tasks each record the outcome of their own call"""
+        breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=10)
+
+        async def call(fail):
+            async with breaker:
+                await asyncio.sleep(0.01)
+                if fail:
+                    raise RuntimeError()
+
+        results = await asyncio.gather(*(call(i % 4 == 0) for i in range(8)), return_exceptions=True)
+        self.assertEqual(sum(isinstance(result, RuntimeError) for result in results), 2)
+        self.assertEqual(breaker._failures, 2)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+class TestHedgeDelay(unittest.TestCase):
+    """test for `just.retry.HedgeDelay`"""
+
+    def test_adapt(self):
+        delay = HedgeDelay(quantile=0.9, window=10, initial=1.0, min_samples=5)
+        for seconds in range(4):
+            delay.add(seconds)
+        self.assertEqual(delay(), 1.0)
+        for seconds in range(4, 20):
+            delay.add(seconds)
+        self.assertEqual(delay(), 19)  # p90 of 10 .. 19
+        delay = HedgeDelay(initial=1.0, min_samples=1, min_delay=0.5)
+        delay.add(0.001)
+        self.assertEqual(delay(), 0.5)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            HedgeDelay(quantile=95)
+
+
+class TestHedge(unittest.TestCase):
+    """test for `just.retry.hedge`"""
+
+    def setUp(self):
+        self.release = threading.Event()  # lets the slow attempts finish when the test ends
+
+    def tearDown(self):
+        self.release.set()
+
+    def slow_first(self, fail=False):
+        """return a function that is slow on its first call only, and the list of its calls"""
+        calls = []
+
+        def func(x):
+            calls.append(x)
+            if len(calls) == 1:
+                self.release.wait(5)
+                return "slow"
+            if fail:
+                raise RuntimeError("failed hedge")
+            return "fast"
+
+        return func, calls
+
+    def test_hedge(self):
+        """the second attempt wins when the first one is slow"""
+        func, calls = self.slow_first()
+        start = time.monotonic()
+        self.assertEqual(hedge(after=0.01)(func)(1), "fast")
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(calls, [1, 1])
+
+    def test_fast(self):
+        """a fast attempt is not hedged, and its latency adapts the delay"""
+        delay = HedgeDelay(min_samples=1)
+        calls = []
+
+        @hedge(after=delay)
+        def func():
+            calls.append(1)
+            return "fast"
+
+        self.assertEqual(func(), "fast")
+        self.assertEqual(calls, [1])
+        self.assertLess(delay(), 0.1)
+
+    def test_hedged_latency(self):
+        """a hedged call records its own latency, not the one of the attempt that won"""
+        func, calls = self.slow_first()
+        delay = HedgeDelay(initial=0.05, min_samples=1)
+        self.assertEqual(hedge(after=delay)(func)(1), "fast")
+        self.assertGreaterEqual(delay(), 0.05)
+
+    def test_max_parallel(self):
+        func, calls = self.slow_first()
+        self.release.set()
+        self.assertEqual(hedge(after=0.01, max_parallel=1)(func)(1), "slow")
+        self.assertEqual(calls, [1])
+
+    def test_error(self):
+        """a failed hedge waits for the attempt still running"""
+        func, calls = self.slow_first(fail=True)
+        threading.Timer(0.2, self.release.set).start()
+        self.assertEqual(hedge(after=0.01)(func)(1), "slow")
+        self.assertEqual(len(calls), 2)
+
+    def test_all_errors(self):
+        @hedge(after=0.01)
+        def func():
+            raise KeyError("failed")
+
+        with self.assertRaises(KeyError):
+            func()
+
+    def test_context(self):
+        """the attempts see the context variables of the caller"""
+        var = contextvars.ContextVar("var", default="unset")
+
+        @hedge(after=1)
+        def func():
+            return var.get()
+
+        var.set("set")
+        self.assertEqual(func(), "set")
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            hedge(max_parallel=0)
+
+
+class TestHedgeAsync(unittest.IsolatedAsyncioTestCase):
+    """test for `just.retry.hedge` with coroutine functions"""
+
+    async def test_hedge(self):
+        """the second attempt wins, and the first one is cancelled"""
+        calls = []
+        cancelled = []
+
+        @hedge(after=0.01)
+        async def func():
+            calls.append(1)
+            try:
+                await asyncio.sleep(5 if len(calls) == 1 else 0)
+            except asyncio.CancelledError:
+                cancelled.append(len(calls))
+                raise
+            return len(calls)
+
+        self.assertEqual(await func(), 2)
+        self.assertEqual(cancelled, [2])
+
+    async def test_error(self):
+        @hedge(after=0.01, max_parallel=3)
+        async def func():
+            await asyncio.sleep(0.02)
+            raise KeyError("failed")
+
+        with self.assertRaises(KeyError):
+            await func()
@@ -5,12 +5,41 @@
 
 # standard imports
 import unittest
+import asyncio
+import contextvars
+import gc
 import io
+import json
 import logging
+import math
+import os
+import random
 import sys
+import tempfile
+import threading
+import time
+import tracemalloc
 
 # tested imports
-from just.timing import timed, timing
+from just.timing import (
+    Allocations,
+    BenchResult,
+    Collector,
+    GCPauses,
+    ProcessTime,
+    ResourceUsage,
+    StackSampler,
+    ThreadTime,
+    Trace,
+    TimingStats,
+    bench,
+    compare_bench,
+    read_bench_results,
+    timed,
+    timing,
+    write_bench_results,
+    _t_quantile,
+)
 
 
 class TestTimed(unittest.TestCase):
@@ -20,16 +49,21 @@ class TestTimed(unittest.TestCase):
         self.OUTPUT_REGEX = r"func .*? args .*? kwargs .*? took .*? seconds"
         self.test_logger = logging.getLogger()
 
-    # FIXME `timed` vs `timed()` should work either way
     def test_missing_call(self):
-        """test that using `timed` instead of `timed()` raises TypeError"""
+        """test that using `timed` instead of `timed()` works the same"""
 
         @timed
-        def test():
-            pass
+        def test(x):
+            return x
 
-        with self.assertRaises(TypeError):
-            test()
+        capture = io.StringIO()
+        sys.stdout = capture
+        result = test(42)
+        sys.stdout = sys.__stdout__
+
+        self.assertEqual(result, 42)
+        self.assertEqual(test.__name__, "test")
+        self.assertRegex(capture.getvalue(), self.OUTPUT_REGEX)
 
     def test_print(self):
         """test the stdout output contains the expected format"""
@@ -79,6 +113,99 @@ class TestTimed(unittest.TestCase):
     # FIXME test logger with insufficient level, but assertNoLogs is python 3.10?
 
 
+class TestTimedAsync(unittest.IsolatedAsyncioTestCase):
+    """Tests for just.timing.timed decorator on coroutine and async generator functions"""
+
+    async def test_coroutine(self):
+        """the whole await is timed, not just the creation of the coroutine"""
+
+        @timed(stats=True)
+        async def test(x):
+            await asyncio.sleep(0.02)
+            return x
+
+        self.assertEqual(await test(42), 42)
+        self.assertEqual(test.stats.count, 1)
+        self.assertGreaterEqual(test.stats.total, 0.015)
+
+    async def test_exclude_suspended(self):
+        """time spent suspended is left out, time spent running is not"""
+
+        @timed(stats=True, exclude_suspended=True)
+        async def test():
+            await asyncio.sleep(0.05)
+            time.sleep(0.01)
+
+        await test()
+        self.assertGreaterEqual(test.stats.total, 0.005)
+        self.assertLess(test.stats.total, 0.04)
+
+    async def test_cancelled(self):
+        """cancellation reaches the wrapped coroutine through the active-time wrapper"""
+        cancelled = asyncio.Event()
+
+        @timed(do_print=False, exclude_suspended=True)
+        async def test():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        task = asyncio.create_task(test())
+        await asyncio.sleep(0)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertTrue(cancelled.is_set())
+
+    async def test_async_generator(self):
+        """every item is passed through, and the time between items taken by the consumer is not counted"""
+
+        @timed(stats=True)
+        async def test(n):
+            for i in range(n):
+                await asyncio.sleep(0.001)
+                yield i
+
+        items = []
+        async for item in test(3):
+            items.append(item)
+            await asyncio.sleep(0.05)
+        self.assertEqual(items, [0, 1, 2])
+        self.assertEqual(test.stats.count, 1)
+        self.assertLess(test.stats.total, 0.1)
+
+    async def test_async_generator_asend(self):
+        @timed(do_print=False)
+        async def test():
+            total = 0
+            while True:
+                total += yield total
+
+        generator = test()
+        self.assertEqual(await generator.asend(None), 0)
+        self.assertEqual(await generator.asend(2), 2)
+        self.assertEqual(await generator.asend(3), 5)
+        await generator.aclose()
+
+    async def test_async_generator_print(self):
+        """the output comes once the generator is closed, even early"""
+
+        @timed
+        async def test():
+            yield 1
+            yield 2
+
+        capture = io.StringIO()
+        sys.stdout = capture
+        generator = test()
+        self.assertEqual(await generator.__anext__(), 1)
+        await generator.aclose()
+        sys.stdout = sys.__stdout__
+        self.assertRegex(capture.getvalue(), r"func test args \(\) kwargs {} took .*? seconds")
+
+
 class TestTiming(unittest.TestCase):
     """Tests for just.timing.timing context-manager"""
 
@@ -119,3 +246,468 @@ class TestTiming(unittest.TestCase):
         with self.assertRaises(ValueError):
             with timing("bad_level", logger=self.test_logger, level="BOGUS"):
                 pass
+
+
+class TestTimingStats(unittest.TestCase):
+    """Tests for just.timing.TimingStats"""
+
+    def test_stats(self):
+        """test the count, total, min, max and mean are exact"""
+        stats = TimingStats("test")
+        for seconds in (0.1, 0.3, 0.2):
+            stats.add(seconds)
+        self.assertEqual(stats.count, 3)
+        self.assertAlmostEqual(stats.total, 0.6)
+        self.assertEqual(stats.min, 0.1)
+        self.assertEqual(stats.max, 0.3)
+        self.assertAlmostEqual(stats.mean, 0.2)
+
+    def test_quantiles(self):
+        """test the quantiles are within the precision of the histogram, across batches"""
+        rng = random.Random(0)
+        durations = [rng.lognormvariate(-10, 2) for _ in range(10000)] + [0.0] * 10
+        stats = TimingStats("test")
+        for seconds in durations:
+            stats.add(seconds)
+        durations.sort()
+        for q in (0.5, 0.9, 0.95, 0.99):
+            exact = durations[math.ceil(q * len(durations)) - 1]
+            self.assertAlmostEqual(stats.quantile(q) / exact, 1.0, delta=0.02)
+        self.assertEqual(stats.quantile(0.0), 0.0)
+        self.assertEqual(stats.quantile(1.0), durations[-1])
+        with self.assertRaises(ValueError):
+            stats.quantile(1.5)
+
+    def test_empty(self):
+        stats = TimingStats("test")
+        self.assertEqual(stats.count, 0)
+        self.assertTrue(math.isnan(stats.mean))
+        self.assertTrue(math.isnan(stats.quantile(0.5)))
+        self.assertEqual(stats.summary(), "test: no timings")
+
+    def test_reset(self):
+        stats = TimingStats("test")
+        stats.add(1.0)
+        stats.reset()
+        self.assertEqual(stats.count, 0)
+
+    def test_threads(self):
+        """test no duration is lost when several threads add at once"""
+        stats = TimingStats("test")
+
+        def add():
+            for _ in range(5000):
+                stats.add(0.001)
+
+        threads = [threading.Thread(target=add) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(stats.count, 20000)
+
+    def test_report(self):
+        """test the report goes to the logger"""
+        logger = logging.getLogger()
+        stats = TimingStats("report_test", logger=logger)
+        stats.add(0.002)
+        with self.assertLogs(logger, level=logging.INFO) as watcher:
+            stats.report()
+        self.assertRegex(str(watcher.output), r"report_test: count 1 total .*? p99 2ms max 2ms")
+
+    def test_report_interval(self):
+        """test the periodic reports of the background thread"""
+        logger = logging.getLogger()
+        stats = TimingStats("interval_test", report_interval=0.01, logger=logger)
+        try:
+            with self.assertLogs(logger, level=logging.INFO) as watcher:
+                stats.add(0.001)
+                threading.Event().wait(0.1)
+        finally:
+            stats.close()
+        self.assertRegex(str(watcher.output), r"interval_test: count 1")
+
+    def test_timed(self):
+        """test @timed(stats=...) aggregates durations without any output"""
+
+        @timed(stats=True)
+        def test(x):
+            return x
+
+        capture = io.StringIO()
+        sys.stdout = capture
+        for i in range(10):
+            self.assertEqual(test(i), i)
+        sys.stdout = sys.__stdout__
+        self.assertEqual(capture.getvalue(), "")
+        self.assertEqual(test.stats.count, 10)
+        self.assertTrue(test.stats.name.endswith("test"))
+
+    def test_timing(self):
+        """test timing(stats=...) aggregates the duration without any output"""
+        stats = TimingStats("test")
+        with self.assertNoLogs(level=logging.DEBUG):
+            with timing("stats test", logger=logging.getLogger(), stats=stats):
+                pass
+        self.assertEqual(stats.count, 1)
+
+
+class TestCollectors(unittest.TestCase):
+    """Tests for the collectors of just.timing.timing and just.timing.timed"""
+
+    def test_cpu_time(self):
+        """busy-waiting counts as CPU time, sleeping does not"""
+        with timing("cpu", do_print=False, collectors=[ProcessTime(), ThreadTime()]) as metrics:
+            time.sleep(0.1)
+            end = time.thread_time() + 0.02
+            while time.thread_time() < end:
+                pass
+        self.assertGreaterEqual(metrics["cpu_seconds"], 0.02)
+        self.assertGreaterEqual(metrics["thread_cpu_seconds"], 0.02)
+        self.assertLess(metrics["thread_cpu_seconds"], 0.1)
+
+    def test_allocations(self):
+        was_tracing = tracemalloc.is_tracing()
+        with timing("alloc", do_print=False, collectors=[Allocations()]) as metrics:
+            data = [0] * 100_000
+            del data
+        self.assertGreaterEqual(metrics["alloc_peak_bytes"], 800_000)
+        self.assertLess(metrics["alloc_net_bytes"], 800_000)
+        self.assertEqual(tracemalloc.is_tracing(), was_tracing)
+
+    def test_gc_pauses(self):
+        callbacks = list(gc.callbacks)
+        with timing("gc", do_print=False, collectors=[GCPauses()]) as metrics:
+            gc.collect()
+        self.assertGreaterEqual(metrics["gc_collections"], 1)
+        self.assertGreater(metrics["gc_pause_seconds"], 0)
+        self.assertEqual(gc.callbacks, callbacks)
+
+    @unittest.skipIf(sys.platform == "win32", "resource module not available")
+    def test_resource_usage(self):
+        with timing("rusage", do_print=False, collectors=[ResourceUsage()]) as metrics:
+            pass
+        self.assertIn("rusage_utime_seconds", metrics)
+        self.assertIn("rusage_nvcsw", metrics)
+        self.assertGreaterEqual(metrics["rusage_minflt"], 0)
+
+    def test_abstract(self):
+        """a collector must define both start() and stop()"""
+
+        class StartOnly(Collector):
+            def start(self):
+                return None
+
+        with self.assertRaises(TypeError):
+            StartOnly()
+
+    def test_exception(self):
+        """collectors are stopped even when the context raises"""
+        callbacks = list(gc.callbacks)
+        with self.assertRaises(RuntimeError):
+            with timing("error", do_print=False, collectors=[GCPauses()]):
+                raise RuntimeError()
+        self.assertEqual(gc.callbacks, callbacks)
+
+    def test_output(self):
+        logger = logging.getLogger()
+        with self.assertLogs(logger, level=logging.INFO) as watcher:
+            with timing("output", do_print=False, logger=logger, collectors=[ProcessTime()]):
+                pass
+        self.assertRegex(watcher.output[0], r"output took .*? seconds \(cpu_seconds .*?\)")
+
+    def test_timed(self):
+        @timed(do_print=False, collectors=[ProcessTime()])
+        def test(x):
+            return x
+
+        self.assertEqual(test(42), 42)
+        with self.assertRaises(ValueError):
+
+            @timed(collectors=[ProcessTime()])
+            async def test_async():
+                pass
+
+        with self.assertRaises(ValueError):
+            timed(stats=True, collectors=[ProcessTime()])
+        with self.assertRaises(ValueError):
+            with timing("stats", stats=TimingStats(), collectors=[ProcessTime()]):
+                pass
+
+
+class TestSlowThreshold(unittest.TestCase):
+    """Tests for the sampling of slow just.timing.timing contexts"""
+
+    def setUp(self):
+        self.sampler = StackSampler(interval=0.001)
+
+    def slow_function(self):
+        time.sleep(0.1)
+
+    def test_slow(self):
+        """a slow context outputs the stacks sampled while it ran"""
+        logger = logging.getLogger()
+        with self.assertLogs(logger, level=logging.INFO) as watcher:
+            with timing("slow", do_print=False, logger=logger, slow_threshold=0.05, sampler=self.sampler):
+                self.slow_function()
+        self.assertEqual(len(watcher.output), 2)
+        self.assertRegex(watcher.output[1], r"slow took .*? seconds, slower than 0.050 seconds, \d+ stack samples:")
+        self.assertIn("slow_function (test_timing.py:", watcher.output[1])
+        self.assertEqual(self.sampler._watched, {})
+
+    def test_fast(self):
+        """a fast context outputs nothing more than its duration"""
+        logger = logging.getLogger()
+        with self.assertLogs(logger, level=logging.INFO) as watcher:
+            with timing("fast", do_print=False, logger=logger, slow_threshold=1, sampler=self.sampler):
+                pass
+        self.assertEqual(len(watcher.output), 1)
+        self.assertEqual(self.sampler._watched, {})
+
+    def test_stats(self):
+        """with stats, only the slow executions are output"""
+        stats = TimingStats()
+        capture = io.StringIO()
+        sys.stdout = capture
+        for duration in (0, 0, 0.1):
+            with timing("stats", stats=stats, slow_threshold=0.05, sampler=self.sampler):
+                time.sleep(duration)
+        sys.stdout = sys.__stdout__
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(capture.getvalue().count("slower than"), 1)
+
+    def test_threads(self):
+        """every thread gets only its own stacks"""
+        outputs = {}
+
+        def run(name, function):
+            samples = self.sampler.watch()
+            function()
+            self.sampler.unwatch(samples)
+            outputs[name] = " ".join(samples)
+
+        def sleep_a():
+            time.sleep(0.05)
+
+        def sleep_b():
+            time.sleep(0.05)
+
+        threads = [threading.Thread(target=run, args=("a", sleep_a)), threading.Thread(target=run, args=("b", sleep_b))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIn("sleep_a", outputs["a"])
+        self.assertNotIn("sleep_b", outputs["a"])
+        self.assertIn("sleep_b", outputs["b"])
+        self.assertNotIn("sleep_a", outputs["b"])
+
+    def test_bad_interval(self):
+        with self.assertRaises(ValueError):
+            StackSampler(interval=0)
+        with self.assertRaises(ValueError):
+            with timing("negative", slow_threshold=-1):
+                pass
+
+
+class TestBench(unittest.TestCase):
+    """Tests for just.timing.bench and the comparison of its results"""
+
+    def test_calibration(self):
+        """the number of calls per loop is calibrated, and the warmup loops are not timed"""
+        calls = []
+        result = bench(lambda: calls.append(None), name="append", repeat=3, warmup=2, target_time=0.001)
+        self.assertEqual(result.name, "append")
+        self.assertEqual(len(result.times), 3)
+        self.assertIn(str(result.number)[0], "125")
+        self.assertGreaterEqual(result.number * sum(result.times) / 3, 0.0005)
+        # the calibration loops come before the 2 + 3 timed loops
+        self.assertGreaterEqual(len(calls), 5 * result.number)
+
+    def test_number(self):
+        calls = []
+        result = bench(lambda: calls.append(None), repeat=4, warmup=1, number=10)
+        self.assertEqual(result.number, 10)
+        self.assertEqual(len(calls), 50)
+        self.assertTrue(gc.isenabled())
+
+    def test_statistics(self):
+        result = BenchResult("f", 1, [1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(result.mean, 3.0)
+        self.assertEqual(result.median, 3.0)
+        self.assertEqual(result.min, 1.0)
+        self.assertAlmostEqual(result.stdev, math.sqrt(2.5))
+        low, high = result.confidence_interval()
+        # t(0.975, 4) = 2.776
+        self.assertAlmostEqual(high - 3.0, 2.776 * math.sqrt(2.5) / math.sqrt(5), places=2)
+        self.assertAlmostEqual(3.0 - low, high - 3.0)
+        with self.assertRaises(ValueError):
+            BenchResult("f", 1, [1.0])
+        with self.assertRaises(ValueError):
+            bench(lambda: None, repeat=1)
+
+    def test_t_quantile(self):
+        """exact for 1 and 2 degrees of freedom, close to the tables from 3 on"""
+        for df, t_975, t_995 in ((1, 12.706, 63.657), (2, 4.303, 9.925), (3, 3.182, 5.841), (10, 2.228, 3.169)):
+            with self.subTest(df=df):
+                self.assertAlmostEqual(_t_quantile(0.975, df) / t_975, 1.0, delta=0.01)
+                self.assertAlmostEqual(_t_quantile(0.995, df) / t_995, 1.0, delta=0.01)
+                self.assertEqual(_t_quantile(0.025, df), -_t_quantile(0.975, df))
+        self.assertEqual(_t_quantile(0.5, 1), 0.0)
+        self.assertTrue(_t_quantile(0.975, 2) < _t_quantile(0.975, 1.5) < _t_quantile(0.975, 1))
+
+    def test_save(self):
+        results = [BenchResult("f", 10, [1.0, 2.0]), BenchResult("g", 20, [3.0, 4.0])]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "bench.json")
+            write_bench_results(file_path, results)
+            loaded = read_bench_results(file_path)
+        self.assertEqual(list(loaded), ["f", "g"])
+        self.assertEqual((loaded["g"].number, loaded["g"].times), (20, [3.0, 4.0]))
+
+    def test_compare(self):
+        rng = random.Random(0)
+        baseline = {name: BenchResult(name, 1, [rng.gauss(1.0, 0.01) for _ in range(20)]) for name in "abc"}
+        current = {
+            "a": BenchResult("a", 1, [rng.gauss(1.0, 0.01) for _ in range(20)]),  # same
+            "b": BenchResult("b", 1, [rng.gauss(1.2, 0.01) for _ in range(20)]),  # slower
+            "c": BenchResult("c", 1, [rng.gauss(0.8, 0.01) for _ in range(20)]),  # faster
+            "d": BenchResult("d", 1, [1.0, 1.0]),  # new, not compared
+        }
+        comparisons = {comparison.current.name: comparison for comparison in compare_bench(baseline, current)}
+        self.assertEqual(list(comparisons), ["a", "b", "c"])
+        self.assertFalse(comparisons["a"].significant)
+        self.assertTrue(comparisons["b"].regression)
+        self.assertTrue(comparisons["c"].improvement)
+        self.assertIn("regression", str(comparisons["b"]))
+
+    def test_compare_min_change(self):
+        """a tiny difference is not flagged, however consistent"""
+        baseline = BenchResult("f", 1, [1.000, 1.001, 1.000, 1.001])
+        current = BenchResult("f", 1, [1.010, 1.011, 1.010, 1.011])
+        self.assertFalse(compare_bench({"f": baseline}, {"f": current})[0].significant)
+        self.assertTrue(compare_bench({"f": baseline}, {"f": current}, min_change=0.005)[0].regression)
+
+
+class TestTrace(unittest.TestCase):
+    """Tests for just.timing.Trace, collecting nested timing contexts"""
+
+    def test_nesting(self):
+        """test nested contexts become children, and self time excludes them"""
+        with Trace() as trace:
+            with timing("root", do_print=False):
+                with timing("child", do_print=False):
+                    time.sleep(0.02)
+                with timing("other", do_print=False):
+                    pass
+        (root,) = trace.roots
+        self.assertEqual([child.name for child in root.children], ["child", "other"])
+        self.assertGreaterEqual(root.total, 0.02)
+        self.assertLess(root.self_time, root.children[0].total)
+        self.assertAlmostEqual(root.self_time + sum(c.total for c in root.children), root.total)
+
+    def test_no_trace(self):
+        """test nothing is recorded outside of a trace"""
+        with Trace() as trace:
+            pass
+        with timing("outside", do_print=False):
+            pass
+        self.assertEqual(trace.roots, [])
+
+    def test_exception(self):
+        """test a context that raises is still closed"""
+        with Trace() as trace:
+            with self.assertRaises(RuntimeError):
+                with timing("failing", do_print=False):
+                    raise RuntimeError("failure")
+            with timing("after", do_print=False):
+                pass
+        self.assertEqual([root.name for root in trace.roots], ["failing", "after"])
+        self.assertIsNotNone(trace.roots[0].end)
+
+    def test_threads(self):
+        """test a thread started with a copy of the context nests its spans in the parent span"""
+
+        def work(name):
+            with timing(name, do_print=False):
+                pass
+
+        with Trace() as trace:
+            with timing("parent", do_print=False):
+                threads = [
+                    threading.Thread(target=contextvars.copy_context().run, args=(work, f"thread {i}"))
+                    for i in range(3)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        (root,) = trace.roots
+        self.assertEqual(sorted(child.name for child in root.children), ["thread 0", "thread 1", "thread 2"])
+        self.assertNotEqual(root.children[0].thread_id, root.thread_id)
+
+    def test_asyncio(self):
+        """test concurrent tasks each nest their spans under their own parent"""
+
+        async def task(name):
+            with timing(name, do_print=False):
+                await asyncio.sleep(0.01)
+                with timing(f"{name} inner", do_print=False):
+                    await asyncio.sleep(0.01)
+
+        async def main():
+            with timing("main", do_print=False):
+                await asyncio.gather(task("a"), task("b"))
+
+        with Trace() as trace:
+            asyncio.run(main())
+        paths = sorted(tuple(span.path()) for span in trace.spans())
+        self.assertEqual(
+            paths,
+            [("main",), ("main", "a"), ("main", "a", "a inner"), ("main", "b"), ("main", "b", "b inner")],
+        )
+
+    def test_concurrent_self_time(self):
+        """test concurrent children count once in the self time of their parent, which stays positive"""
+
+        async def task(name):
+            with timing(name, do_print=False):
+                await asyncio.sleep(0.05)
+
+        async def main():
+            with timing("main", do_print=False):
+                await asyncio.gather(*(task(name) for name in "abc"))
+                await asyncio.sleep(0.02)
+
+        with Trace() as trace:
+            asyncio.run(main())
+        (root,) = trace.roots
+        self.assertEqual(len(root.children), 3)
+        self.assertGreater(sum(child.total for child in root.children), root.total)
+        self.assertGreaterEqual(root.self_time, 0.015)
+        self.assertLess(root.self_time, root.total - 0.045)
+        self.assertNotIn("self -", trace.format_tree())
+
+    def test_exports(self):
+        """test the chrome trace-events and folded stacks exports"""
+        with Trace() as trace:
+            with timing("root", do_print=False):
+                with timing("child", do_print=False):
+                    pass
+        self.assertRegex(trace.format_tree(), r"root: total .*\n  child: total ")
+        folded = trace.folded().splitlines()
+        self.assertEqual([line.split()[0] for line in folded], ["root", "root;child"])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            trace_path = os.path.join(temp_dir, "trace.json")
+            trace.write_chrome_trace(trace_path)
+            with open(trace_path) as trace_file:
+                events = json.load(trace_file)["traceEvents"]
+            folded_path = os.path.join(temp_dir, "trace.folded")
+            trace.write_folded(folded_path)
+            with open(folded_path) as folded_file:
+                self.assertEqual(folded_file.read().splitlines(), folded)
+        self.assertEqual([event["name"] for event in events], ["root", "child"])
+        self.assertEqual({event["ph"] for event in events}, {"X"})
+        self.assertEqual(events[0]["ts"], 0.0)
+        self.assertGreaterEqual(events[0]["dur"], events[1]["dur"])